@@ -8,7 +8,7 @@ import torchvision
 from config import Config
 from PIL import Image, ImageDraw
 from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
-from util.image_space import Region, Vertex
+from util.image_space import Region
 
 from . import transforms as T
 from .RaccoonDataset import RaccoonDataset
@@ -26,13 +26,16 @@ def get_transform(train):
 
 
 class GetBoxes():
-    def __init__(self, num_classes, model_file, device, data_folder):
+    def __init__(self, num_classes, model_file, device, data_folder, image_files=None):
         self.num_classes = num_classes
         self.model_file = model_file
         self.device = device
         self.data_folder = data_folder
+        self.image_files = image_files
         self.getModel()
-        self.getData()
+        # The data can be set later with getBoxesForImages if no data is given
+        if data_folder is not None or image_files is not None:
+            self.getData()
 
     def getModel(self):
         # load an object detection model pre-trained on COCO
@@ -45,7 +48,8 @@ class GetBoxes():
         self.model.to(self.device)
 
     def getData(self):
-        self.dataset = RaccoonDataset(root=self.data_folder, data_file=None, transforms=get_transform(train=False))
+        self.dataset = RaccoonDataset(root=self.data_folder, data_file=None,
+                                      transforms=get_transform(train=False), imgs=self.image_files)
         if Config.args.verbose:
             print(f'[SEGMENTATION MODEL]: Built dataset with {len(self.dataset)} files in {self.data_folder}')
 
@@ -71,12 +75,7 @@ class GetBoxes():
                 # Only select boxes the model is confident about
                 if score > 0.8:
                     left, top, right, bottom = int(boxes[0]), int(boxes[1]), int(boxes[2]), int(boxes[3])
-                    box = [
-                        Vertex(left, top),
-                        Vertex(left, bottom),
-                        Vertex(right, bottom),
-                        Vertex(right, top),
-                    ]
+                    box = Region.from_bounds(left, top, right, bottom)
                     self.boxes_dict[name].append(box)
 
                     draw.rectangle([(boxes[0], boxes[1]), (boxes[2], boxes[3])], outline="red", width=3)
@@ -88,6 +87,13 @@ class GetBoxes():
     def retBoxes(self, name):
         return self.boxes_dict[name]
 
+    def getBoxesForImages(self, image_files):
+        # Reuses the loaded model to get the boxes of the given images only
+        self.image_files = image_files
+        self.getData()
+        self.getBoxes()
+        return self.boxes_dict
+
 
 # Example use
 # device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
@@ -96,9 +102,19 @@ class GetBoxes():
 # print(getboxes.boxes_dict)
 
 
-def get_segmented_boxes(model_state_file: str, data_folder: str, image_file: str = None) -> 'list[Region] | defaultdict[str, list[Region]]':
+def get_box_getter(model_state_file: str, data_folder: str = None, image_files: list[str] = None) -> GetBoxes:
     device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
-    box_getter = GetBoxes(2, model_state_file, device, data_folder)
+    box_getter = GetBoxes(2, model_state_file, device, data_folder, image_files=image_files)
+    return box_getter
+
+
+def get_segmented_boxes(
+    model_state_file: str,
+    data_folder: str,
+    image_file: str = None,
+    image_files: list[str] = None,
+) -> 'list[Region] | defaultdict[str, list[Region]]':
+    box_getter = get_box_getter(model_state_file, data_folder, image_files=image_files)
     box_getter.getBoxes()
 
     if image_file is None:
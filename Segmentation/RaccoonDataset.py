@@ -55,10 +55,11 @@ def scantree(path, ignore_folders={'preprocessed'}):
             yield entry
 
 class RaccoonDataset(torch.utils.data.Dataset):
-    def __init__(self, root, data_file, transforms=None):
+    def __init__(self, root, data_file, transforms=None, imgs=None):
         self.root = root
         self.transforms = transforms
-        self.imgs = [
+        # Use the given image paths instead of scanning the root folder if provided
+        self.imgs = list(imgs) if imgs is not None else [
             entry.path for entry in scantree(root)
             if entry.is_file() and has_extension(entry.name, valid_extensions=VALID_IMAGE_FILE_TYPES)
         ]
@@ -59,3 +59,31 @@ class ArgparseConfig:
         parser.add_argument('--save', action='store_true', help='Add a save modifier to the command')
         parser.add_argument('--display', action='store_true', help='Add a display modifier to the command')
         parser.add_argument('--download', action='store_true', help='Download NLTK data')
+        parser.add_argument('--force', action='store_true',
+                            help='Process flyers even if they are unchanged since their last saved output')
+        parser.add_argument('--metrics-out',
+                            help='File path to save a JSON report of the time spent in each pipeline stage')
+        parser.add_argument('--stream', action='store_true',
+                            help='Segment and extract each flyer as soon as its pages are annotated')
+        parser.add_argument('-w', '--workers', type=int, default=1,
+                            help='Number of processes used to perform OCR on the input files')
+        parser.add_argument('--pdf-page-range',
+                            help='Only rasterize the PDF pages in this 0-indexed "START:STOP" range (e.g. "0:20")')
+        parser.add_argument('--pdf-zoom',
+                            help='Zoom of rasterized PDF pages (default 0.5), or "auto" to pick the zoom of each page '
+                                 'from --pdf-pixel-budget and --pdf-min-text-height')
+        parser.add_argument('--pdf-pixel-budget', type=int, default=4_000_000,
+                            help='Maximum number of pixels in a PDF page rasterized with --pdf-zoom auto')
+        parser.add_argument('--pdf-min-text-height', type=float, default=16,
+                            help='Height in pixels to rasterize the small text of PDF pages at with --pdf-zoom auto')
+        parser.add_argument('--annotation-level', choices=['block', 'para', 'word', 'symbol'], default='symbol',
+                            help='Deepest level of the annotation tree to load for each page (default symbol). Flyer '
+                                 'extraction only needs blocks, but UNKNOWN components then omit their sub-block text')
+        parser.add_argument('--ocr-max-in-flight', type=int, default=8,
+                            help='Maximum number of concurrent OCR requests made for missing annotations')
+        parser.add_argument('--ocr-requests-per-minute', type=float, default=1800,
+                            help='Maximum number of OCR requests made per minute')
+        parser.add_argument('--ocr-batch-size', type=int, default=1,
+                            help='Number of images sent in each OCR request for missing annotations (max 16)')
+        parser.add_argument('--skip-preprocessed-save', action='store_true',
+                            help='Send preprocessed images for OCR without saving them to the preprocessed folder')
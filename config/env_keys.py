@@ -1,2 +1,10 @@
 GOOGLE_CLOUD_PKEY_PATH = 'GOOGLE_CLOUD_PKEY_PATH'
 OCR_OUTPUT_PATH = 'OCR_OUTPUT_PATH'
+ANNOTATION_CACHE_PATH = 'ANNOTATION_CACHE_PATH'
+ANNOTATION_CACHE_MAX_MB = 'ANNOTATION_CACHE_MAX_MB'
+ANNOTATION_STORE = 'ANNOTATION_STORE'
+PAGE_DEDUPE_PATH = 'PAGE_DEDUPE_PATH'
+PAGE_DEDUPE_MAX_DISTANCE = 'PAGE_DEDUPE_MAX_DISTANCE'
+PAGE_DEDUPE_MAX_PIXEL_DIFFERENCE = 'PAGE_DEDUPE_MAX_PIXEL_DIFFERENCE'
+PREPROCESS_CACHE_PATH = 'PREPROCESS_CACHE_PATH'
+PREPROCESS_CACHE_MAX_MB = 'PREPROCESS_CACHE_MAX_MB'
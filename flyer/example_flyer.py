@@ -1,4 +1,4 @@
-from util.image_space import Vertex
+from util.image_space import Region, Vertex
 
 from .flyer_components import (AdBlock, Flyer, FlyerType, Page,
                                PageType, Product, Promotion, PromotionType,
@@ -20,12 +20,12 @@ EXAMPLE_FLYER = Flyer(
                             amount=4
                         )
                     ),
-                    bounds=[
+                    bounds=Region([
                         Vertex(0, 0),
                         Vertex(0, 100),
                         Vertex(100, 100),
                         Vertex(100, 0),
-                    ]
+                    ])
                 ),
                 AdBlock(
                     product=Product(
@@ -42,7 +42,7 @@ EXAMPLE_FLYER = Flyer(
                         amount=15,
                         promotion_text="15% OFF!",
                     ),
-                    bounds=[]
+                    bounds=Region()
                 ),
                 AdBlock(
                     product=Product(
@@ -59,7 +59,7 @@ EXAMPLE_FLYER = Flyer(
                         amount=50,
                         promotion_text='Buy one get one 50% off!'
                     ),
-                    bounds=[]
+                    bounds=Region()
                 ),
                 AdBlock(
                     product=Product(
@@ -71,7 +71,7 @@ EXAMPLE_FLYER = Flyer(
                             amount=4.3
                         )
                     ),
-                    bounds=[]
+                    bounds=Region()
                 ),
             ]
         )
@@ -82,7 +82,7 @@ class Product:
 class AdBlock:
     product: Product = field(default_factory=Product)
     promotion: Promotion = None
-    bounds: Region = field(default_factory=list)
+    bounds: Region = field(default_factory=Region)
     additional_data: str = None
 
 
@@ -2,6 +2,7 @@ import json
 from dataclasses import asdict
 
 from util.file_path_util import apply_default_file_ext
+from util.image_space import Region
 
 from .flyer_components import Flyer
 
@@ -19,4 +20,12 @@ def marshal_flyer(flyer: Flyer, file_path: str):
 
     with open(file_path, 'w') as json_file:
         flyer_as_dict = asdict(flyer)
-        json.dump(flyer_as_dict, json_file, indent=2)
+        json.dump(flyer_as_dict, json_file, indent=2, default=_to_json)
+
+
+def _to_json(value):
+    # Regions are saved as lists of vertices
+    if isinstance(value, Region):
+        return value.to_json()
+
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
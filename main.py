@@ -2,19 +2,55 @@ import os
 import os.path
 import re
 from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from itertools import groupby
+from typing import Callable, Iterable, Iterator
 
+import cv2
+import numpy as np
 from config import Config
-from ocr.annotation_types import HierarchicalAnnotation
-from ocr.get_annotations import get_text_annotations
+from config.env_keys import (ANNOTATION_CACHE_MAX_MB, ANNOTATION_CACHE_PATH,
+                             PAGE_DEDUPE_MAX_DISTANCE,
+                             PAGE_DEDUPE_MAX_PIXEL_DIFFERENCE,
+                             PAGE_DEDUPE_PATH, PREPROCESS_CACHE_MAX_MB,
+                             PREPROCESS_CACHE_PATH)
+from flyer.flyer_components import Flyer
+from ocr.annotation_archive import close_annotation_archives
+from ocr.annotation_cache import AnnotationCache
+from ocr.annotation_types import AnnotationLevel, HierarchicalAnnotation
+from ocr.get_annotations import (delete_text_annotations, get_text_annotations,
+                                 has_text_annotations,
+                                 read_text_annotation_json,
+                                 request_text_annotation_files,
+                                 write_text_annotation_json)
 from ocr.ocr_main import draw_flyer_ad_blocks, save_flyer
 from ocr.process_annotations import process_segmented_flyer_annotations
-from pipeline.convert_pdf import convert_pdf_to_image
-from pipeline.flyer_preprocess import PreprocessType, preprocess_image_file
-from Segmentation.GetBoxes import get_segmented_boxes
-from util.constants import VALID_IMAGE_FILE_TYPES
+from pipeline.convert_pdf import (DEFAULT_PDF_ZOOM, AdaptiveZoom,
+                                  get_page_numbers, get_pdf_page_count,
+                                  get_pdf_page_image_path,
+                                  is_pdf_page_scale_current, parse_page_range,
+                                  parse_pdf_zoom, render_pdf_pages,
+                                  save_pdf_page_scales, split_into_chunks)
+from pipeline.flyer_preprocess import (PreprocessType, decode_image,
+                                       get_preprocess_parameters,
+                                       preprocess_image_content)
+from pipeline.page_dedupe import PageHashIndex
+from pipeline.preprocess_cache import PreprocessCache
+from pipeline.run_manifest import (MANIFEST_ENV_KEYS, build_run_manifest,
+                                   hash_model_file, is_run_manifest_unchanged,
+                                   load_run_manifest, save_run_manifest)
+from pipeline.work_items import (ImagePageWorkItem, PdfPageWorkItem,
+                                 estimate_work_item_count, get_source_pdf_path,
+                                 iter_work_items)
+from Segmentation.GetBoxes import get_box_getter, get_segmented_boxes
+from util.content_cache import ContentAddressedCache
 from util.file_path_util import (apply_default_file_ext,
-                                 get_last_folder_in_path, has_extension)
+                                 create_directories_to_file,
+                                 get_last_folder_in_path, get_path_directory)
 from util.image_space import Region
+from util.metrics import PAGES_COUNTER, call_with_metrics, pipeline_metrics
 
 """
 If you haven't yet, run the program with the `--download` flag to download
@@ -28,23 +64,438 @@ python main.py -r -v -sm Segmentation/models/my_model -cm classificaton/model/pa
 """
 
 
-def get_preprocessed_image(image_path: str, preprocess_folder_name: str, preprocess_type: PreprocessType = PreprocessType.BILATERAL) -> str:
+def create_annotation_cache() -> 'AnnotationCache | None':
     """
-    Takes in a directory or file path and preprocesses the given image, or all
-    of the images in the directory.
+    Creates the annotation cache configured by the ANNOTATION_CACHE_PATH and
+    ANNOTATION_CACHE_MAX_MB environment variables. Returns None if no cache
+    path is configured.
+    """
+    if ANNOTATION_CACHE_PATH not in Config.env or not Config.env.ANNOTATION_CACHE_PATH:
+        return None
+
+    max_size_bytes = None
+    if ANNOTATION_CACHE_MAX_MB in Config.env and Config.env.ANNOTATION_CACHE_MAX_MB:
+        max_size_bytes = int(float(Config.env.ANNOTATION_CACHE_MAX_MB) * 1024 * 1024)
+
+    return AnnotationCache(Config.env.ANNOTATION_CACHE_PATH, max_size_bytes=max_size_bytes)
+
+
+annotation_cache = create_annotation_cache()
+
+
+def create_page_hash_index() -> 'PageHashIndex | None':
+    """
+    Creates the page hash index configured by the PAGE_DEDUPE_PATH,
+    PAGE_DEDUPE_MAX_DISTANCE and PAGE_DEDUPE_MAX_PIXEL_DIFFERENCE environment
+    variables. Returns None if no dedupe path is configured.
+    """
+    if PAGE_DEDUPE_PATH not in Config.env or not Config.env.PAGE_DEDUPE_PATH:
+        return None
+
+    index_options = {}
+    if PAGE_DEDUPE_MAX_DISTANCE in Config.env and Config.env.PAGE_DEDUPE_MAX_DISTANCE:
+        index_options['max_distance'] = int(Config.env.PAGE_DEDUPE_MAX_DISTANCE)
+
+    if PAGE_DEDUPE_MAX_PIXEL_DIFFERENCE in Config.env and Config.env.PAGE_DEDUPE_MAX_PIXEL_DIFFERENCE:
+        index_options['max_pixel_difference'] = int(Config.env.PAGE_DEDUPE_MAX_PIXEL_DIFFERENCE)
+
+    return PageHashIndex(Config.env.PAGE_DEDUPE_PATH, **index_options)
+
+
+page_hash_index = create_page_hash_index()
+
+
+def create_preprocess_cache() -> 'PreprocessCache | None':
+    """
+    Creates the preprocess cache configured by the PREPROCESS_CACHE_PATH and
+    PREPROCESS_CACHE_MAX_MB environment variables. Returns None if no cache
+    path is configured.
+    """
+    if PREPROCESS_CACHE_PATH not in Config.env or not Config.env.PREPROCESS_CACHE_PATH:
+        return None
+
+    max_size_bytes = None
+    if PREPROCESS_CACHE_MAX_MB in Config.env and Config.env.PREPROCESS_CACHE_MAX_MB:
+        max_size_bytes = int(float(Config.env.PREPROCESS_CACHE_MAX_MB) * 1024 * 1024)
+
+    return PreprocessCache(Config.env.PREPROCESS_CACHE_PATH, max_size_bytes=max_size_bytes)
+
+
+preprocess_cache = create_preprocess_cache()
+
+
+def get_caches() -> dict[str, ContentAddressedCache]:
+    """
+    Gets the enabled content-addressed caches by name.
+    """
+    caches = {'annotation': annotation_cache, 'preprocess': preprocess_cache}
+    return {cache_name: cache for cache_name, cache in caches.items() if cache is not None}
+
+
+def save_caches() -> None:
+    """
+    Writes the access times of the cache entries hit during the run to the
+    cache indexes, and prints the hit and miss counters of the annotation and
+    preprocess caches if verbose.
+    """
+    for cache in get_caches().values():
+        cache.save_index()
+
+    if not Config.args.verbose:
+        return
+
+    if annotation_cache is not None:
+        print(f'[ANNOTATION CACHE] {annotation_cache.get_stats()}')
+
+    if preprocess_cache is not None:
+        print(f'[PREPROCESS CACHE] {preprocess_cache.get_stats()}')
+
+
+def call_with_worker_stats(function: Callable, *args, **kwargs) -> tuple[object, dict, dict[str, dict]]:
+    """
+    Calls the function in a pool process, returning its result along with
+    the metrics snapshot (see call_with_metrics) and the activity of each
+    cache recorded during the call. The stats are merged into this process
+    with merge_worker_stats.
+    """
+    for cache in get_caches().values():
+        cache.reset_activity()
+
+    result, worker_metrics = call_with_metrics(function, *args, **kwargs)
+    cache_activities = {cache_name: cache.get_activity() for cache_name, cache in get_caches().items()}
+
+    return result, worker_metrics, cache_activities
+
+
+def merge_worker_stats(worker_metrics: dict, cache_activities: dict[str, dict]) -> None:
+    """
+    Merges the metrics and cache activity returned by call_with_worker_stats
+    into the metrics and caches of this process.
+    """
+    pipeline_metrics.merge(worker_metrics)
+
+    caches = get_caches()
+    for cache_name, cache_activity in cache_activities.items():
+        caches[cache_name].merge_activity(cache_activity)
+
 
-    Returns the new path to the preprocessed file/directory.
+def get_preprocessed_image_path(image_path: str, preprocess_folder_name: str, preprocess_type: PreprocessType = PreprocessType.BILATERAL) -> str:
+    """
+    Gets the path that the preprocessed version of the image is saved to.
     """
     input_path_directory, input_file_name = os.path.split(image_path)
     input_file_name = f'{preprocess_type.value}_{input_file_name}'
     preprocessed_file_path = os.path.join(input_path_directory, preprocess_folder_name, input_file_name)
 
-    if not os.path.exists(preprocessed_file_path):
-        preprocess_image_file(image_path, output_path=preprocessed_file_path, preprocess_type=PreprocessType.BILATERAL)
+    return preprocessed_file_path
+
+
+def preprocess_with_cache(
+    image_path: str,
+    preprocess_type: PreprocessType = PreprocessType.BILATERAL,
+    image: 'np.ndarray | None' = None,
+) -> tuple[bytes, bool]:
+    """
+    Preprocesses the image into an encoded image in memory. If the preprocess
+    cache is enabled, the image is taken from the cache when the same image
+    content was preprocessed with the same type and filter parameters before,
+    and is added to the cache otherwise. If the image has already been
+    decoded, it can be passed in as image to avoid decoding it again.
+
+    Returns:
+        tuple[bytes, bool]: The encoded preprocessed image and whether it was taken from the cache
+    """
+    if preprocess_cache is None:
+        with pipeline_metrics.stage('preprocess'):
+            return preprocess_image_content(image_path, preprocess_type, image=image), False
+
+    with open(image_path, 'rb') as image_file:
+        image_content = image_file.read()
+
+    preprocess_parameters = get_preprocess_parameters(preprocess_type)
+    cache_key = preprocess_cache.get_preprocess_key(image_content, os.path.splitext(image_path)[1],
+                                                    preprocess_type, preprocess_parameters)
+
+    cached_image_content = preprocess_cache.get_preprocessed_content(cache_key)
+    if cached_image_content is not None:
+        return cached_image_content, True
+
+    with pipeline_metrics.stage('preprocess'):
+        if image is None:
+            image = decode_image(image_content)
+
+        preprocessed_image_content = preprocess_image_content(image_path, preprocess_type, image=image,
+                                                              parameters=preprocess_parameters)
+
+    preprocess_cache.store_preprocessed_content(cache_key, preprocessed_image_content, image_path,
+                                                preprocess_type, preprocess_parameters)
+
+    return preprocessed_image_content, False
+
+
+def get_preprocessed_image(
+    image_path: str,
+    preprocess_folder_name: str,
+    preprocess_type: PreprocessType = PreprocessType.BILATERAL,
+    image: 'np.ndarray | None' = None,
+) -> str:
+    """
+    Preprocesses the image with the given preprocess type and saves it to the
+    preprocessed folder. If the image has already been decoded, it can be
+    passed in as image to avoid reading the image file again.
+
+    Without the preprocess cache, an image already in the preprocessed folder
+    is kept unless it is older than the image. With it, the saved image is
+    replaced if it was not made from the current image content, type and
+    filter parameters.
+
+    Returns the path to the preprocessed file.
+    """
+    preprocessed_file_path = get_preprocessed_image_path(image_path, preprocess_folder_name, preprocess_type)
+
+    if preprocess_cache is None and not is_file_outdated(preprocessed_file_path, image_path):
+        return preprocessed_file_path
+
+    preprocessed_image_content, is_cached = preprocess_with_cache(image_path, preprocess_type, image=image)
+
+    # The saved image may have been made with other filter parameters, even when this image was cached
+    if not is_cached or not has_file_content(preprocessed_file_path, preprocessed_image_content):
+        _write_file_atomic(preprocessed_file_path, preprocessed_image_content)
 
     return preprocessed_file_path
 
 
+# Preprocessed images are saved by a writer thread of each process, off the OCR path
+_preprocessed_image_writers: dict[int, ThreadPoolExecutor] = {}
+_preprocessed_image_writes: defaultdict[int, list[Future]] = defaultdict(list)
+
+
+def _write_file_atomic(file_path: str, content: bytes) -> None:
+    """
+    Writes the file through a temporary file, so a partially written file is
+    never seen at the file path.
+    """
+    create_directories_to_file(file_path)
+
+    temporary_path = f'{file_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as temporary_file:
+        temporary_file.write(content)
+    os.replace(temporary_path, file_path)
+
+
+def has_file_content(file_path: str, content: bytes) -> bool:
+    """
+    Checks if the file exists and contains exactly the given content. The
+    file is only read if its size matches.
+    """
+    if not os.path.isfile(file_path) or os.path.getsize(file_path) != len(content):
+        return False
+
+    with open(file_path, 'rb') as saved_file:
+        return saved_file.read() == content
+
+
+def save_preprocessed_image_async(preprocessed_file_path: str, preprocessed_image_content: bytes) -> None:
+    """
+    Saves the preprocessed image in the background. The writer is created per
+    process, since the writer thread of a parent process does not exist in
+    its forked workers.
+    """
+    process_id = os.getpid()
+    if process_id not in _preprocessed_image_writers:
+        _preprocessed_image_writers[process_id] = ThreadPoolExecutor(max_workers=1)
+
+    write = _preprocessed_image_writers[process_id].submit(_write_file_atomic, preprocessed_file_path,
+                                                           preprocessed_image_content)
+    _preprocessed_image_writes[process_id].append(write)
+
+
+def wait_for_preprocessed_image_writes() -> None:
+    """
+    Waits for the preprocessed images being saved by this process, raising
+    the error of any write that failed.
+    """
+    for write in _preprocessed_image_writes.pop(os.getpid(), []):
+        write.result()
+
+
+def get_preprocessed_image_content(
+    image_path: str,
+    preprocess_folder_name: str,
+    preprocess_type: PreprocessType = PreprocessType.BILATERAL,
+) -> bytes:
+    """
+    Gets the encoded preprocessed image. Without the preprocess cache, it is
+    read from the preprocessed folder if it was saved after the image was
+    last modified. Otherwise the image is preprocessed in memory or taken
+    from the preprocess cache (see preprocess_with_cache), and saved to the
+    preprocessed folder in the background unless the --skip-preprocessed-save
+    flag is given.
+    """
+    preprocessed_file_path = get_preprocessed_image_path(image_path, preprocess_folder_name, preprocess_type)
+
+    if preprocess_cache is None and not is_file_outdated(preprocessed_file_path, image_path):
+        with open(preprocessed_file_path, 'rb') as preprocessed_file:
+            return preprocessed_file.read()
+
+    preprocessed_image_content, is_cached = preprocess_with_cache(image_path, preprocess_type)
+
+    is_saved = is_cached and has_file_content(preprocessed_file_path, preprocessed_image_content)
+    if not is_saved and not Config.args.skip_preprocessed_save:
+        save_preprocessed_image_async(preprocessed_file_path, preprocessed_image_content)
+
+    return preprocessed_image_content
+
+
+def get_annotation_image_content(input_file: str, preprocess: bool, preprocess_folder_name: str) -> bytes:
+    """
+    Gets the encoded image that is sent for OCR of the input file, which is
+    the preprocessed image if preprocess is True.
+    """
+    if preprocess:
+        return get_preprocessed_image_content(input_file, preprocess_folder_name)
+
+    with open(input_file, 'rb') as image_file:
+        return image_file.read()
+
+
+def get_pdf_zoom() -> 'float | AdaptiveZoom':
+    """
+    Gets the zoom that PDF pages are rendered with, configured by the
+    --pdf-zoom, --pdf-pixel-budget and --pdf-min-text-height arguments.
+    """
+    return parse_pdf_zoom(Config.args.pdf_zoom, pixel_budget=Config.args.pdf_pixel_budget,
+                          min_text_height=Config.args.pdf_min_text_height)
+
+
+def rasterize_pdf(
+    pdf_path: str,
+    preprocess_folder_name: str = None,
+    workers: int = 1,
+    page_numbers: list[int] = None,
+    zoom: 'float | AdaptiveZoom' = DEFAULT_PDF_ZOOM,
+    annotation_folder_name: str = None,
+) -> list[str]:
+    """
+    Renders the pages of a PDF into images next to the PDF. Each page is kept
+    in memory after rendering so it can be preprocessed without decoding the
+    page image again. Pages whose image (and preprocessed image, if
+    preprocess_folder_name is given) already exist and were rendered with the
+    same zoom are not rendered. The zoom of each rendered page is recorded
+    next to the PDF (see get_pdf_page_scale), and the annotations of each
+    page image written are invalidated if annotation_folder_name is given.
+
+    If workers is greater than 1, the pages are rendered across a pool of
+    processes. Only the given page numbers are rasterized if they are given.
+
+    Returns the list of page image paths.
+    """
+    if page_numbers is None:
+        page_numbers = get_page_numbers(get_pdf_page_count(pdf_path))
+
+    page_image_paths = [get_pdf_page_image_path(pdf_path, page_number) for page_number in page_numbers]
+
+    missing_page_numbers = [
+        page_number for page_number, page_image_path in zip(page_numbers, page_image_paths)
+        if is_page_image_outdated(page_image_path, pdf_path, preprocess_folder_name, zoom)
+    ]
+
+    if workers > 1 and len(missing_page_numbers) > 1:
+        page_number_chunks = split_into_chunks(missing_page_numbers, workers)
+        rasterize_chunk = partial(call_with_worker_stats, _rasterize_pdf_pages, pdf_path,
+                                  preprocess_folder_name=preprocess_folder_name, zoom=zoom)
+
+        page_scales: dict[str, float] = {}
+        with ProcessPoolExecutor(max_workers=len(page_number_chunks)) as executor:
+            for chunk_page_scales, chunk_metrics, chunk_cache_activities in executor.map(rasterize_chunk, page_number_chunks):
+                page_scales.update(chunk_page_scales)
+                merge_worker_stats(chunk_metrics, chunk_cache_activities)
+    else:
+        page_scales = _rasterize_pdf_pages(pdf_path, missing_page_numbers, preprocess_folder_name, zoom=zoom)
+
+    save_pdf_page_scales(pdf_path, page_scales, zoom)
+    invalidate_page_annotations(list(page_scales), annotation_folder_name)
+
+    return page_image_paths
+
+
+def invalidate_page_annotations(page_image_paths: list[str], annotation_folder_name: 'str | None') -> None:
+    """
+    Deletes the saved annotations of page images that were rendered again,
+    since the annotations are in the pixel coordinates of the previous
+    render, and forgets the pages' data in the page hash index.
+    """
+    if annotation_folder_name is None or not page_image_paths:
+        return
+
+    for page_image_path in page_image_paths:
+        delete_text_annotations(get_annotation_file_path(page_image_path, annotation_folder_name))
+
+        if page_hash_index is not None:
+            page_hash_index.invalidate_page(page_image_path)
+
+    if page_hash_index is not None:
+        page_hash_index.save()
+
+
+def is_page_image_outdated(
+    page_image_path: str,
+    pdf_path: str,
+    preprocess_folder_name: str = None,
+    zoom: 'float | AdaptiveZoom' = DEFAULT_PDF_ZOOM,
+) -> bool:
+    """
+    Checks if the page image, or its preprocessed image if
+    preprocess_folder_name is given, has not been created yet or is older
+    than the file it was made from. A page image rendered with a different
+    zoom is also outdated.
+    """
+    if is_file_outdated(page_image_path, pdf_path) or not is_pdf_page_scale_current(pdf_path, page_image_path, zoom):
+        return True
+
+    return preprocess_folder_name is not None and is_file_outdated(
+        get_preprocessed_image_path(page_image_path, preprocess_folder_name), page_image_path)
+
+
+def is_file_outdated(file_path: str, source_file_path: str) -> bool:
+    """
+    Checks if the file does not exist or was last modified before the file it
+    was made from.
+    """
+    if not os.path.isfile(file_path):
+        return True
+
+    return os.path.getmtime(file_path) < os.path.getmtime(source_file_path)
+
+
+def _rasterize_pdf_pages(
+    pdf_path: str,
+    page_numbers: list[int],
+    preprocess_folder_name: str = None,
+    zoom: 'float | AdaptiveZoom' = DEFAULT_PDF_ZOOM,
+) -> dict[str, float]:
+    """
+    Renders the given pages of a PDF, writing each outdated page image and
+    its preprocessed image if preprocess_folder_name is given.
+
+    Returns the zoom of each page image written, by page image path.
+    """
+    page_scales: dict[str, float] = {}
+
+    for page_number, page_image, page_zoom in render_pdf_pages(pdf_path, zoom=zoom, page_numbers=page_numbers):
+        page_image_path = get_pdf_page_image_path(pdf_path, page_number)
+
+        # The page image is still needed on disk for segmentation
+        if is_file_outdated(page_image_path, pdf_path) or not is_pdf_page_scale_current(pdf_path, page_image_path, zoom):
+            cv2.imwrite(page_image_path, page_image)
+            page_scales[page_image_path] = page_zoom
+
+        if preprocess_folder_name is not None:
+            get_preprocessed_image(page_image_path, preprocess_folder_name, image=page_image)
+
+    return page_scales
+
+
 def get_annotation_file_path(input_file_path: str, annotation_folder_name: str) -> 'str':
     """
     Takes in an image file path and outputs the file path of the corresponding
@@ -57,6 +508,18 @@ def get_annotation_file_path(input_file_path: str, annotation_folder_name: str)
     return annotation_file_path
 
 
+def get_annotation_cache_key(annotation_image_content: bytes, preprocess: bool) -> 'str | None':
+    """
+    Gets the annotation cache key of the encoded image sent for OCR, or None
+    if the annotation cache is disabled.
+    """
+    if annotation_cache is None:
+        return None
+
+    preprocess_name = PreprocessType.BILATERAL.value if preprocess else 'none'
+    return annotation_cache.get_content_annotation_key(annotation_image_content, preprocess_name)
+
+
 def perform_ocr_on_file(
     input_file: str,
     annotation_folder_name: str,
@@ -65,66 +528,242 @@ def perform_ocr_on_file(
 ) -> list[HierarchicalAnnotation]:
     """
     Retrieves annotations of an input image. Will make requests if annotation
-    is not found and the request_ocr flag is enabled.
+    is not found and the request_ocr flag is enabled. The image is only
+    preprocessed if the annotation is missing, and is sent for OCR from
+    memory.
 
     Returns a tuple of the input file name and the annotations
     """
     annotation_file_path = get_annotation_file_path(input_file, annotation_folder_name)
 
-    annotation_image_path = input_file
-    if preprocess:
-        preprocessed_image_file_path = get_preprocessed_image(input_file, preprocess_folder_name)
-        annotation_image_path = preprocessed_image_file_path
-
-    annotations = get_text_annotations(
-        annotation_json_path=annotation_file_path,
-        file_image_path=annotation_image_path,
-        request_as_fallback=Config.args.request_ocr,
-        save_file_path=annotation_file_path,
-        hierarchical=True,
-        use_default_directory=False,
-    )
+    # Restore missing annotations from the cache before falling back to a request
+    annotation_image_content = None
+    cache_key_to_store = None
+    if not has_text_annotations(annotation_file_path):
+        annotation_image_content = get_annotation_image_content(input_file, preprocess, preprocess_folder_name)
+
+        cache_key = get_annotation_cache_key(annotation_image_content, preprocess)
+        if cache_key is not None and not annotation_cache.restore_annotation(cache_key, annotation_file_path):
+            cache_key_to_store = cache_key
+
+    with pipeline_metrics.stage('annotation_load'):
+        annotations = get_text_annotations(
+            annotation_json_path=annotation_file_path,
+            file_image_path=input_file,
+            request_as_fallback=Config.args.request_ocr,
+            save_file_path=annotation_file_path,
+            hierarchical=True,
+            use_default_directory=False,
+            max_level=AnnotationLevel[Config.args.annotation_level.upper()],
+            image_content=annotation_image_content,
+        )
+
+    if cache_key_to_store is not None:
+        annotation_cache.store_annotation(cache_key_to_store, annotation_file_path)
+
+    wait_for_preprocessed_image_writes()
+
+    # Pool processes outlive the flyer, so they do not keep its archive open
+    close_annotation_archives(os.path.dirname(annotation_file_path))
 
     return annotations
 
 
-def get_files_to_process_from_dir(directory: str, preprocess_folder_name: str) -> list[str]:
+def reuse_duplicate_page_annotations(files_to_process: list[str], annotation_folder_name: str) -> None:
     """
-    Gets a list of file paths to process from the given directory.
-    Ignores the preprocess folder.
+    Indexes the page hash of every file, and gives each file without an
+    annotation the annotation of a near-identical page that has one. Each
+    reused annotation is logged to the dedupe audit log.
     """
-    files_to_process: list[str] = []
+    if page_hash_index is None:
+        return
+
+    with pipeline_metrics.stage('page_dedupe'):
+        for file_to_process in files_to_process:
+            annotation_file_path = get_annotation_file_path(file_to_process, annotation_folder_name)
+
+            if has_text_annotations(annotation_file_path):
+                page_hash_index.add_annotated_page(file_to_process, annotation_file_path)
+                continue
+
+            duplicate = page_hash_index.find_annotated_duplicate(file_to_process)
+            if duplicate is None:
+                continue
+
+            duplicate_path, duplicate_annotation_path, distance = duplicate
+            if not has_text_annotations(duplicate_annotation_path):
+                continue
+
+            write_text_annotation_json(annotation_file_path, read_text_annotation_json(duplicate_annotation_path))
+            page_hash_index.add_annotated_page(file_to_process, annotation_file_path)
+            page_hash_index.log_reuse('annotation', file_to_process, duplicate_path, distance)
+            pipeline_metrics.increment('pages_deduplicated')
+
+            if Config.args.verbose:
+                print(f'[DEDUPE] Reusing the annotation of "{duplicate_path}" for "{file_to_process}" (distance {distance}).')
+
+        page_hash_index.save()
+
+
+def request_missing_annotations(
+    files_to_process: list[str],
+    annotation_folder_name: str,
+    preprocess: bool = True,
+    preprocess_folder_name: str = None,
+    max_in_flight: int = 1,
+    batch_size: int = 1,
+) -> None:
+    """
+    Requests OCR concurrently for every file that does not have an
+    annotation file yet, saving each response as the annotation file.
+    Files are sent in batches of up to batch_size images per request.
 
-    last_directory = get_last_folder_in_path(directory)
-    if last_directory == preprocess_folder_name:
-        return files_to_process
+    A file identical to a file being requested is given the requested
+    annotation, as is a near-identical file when page dedupe is enabled.
+    The images are preprocessed and sent from memory.
+    """
+    image_contents_to_request: list[bytes] = []
+    annotation_paths_to_save: list[str] = []
+    cache_keys_to_store: list['str | None'] = []
+    files_to_request: list[str] = []
+    duplicate_annotation_paths: list[tuple[str, str]] = []
 
-    # If input path is directorty
-    for entry in os.scandir(directory):
-        if entry.is_dir():
-            subdirectory_files = get_files_to_process_from_dir(entry.path, preprocess_folder_name)
-            files_to_process.extend(subdirectory_files)
+    for file_to_process in files_to_process:
+        annotation_file_path = get_annotation_file_path(file_to_process, annotation_folder_name)
+        if has_text_annotations(annotation_file_path):
             continue
 
-        if not entry.is_file():
+        annotation_image_content = get_annotation_image_content(file_to_process, preprocess, preprocess_folder_name)
+
+        cache_key = get_annotation_cache_key(annotation_image_content, preprocess)
+        if cache_key is not None and annotation_cache.restore_annotation(cache_key, annotation_file_path):
             continue
 
-        if has_extension(entry.name, valid_extensions={'.pdf'}):
-            pdf_image_paths = convert_pdf_to_image(entry.path)
-            files_to_process.extend(pdf_image_paths)
+        # Identical images in this run are only requested once
+        if cache_key is not None and cache_key in cache_keys_to_store:
+            requested_annotation_path = annotation_paths_to_save[cache_keys_to_store.index(cache_key)]
+            duplicate_annotation_paths.append((requested_annotation_path, annotation_file_path))
+            continue
+
+        if page_hash_index is not None:
+            # Near-identical pages in this run are only requested once
+            duplicate = page_hash_index.find_duplicate_page(file_to_process, files_to_request)
+            if duplicate is not None:
+                duplicate_idx, distance = duplicate
+                duplicate_annotation_paths.append((annotation_paths_to_save[duplicate_idx], annotation_file_path))
+
+                page_hash_index.log_reuse('annotation', file_to_process, files_to_request[duplicate_idx], distance)
+                pipeline_metrics.increment('pages_deduplicated')
+                continue
+
+        image_contents_to_request.append(annotation_image_content)
+        annotation_paths_to_save.append(annotation_file_path)
+        cache_keys_to_store.append(cache_key)
+        files_to_request.append(file_to_process)
+
+    if not image_contents_to_request:
+        wait_for_preprocessed_image_writes()
+        return
+
+    if Config.args.verbose:
+        print(f'[OCR] Requesting annotations for {len(image_contents_to_request)} files.')
+
+    failed_requests = request_text_annotation_files(files_to_request, annotation_paths_to_save,
+                                                    use_default_directory=False, max_in_flight=max_in_flight,
+                                                    batch_size=batch_size, image_contents=image_contents_to_request)
+
+    # Failed files are left without an annotation, to be requested again when they are processed
+    requested_annotation_paths = {
+        annotation_file_path for request_idx, annotation_file_path in enumerate(annotation_paths_to_save)
+        if request_idx not in failed_requests
+    }
+
+    for cache_key, annotation_file_path in zip(cache_keys_to_store, annotation_paths_to_save):
+        if cache_key is not None and annotation_file_path in requested_annotation_paths:
+            annotation_cache.store_annotation(cache_key, annotation_file_path)
+
+    for requested_annotation_path, annotation_file_path in duplicate_annotation_paths:
+        if requested_annotation_path in requested_annotation_paths:
+            write_text_annotation_json(annotation_file_path, read_text_annotation_json(requested_annotation_path))
+
+    if page_hash_index is not None:
+        for file_to_process, annotation_file_path in zip(files_to_request, annotation_paths_to_save):
+            if annotation_file_path in requested_annotation_paths:
+                page_hash_index.add_annotated_page(file_to_process, annotation_file_path)
+
+        page_hash_index.save()
+
+    wait_for_preprocessed_image_writes()
+
+
+def get_files_to_process(input_path: str, preprocess_folder_name: str, annotation_folder_name: str = None) -> list[str]:
+    """
+    Gets a list of file paths to process from the given directory or file
+    path. PDF files are converted into images of each page, using a pool of
+    processes for each PDF if there is more than one worker. The annotations
+    in annotation_folder_name of pages rendered again are invalidated.
+    """
+    files_to_process: list[str] = []
+
+    work_items = iter_work_items(input_path, ignored_folder_names={preprocess_folder_name},
+                                 page_range=parse_page_range(Config.args.pdf_page_range))
+
+    # Work items of the same PDF are yielded consecutively
+    for work_item_type, grouped_work_items in groupby(work_items, key=type):
+        if work_item_type is ImagePageWorkItem:
+            files_to_process.extend(work_item.image_path for work_item in grouped_work_items)
             continue
 
-        if has_extension(entry.name, valid_extensions=VALID_IMAGE_FILE_TYPES):
-            files_to_process.append(entry.path)
+        for pdf_path, pdf_work_items in groupby(grouped_work_items, key=lambda work_item: work_item.pdf_path):
+            page_numbers = [work_item.page_number for work_item in pdf_work_items]
+            pdf_image_paths = rasterize_pdf(pdf_path, preprocess_folder_name, workers=Config.args.workers,
+                                            page_numbers=page_numbers, zoom=get_pdf_zoom(),
+                                            annotation_folder_name=annotation_folder_name)
+            files_to_process.extend(pdf_image_paths)
 
     return files_to_process
 
 
+def iter_files_to_process(input_path: str, preprocess_folder_name: str, annotation_folder_name: str = None) -> Iterator[str]:
+    """
+    Lazily yields the file paths to process from the given directory or file
+    path while walking it. Each PDF page is rasterized when it is reached,
+    invalidating its annotations in annotation_folder_name if it is rendered
+    again.
+    """
+    work_items = iter_work_items(input_path, ignored_folder_names={preprocess_folder_name},
+                                 page_range=parse_page_range(Config.args.pdf_page_range))
+    zoom = get_pdf_zoom()
+
+    for work_item in work_items:
+        if isinstance(work_item, PdfPageWorkItem) and is_page_image_outdated(work_item.image_path, work_item.pdf_path,
+                                                                             preprocess_folder_name, zoom):
+            page_scales = _rasterize_pdf_pages(work_item.pdf_path, [work_item.page_number], preprocess_folder_name,
+                                               zoom=zoom)
+            save_pdf_page_scales(work_item.pdf_path, page_scales, zoom)
+            invalidate_page_annotations(list(page_scales), annotation_folder_name)
+
+        yield work_item.image_path
+
+
+def iter_flyer_files(input_path: str, preprocess_folder_name: str, annotation_folder_name: str = None) -> Iterator[tuple[str, list[str]]]:
+    """
+    Lazily yields the flyer name and page file paths of each flyer (directory)
+    in the input path. A flyer is yielded as soon as all of its pages have been
+    found.
+    """
+    files_to_process = iter_files_to_process(input_path, preprocess_folder_name, annotation_folder_name)
+
+    for flyer_directory, flyer_image_paths in groupby(files_to_process, key=get_path_directory):
+        yield get_last_folder_in_path(flyer_directory), list(flyer_image_paths)
+
+
 def perform_ocr(
     input_path: str,
     annotation_folder_name: str,
     preprocess: bool = True,
-    preprocess_folder_name: str = None
+    preprocess_folder_name: str = None,
+    workers: int = 1,
 ) -> defaultdict[str, list[tuple[str, HierarchicalAnnotation]]]:
     """
     Takes in a directory or file path and gets the corresponding annotations,
@@ -132,34 +771,117 @@ def perform_ocr(
     found in the directory. Will preprocess the images if preprocess is True.
     Valid input image files are `.pdf`, `.png`, `.jpg`, `.jpeg`
 
+    If workers is greater than 1, the files are processed across a pool of
+    that many processes. The pages of each flyer keep the same order as a
+    sequential run.
+
     Raises a ValueError if preprocess is True and preprocess_folder_name is None.
     Returns a dictionary where the keys are the flyer names (directories) and
     the values are tuples of the file name and the list of annotations.
     """
-    annotation_outputs: defaultdict[str, list[tuple[str, HierarchicalAnnotation]]] = defaultdict(list)
-    files_to_process: list[str] = []
-
     if preprocess and preprocess_folder_name is None:
         raise ValueError('preprocess_folder_name must be provided if preprocess is set to True!')
 
-    if not os.path.exists(input_path):
-        return annotation_outputs
+    files_to_process = get_files_to_process(input_path, preprocess_folder_name, annotation_folder_name)
+    annotation_outputs = perform_ocr_on_files(files_to_process, annotation_folder_name,
+                                              preprocess, preprocess_folder_name, workers)
 
-    if os.path.isfile(input_path):
-        if has_extension(input_path, {'.pdf'}):
-            pdf_image_paths = convert_pdf_to_image(input_path)
-            files_to_process.extend(pdf_image_paths)
+    save_caches()
 
-        if has_extension(input_path, VALID_IMAGE_FILE_TYPES):
-            files_to_process.append(input_path)
+    return annotation_outputs
 
-    # If input path is directory
-    if os.path.isdir(input_path):
-        directory_files = get_files_to_process_from_dir(input_path, preprocess_folder_name)
-        files_to_process.extend(directory_files)
+
+def perform_ocr_on_files(
+    files_to_process: list[str],
+    annotation_folder_name: str,
+    preprocess: bool = True,
+    preprocess_folder_name: str = None,
+    workers: int = 1,
+    process_pool: ProcessPoolExecutor = None,
+) -> defaultdict[str, list[tuple[str, HierarchicalAnnotation]]]:
+    """
+    Gets the annotations of each of the given files. See perform_ocr.
+
+    If workers is greater than 1, the files are processed in a pool of
+    processes. An already started process_pool can be given to process the
+    files in instead, which is left running.
+
+    Returns a dictionary where the keys are the flyer names (directories) and
+    the values are tuples of the file name and the list of annotations.
+    """
+    annotation_outputs: defaultdict[str, list[tuple[str, HierarchicalAnnotation]]] = defaultdict(list)
+
+    # Reuse the annotations of near-identical pages before requesting any
+    reuse_duplicate_page_annotations(files_to_process, annotation_folder_name)
+
+    # Request all missing annotations up front so requests can run concurrently
+    if Config.args.request_ocr:
+        request_missing_annotations(files_to_process, annotation_folder_name, preprocess, preprocess_folder_name,
+                                    max_in_flight=Config.args.ocr_max_in_flight, batch_size=Config.args.ocr_batch_size)
 
     # Process all files
-    for file_idx, file_to_process in enumerate(files_to_process):
+    ocr_on_file = partial(
+        perform_ocr_on_file,
+        annotation_folder_name=annotation_folder_name,
+        preprocess=preprocess,
+        preprocess_folder_name=preprocess_folder_name,
+    )
+
+    if process_pool is not None or workers > 1:
+        # Executor.map yields results in submission order, keeping the page order deterministic
+        with nullcontext(process_pool) if process_pool is not None else ProcessPoolExecutor(max_workers=workers) as executor:
+            file_results = executor.map(partial(call_with_worker_stats, ocr_on_file), files_to_process)
+            file_annotations = _merge_worker_stats(file_results)
+            _collect_page_annotations(files_to_process, file_annotations, annotation_outputs)
+    else:
+        file_annotations = map(ocr_on_file, files_to_process)
+        _collect_page_annotations(files_to_process, file_annotations, annotation_outputs)
+
+    # Close the archives opened by this process and its request threads once the annotations are loaded
+    for flyer_directory in {get_path_directory(file_to_process) for file_to_process in files_to_process}:
+        close_annotation_archives(os.path.join(flyer_directory, annotation_folder_name))
+
+    return annotation_outputs
+
+
+def start_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Creates a pool of processes and starts all of its processes right away,
+    rather than when tasks are first submitted. A pool used from a background
+    thread is started before the thread, since forking while other threads
+    hold locks can deadlock the forked processes.
+    """
+    process_pool = ProcessPoolExecutor(max_workers=workers)
+
+    for started_process in [process_pool.submit(os.getpid) for _ in range(workers)]:
+        started_process.result()
+
+    return process_pool
+
+
+def _merge_worker_stats(
+    worker_results: Iterable[tuple[list[HierarchicalAnnotation], dict, dict[str, dict]]],
+) -> Iterator[list[HierarchicalAnnotation]]:
+    """
+    Merges the metrics and cache activity returned by call_with_worker_stats
+    in pool processes into this process, yielding each result.
+    """
+    for result, worker_metrics, cache_activities in worker_results:
+        merge_worker_stats(worker_metrics, cache_activities)
+        yield result
+
+
+def _collect_page_annotations(
+    files_to_process: list[str],
+    file_annotations: Iterable[list[HierarchicalAnnotation]],
+    annotation_outputs: defaultdict[str, list[tuple[str, HierarchicalAnnotation]]],
+) -> None:
+    """
+    Groups the annotations of each processed file by flyer name into
+    annotation_outputs. file_annotations must be in the same order as
+    files_to_process.
+    """
+    for file_idx, (file_to_process, annotations) in enumerate(zip(files_to_process, file_annotations)):
         flyer_name = get_last_folder_in_path(file_to_process)
 
         if Config.args.verbose:
@@ -167,13 +889,69 @@ def perform_ocr(
                 f'[PROCESSING] {file_idx + 1}/{len(files_to_process)} ({(file_idx+1)/len(files_to_process):.2%}): Flyer "{flyer_name}", file: {file_to_process}'
             )
 
-        annotations = perform_ocr_on_file(file_to_process, annotation_folder_name, preprocess, preprocess_folder_name)
         # NOTE: There should only be a single anotation for one file, but Google Cloud provides an option for multiple pages.
         # Unwrap the annotation into a single HierarchicalAnnotation
         page_annotation = annotations[0]
         annotation_outputs[flyer_name].append((file_to_process, page_annotation))
 
-    return annotation_outputs
+
+def get_segmentation_bounds(
+    image_paths: list[str],
+    segment_images: Callable[[list[str]], dict[str, list[Region]]],
+) -> defaultdict[str, list[Region]]:
+    """
+    Gets the segmentation boxes of each image with segment_images. With page
+    dedupe enabled, images that are near-identical to a page segmented by the
+    same model reuse its boxes, and only one of each group of near-identical
+    images is segmented. Each reuse is logged to the dedupe audit log.
+    """
+    segmentation_bounds: defaultdict[str, list[Region]] = defaultdict(list)
+
+    if page_hash_index is None:
+        segmentation_bounds.update(segment_images(image_paths))
+        return segmentation_bounds
+
+    model_key = hash_model_file(Config.args.segmentation_model_state) or str(Config.args.segmentation_model_state)
+    image_paths_to_segment: list[str] = []
+    batch_duplicates: list[tuple[str, str, int]] = []
+
+    for image_path in image_paths:
+        duplicate = page_hash_index.find_segmented_duplicate(image_path, model_key)
+        if duplicate is not None:
+            duplicate_path, duplicate_bounds, distance = duplicate
+            segmentation_bounds[image_path] = duplicate_bounds
+            page_hash_index.log_reuse('segmentation', image_path, duplicate_path, distance)
+            continue
+
+        # Near-identical images in this batch are only segmented once
+        batch_duplicate = page_hash_index.find_duplicate_page(image_path, image_paths_to_segment)
+        if batch_duplicate is not None:
+            duplicate_idx, distance = batch_duplicate
+            batch_duplicates.append((image_path, image_paths_to_segment[duplicate_idx], distance))
+            continue
+
+        image_paths_to_segment.append(image_path)
+
+    if image_paths_to_segment:
+        segmented_bounds = segment_images(image_paths_to_segment)
+
+        for image_path in image_paths_to_segment:
+            segmentation_bounds[image_path] = segmented_bounds.get(image_path, [])
+            page_hash_index.add_segmentation(image_path, model_key, segmentation_bounds[image_path])
+
+    for image_path, duplicate_path, distance in batch_duplicates:
+        segmentation_bounds[image_path] = segmentation_bounds[duplicate_path]
+        page_hash_index.log_reuse('segmentation', image_path, duplicate_path, distance)
+
+    reused_count = len(image_paths) - len(image_paths_to_segment)
+    pipeline_metrics.increment('segmentations_deduplicated', reused_count)
+
+    if Config.args.verbose and reused_count:
+        print(f'[DEDUPE] Reusing the segmentation of {reused_count}/{len(image_paths)} pages.')
+
+    page_hash_index.save()
+
+    return segmentation_bounds
 
 
 def process_segmented_flyer(flyer_name: str, image_file_paths: list[str], annotations: list[HierarchicalAnnotation], segmentation_map: dict[str, list[Region]]):
@@ -195,6 +973,215 @@ def process_segmented_flyer(flyer_name: str, image_file_paths: list[str], annota
     return flyer
 
 
+def get_flyer_output_path(input_path_directory: str, flyer_name: str, output_folder_name: str) -> str:
+    """
+    Gets the path of the JSON file that the flyer data is saved to.
+    """
+    output_file_path = os.path.join(input_path_directory, flyer_name, output_folder_name, flyer_name)
+    return apply_default_file_ext(output_file_path, '.json')
+
+
+def get_flyer_run_manifest(flyer_image_paths: list[str]) -> tuple[dict, 'dict | None']:
+    """
+    Builds the run manifest of a flyer from its page images, the PDFs they
+    were rendered from, the model files and the flyer analysis configuration.
+    The PDF zoom arguments are part of the configuration of flyers rendered
+    from PDFs, and the annotation level is part of it unless it is symbol.
+
+    Returns a tuple of the new manifest and the manifest of the last
+    successful run, if there is one.
+    """
+    flyer_directory = get_path_directory(flyer_image_paths[0])
+    previous_run_manifest = load_run_manifest(flyer_directory)
+
+    model_files = {
+        'segmentation': Config.args.segmentation_model_state,
+        'classifier': Config.args.classifier_model_state,
+    }
+    env_config = {env_key: Config.env[env_key] if env_key in Config.env else None for env_key in MANIFEST_ENV_KEYS}
+
+    source_pdf_paths = list(dict.fromkeys(filter(None, map(get_source_pdf_path, flyer_image_paths))))
+    if source_pdf_paths:
+        env_config.update({
+            'pdf_zoom': Config.args.pdf_zoom,
+            'pdf_pixel_budget': Config.args.pdf_pixel_budget,
+            'pdf_min_text_height': Config.args.pdf_min_text_height,
+        })
+
+    # UNKNOWN components save the annotation tree of their block, so a shallower tree changes the output
+    if Config.args.annotation_level != 'symbol':
+        env_config['annotation_level'] = Config.args.annotation_level
+
+    run_manifest = build_run_manifest(flyer_image_paths + source_pdf_paths, model_files, env_config, previous_run_manifest)
+    return run_manifest, previous_run_manifest
+
+
+def filter_unchanged_flyers(
+    flyer_files: dict[str, list[str]],
+    input_path_directory: str,
+    output_folder_name: str,
+) -> tuple[dict[str, list[str]], dict[str, dict]]:
+    """
+    Removes the flyers whose inputs, models and configuration match the run
+    manifest of their last saved output. Flyers are only skipped when the
+    output is being saved and the --force flag is not used.
+
+    Returns a tuple of the flyers to process and the run manifest of each
+    flyer to save once its output is saved.
+    """
+    if not Config.args.save:
+        return flyer_files, {}
+
+    flyer_files_to_process: dict[str, list[str]] = {}
+    run_manifests: dict[str, dict] = {}
+
+    for flyer_name, flyer_image_paths in flyer_files.items():
+        run_manifest, previous_run_manifest = get_flyer_run_manifest(flyer_image_paths)
+        output_file_path = get_flyer_output_path(input_path_directory, flyer_name, output_folder_name)
+
+        is_unchanged = os.path.isfile(output_file_path) and is_run_manifest_unchanged(run_manifest, previous_run_manifest)
+        if is_unchanged and not Config.args.force:
+            pipeline_metrics.increment('flyers_skipped')
+            if Config.args.verbose:
+                print(f'[SKIPPED] Flyer "{flyer_name}" is unchanged since its last run.')
+            continue
+
+        flyer_files_to_process[flyer_name] = flyer_image_paths
+        run_manifests[flyer_name] = run_manifest
+
+    return flyer_files_to_process, run_manifests
+
+
+def extract_flyer(
+    flyer_name: str,
+    flyer_annotation_list: list[tuple[str, HierarchicalAnnotation]],
+    segmentation_map: dict[str, list[Region]],
+    input_path_directory: str,
+    output_folder_name: str,
+    run_manifest: dict = None,
+) -> Flyer:
+    """
+    Processes the annotated pages of a flyer into a Flyer object using the
+    segmentation bounds given by the segmentation_map. The flyer is printed,
+    saved and displayed according to the output flags. The run manifest is
+    saved into the flyer folder once the flyer is saved.
+    """
+    # Sort by file name (annot[0])
+    flyer_annotation_list.sort(key=lambda annot: int(re.sub(r'\D', '', os.path.basename(annot[0]))))
+
+    flyer_image_paths, flyer_annotations = zip(*flyer_annotation_list)
+    with pipeline_metrics.stage('extraction'):
+        flyer = process_segmented_flyer(flyer_name, flyer_image_paths, flyer_annotations, segmentation_map)
+
+    pipeline_metrics.increment('flyers')
+    pipeline_metrics.increment(PAGES_COUNTER, len(flyer_image_paths))
+
+    if Config.args.verbose > 1:
+        print(flyer)
+
+    if Config.args.save:
+        output_file_path = get_flyer_output_path(input_path_directory, flyer_name, output_folder_name)
+        save_flyer(flyer, file_path=output_file_path)
+
+        if run_manifest is not None:
+            save_run_manifest(get_path_directory(flyer_image_paths[0]), run_manifest)
+
+    if Config.args.display:
+        page_number = max(flyer.num_pages - 1, 1)
+        draw_flyer_ad_blocks(flyer.pages[page_number], flyer_image_paths[page_number])
+
+    return flyer
+
+
+def group_files_by_flyer(files_to_process: list[str]) -> dict[str, list[str]]:
+    """
+    Groups the file paths by their flyer name (directory), keeping the order
+    that each flyer was first seen in.
+    """
+    flyer_files: dict[str, list[str]] = {}
+    for file_to_process in files_to_process:
+        flyer_name = get_last_folder_in_path(file_to_process)
+        flyer_files.setdefault(flyer_name, []).append(file_to_process)
+
+    return flyer_files
+
+
+def run_streaming_pipeline(
+    input_path: str,
+    annotation_folder_name: str,
+    preprocess_folder_name: str,
+    output_folder_name: str,
+) -> None:
+    """
+    Runs OCR, segmentation and extraction flyer by flyer while the input is
+    being walked. The next flyer is discovered and annotated in the background
+    while the current flyer is segmented and extracted, so each flyer is
+    output as soon as it is ready and at most two flyers of annotations are
+    held in memory at once.
+
+    When verbose, the pages of the input are counted in the background for
+    the progress output, without delaying the first flyer.
+    """
+    input_path_directory = get_path_directory(input_path)
+    flyer_files = iter_flyer_files(input_path, preprocess_folder_name, annotation_folder_name)
+
+    def prepare_next_flyer() -> 'tuple[str, list[str], dict | None, list[tuple[str, HierarchicalAnnotation]]] | None':
+        for flyer_name, flyer_image_paths in flyer_files:
+            flyer_files_to_process, run_manifests = filter_unchanged_flyers(
+                {flyer_name: flyer_image_paths}, input_path_directory, output_folder_name)
+
+            if not flyer_files_to_process:
+                continue
+
+            annotation_outputs = perform_ocr_on_files(flyer_image_paths, annotation_folder_name, preprocess=True,
+                                                      preprocess_folder_name=preprocess_folder_name, process_pool=ocr_process_pool)
+            flyer_annotation_list = [page for flyer_pages in annotation_outputs.values() for page in flyer_pages]
+
+            return flyer_name, flyer_image_paths, run_manifests.get(flyer_name), flyer_annotation_list
+
+        return None
+
+    # The OCR processes are forked before the OCR thread starts and the segmentation model is loaded
+    ocr_process_pool_context = start_process_pool(Config.args.workers) if Config.args.workers > 1 else nullcontext()
+
+    with ocr_process_pool_context as ocr_process_pool, ThreadPoolExecutor(max_workers=1) as ocr_executor, \
+            ThreadPoolExecutor(max_workers=1) as discovery_executor:
+        next_flyer_future = ocr_executor.submit(prepare_next_flyer)
+
+        page_count_future = None
+        if Config.args.verbose:
+            page_count_future = discovery_executor.submit(estimate_work_item_count, input_path,
+                                                          ignored_folder_names={preprocess_folder_name},
+                                                          page_range=parse_page_range(Config.args.pdf_page_range))
+
+        # Load the segmentation model while the first flyer is annotated
+        with pipeline_metrics.stage('segmentation_model_load'):
+            box_getter = get_box_getter(Config.args.segmentation_model_state)
+
+        processed_page_count = 0
+        while True:
+            next_flyer = next_flyer_future.result()
+            if next_flyer is None:
+                break
+
+            # Start the OCR of the next flyer while this flyer is segmented
+            next_flyer_future = ocr_executor.submit(prepare_next_flyer)
+
+            flyer_name, flyer_image_paths, run_manifest, flyer_annotation_list = next_flyer
+            with pipeline_metrics.stage('segmentation'):
+                segmentation_bounds = get_segmentation_bounds(flyer_image_paths, box_getter.getBoxesForImages)
+            extract_flyer(flyer_name, flyer_annotation_list, segmentation_bounds, input_path_directory,
+                          output_folder_name, run_manifest=run_manifest)
+
+            processed_page_count += len(flyer_image_paths)
+            if Config.args.verbose:
+                # The page count is unknown until the whole input has been walked
+                estimated_page_count = page_count_future.result() if page_count_future.done() else '?'
+                print(f'[SEGMENTATION] Flyer "{flyer_name}", {processed_page_count}/{estimated_page_count} pages')
+
+    save_caches()
+
+
 if __name__ == '__main__':
     """
     This program will get annotation data on the given input, segment
@@ -226,6 +1213,19 @@ if __name__ == '__main__':
 
         -d, --display: Draws ad blocks onto the image and displays the
         last page for each flyer that is processed.
+
+    Pipeline Flags:
+        --stream: Each flyer is segmented and extracted as soon as its
+        pages are annotated, instead of annotating every flyer first.
+        The input is walked lazily, so PDF pages are only rasterized
+        when their flyer is reached.
+
+        --force: Process flyers even if their inputs, models and
+        configuration are unchanged since their output was last saved.
+
+        --metrics-out: Save a JSON report of the time spent in each
+        pipeline stage (p50/p95/max) and the page throughput of the run
+        to the given file path.
     """
 
     # Initialization
@@ -239,29 +1239,34 @@ if __name__ == '__main__':
     if not os.path.exists(input_path):
         raise ValueError(f'Input path "{input_path}" does not exist!')
 
-    annotation_data = perform_ocr(input_path, ANNOTATION_DATA_FOLDER, preprocess=True,
-                                  preprocess_folder_name=PREPROCESSED_DATA_FOLDER)
+    if Config.args.stream:
+        run_streaming_pipeline(input_path, ANNOTATION_DATA_FOLDER, PREPROCESSED_DATA_FOLDER, OUTPUT_FLYER_FOLDER)
+    else:
+        files_to_process = get_files_to_process(input_path, PREPROCESSED_DATA_FOLDER, ANNOTATION_DATA_FOLDER)
+        flyer_files, run_manifests = filter_unchanged_flyers(
+            group_files_by_flyer(files_to_process), input_path_directory, OUTPUT_FLYER_FOLDER)
+        files_to_process = [file_to_process for flyer_image_paths in flyer_files.values() for file_to_process in flyer_image_paths]
 
-    segmentation_bounds = get_segmented_boxes(Config.args.segmentation_model_state, input_path_directory)
-    for idx, (flyer_name, flyer_annotation_list) in enumerate(annotation_data.items()):
+        annotation_data = perform_ocr_on_files(files_to_process, ANNOTATION_DATA_FOLDER, preprocess=True,
+                                               preprocess_folder_name=PREPROCESSED_DATA_FOLDER, workers=Config.args.workers)
+        save_caches()
 
-        # Sort by file name (annot[0])
-        flyer_annotation_list.sort(key=lambda annot: int(re.sub(r'\D', '', os.path.basename(annot[0]))))
+        segmentation_bounds = {}
+        if files_to_process:
+            with pipeline_metrics.stage('segmentation'):
+                segmentation_bounds = get_segmentation_bounds(files_to_process, lambda image_paths: get_segmented_boxes(
+                    Config.args.segmentation_model_state, input_path_directory, image_files=image_paths))
 
-        flyer_image_paths, flyer_annotations = zip(*flyer_annotation_list)
-        flyer = process_segmented_flyer(flyer_name, flyer_image_paths, flyer_annotations, segmentation_bounds)
+        for idx, (flyer_name, flyer_annotation_list) in enumerate(annotation_data.items()):
+            extract_flyer(flyer_name, flyer_annotation_list, segmentation_bounds, input_path_directory,
+                          OUTPUT_FLYER_FOLDER, run_manifest=run_manifests.get(flyer_name))
 
-        if Config.args.verbose:
-            print(
-                f'[SEGMENTATION] {idx+1}/{len(annotation_data)} ({(idx+1)/len(annotation_data):.2%}): Flyer "{flyer_name}"')
+            if Config.args.verbose:
+                print(
+                    f'[SEGMENTATION] {idx+1}/{len(annotation_data)} ({(idx+1)/len(annotation_data):.2%}): Flyer "{flyer_name}"')
 
-        if Config.args.verbose > 1:
-            print(flyer)
+    if Config.args.metrics_out:
+        pipeline_metrics.save_report(Config.args.metrics_out)
 
-        if Config.args.save:
-            output_file_path = os.path.join(input_path_directory, flyer_name, OUTPUT_FLYER_FOLDER, flyer_name)
-            save_flyer(flyer, file_path=output_file_path)
-
-        if Config.args.display:
-            page_number = max(flyer.num_pages - 1, 1)
-            draw_flyer_ad_blocks(flyer.pages[page_number], flyer_image_paths[page_number])
+        if Config.args.verbose:
+            print(f'[METRICS] Saved the run metrics to "{Config.args.metrics_out}".')
@@ -0,0 +1,192 @@
+import os
+import os.path
+import sqlite3
+import threading
+import zlib
+from typing import Iterator
+
+from util.file_path_util import create_directories_to_file
+
+ANNOTATION_ARCHIVE_FILE_NAME = 'annotations.sqlite3'
+
+# Value of the ANNOTATION_STORE environment variable that saves annotations to archives
+ANNOTATION_STORE_ARCHIVE = 'archive'
+
+# Seconds to wait for another process writing to the same archive
+ARCHIVE_WRITE_TIMEOUT = 60
+
+
+class AnnotationArchive:
+    """
+    A SQLite database holding the annotation JSON of every page of a flyer,
+    stored in the flyer's annotation folder in place of one JSON file per
+    page. Each annotation is compressed with zlib and looked up by the name
+    of the JSON file it replaces.
+
+    Connections cannot be shared between threads or processes, so use
+    get_annotation_archive to get the archive for the current thread, and
+    close_annotation_archives once the flyer's annotations are loaded.
+    """
+
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        self._connection: sqlite3.Connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            create_directories_to_file(self.archive_path)
+
+            # Only used by the thread that opened it, but may be closed by another thread once that thread is done
+            self._connection = sqlite3.connect(self.archive_path, timeout=ARCHIVE_WRITE_TIMEOUT, check_same_thread=False)
+            # Allow reads while another process is writing
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS annotations (page_name TEXT PRIMARY KEY, content BLOB NOT NULL)'
+            )
+        return self._connection
+
+    def contains(self, page_name: str) -> bool:
+        row = self.connection.execute('SELECT 1 FROM annotations WHERE page_name = ?', (page_name,)).fetchone()
+        return row is not None
+
+    def read(self, page_name: str) -> 'str | None':
+        """
+        Gets the annotation JSON of the page, or None if the page is not in
+        the archive.
+        """
+        row = self.connection.execute('SELECT content FROM annotations WHERE page_name = ?', (page_name,)).fetchone()
+        if row is None:
+            return None
+
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def write(self, page_name: str, annotation_json: str) -> None:
+        """
+        Saves the annotation JSON of the page, replacing any annotation saved
+        for the page before.
+        """
+        content = zlib.compress(annotation_json.encode('utf-8'), level=6)
+
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO annotations (page_name, content) VALUES (?, ?)',
+                                    (page_name, content))
+
+    def delete(self, page_name: str) -> None:
+        """
+        Removes the annotation JSON of the page, if it is in the archive.
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM annotations WHERE page_name = ?', (page_name,))
+
+    def get_page_names(self) -> Iterator[str]:
+        for row in self.connection.execute('SELECT page_name FROM annotations ORDER BY page_name'):
+            yield row[0]
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_annotation_archives: dict[tuple[int, int, str], AnnotationArchive] = {}
+
+
+def get_annotation_archive_path(annotation_json_path: str) -> str:
+    """
+    Gets the path of the archive in the folder of the annotation JSON path.
+    """
+    return os.path.join(os.path.dirname(annotation_json_path), ANNOTATION_ARCHIVE_FILE_NAME)
+
+
+def get_annotation_archive(annotation_json_path: str) -> AnnotationArchive:
+    """
+    Gets the archive that holds the annotation of the given annotation JSON
+    path, opened for the current process and thread.
+    """
+    archive_path = os.path.abspath(get_annotation_archive_path(annotation_json_path))
+    archive_key = (os.getpid(), threading.get_ident(), archive_path)
+
+    if archive_key not in _annotation_archives:
+        _annotation_archives[archive_key] = AnnotationArchive(archive_path)
+
+    return _annotation_archives[archive_key]
+
+
+def close_annotation_archives(annotation_folder_path: str) -> None:
+    """
+    Closes the archive of the annotation folder in every thread of the
+    current process. The threads that used the archive must be done with it,
+    and it is reopened if it is used again.
+    """
+    archive_path = os.path.abspath(os.path.join(annotation_folder_path, ANNOTATION_ARCHIVE_FILE_NAME))
+    process_id = os.getpid()
+
+    for archive_key in list(_annotation_archives):
+        if archive_key[0] == process_id and archive_key[2] == archive_path:
+            _annotation_archives.pop(archive_key).close()
+
+
+def has_annotation_archive(annotation_json_path: str) -> bool:
+    return os.path.isfile(get_annotation_archive_path(annotation_json_path))
+
+
+def migrate_annotation_folder(annotation_folder_path: str, delete_json: bool = False) -> int:
+    """
+    Moves every annotation JSON file in the annotation folder into the
+    folder's archive. The JSON files (and their binary annotation files) are
+    deleted once archived if delete_json is True.
+
+    Returns:
+        int: The number of annotation files archived
+    """
+    # Imported here to avoid loading numpy for the archive alone
+    from .annotation_binary import get_annotation_binary_path
+
+    annotation_json_paths = sorted(
+        os.path.join(annotation_folder_path, file_name) for file_name in os.listdir(annotation_folder_path)
+        if file_name.lower().endswith('.json')
+    )
+
+    if not annotation_json_paths:
+        return 0
+
+    annotation_archive = get_annotation_archive(annotation_json_paths[0])
+
+    for annotation_json_path in annotation_json_paths:
+        with open(annotation_json_path, 'r') as annotation_json_file:
+            annotation_archive.write(os.path.basename(annotation_json_path), annotation_json_file.read())
+
+    if delete_json:
+        for annotation_json_path in annotation_json_paths:
+            os.remove(annotation_json_path)
+
+            annotation_binary_path = get_annotation_binary_path(annotation_json_path)
+            if os.path.isfile(annotation_binary_path):
+                os.remove(annotation_binary_path)
+
+    return len(annotation_json_paths)
+
+
+if __name__ == '__main__':
+    """
+    Migrates the annotation folders of every flyer in the input directory
+    into one annotation archive per flyer.
+
+    python -m ocr.annotation_archive --input-dir data --annotation-folder ocr_annotations [--delete-json]
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-dir', default='data', help='Directory to search for annotation folders')
+    parser.add_argument('--annotation-folder', default='ocr_annotations', help='Name of the annotation folders')
+    parser.add_argument('--delete-json', action='store_true',
+                        help='Delete the annotation JSON files once they are archived')
+    args = parser.parse_args()
+
+    for root, directory_names, _ in os.walk(args.input_dir):
+        if os.path.basename(root) != args.annotation_folder:
+            continue
+
+        migrated_count = migrate_annotation_folder(root, delete_json=args.delete_json)
+        print(f'[MIGRATE] Archived {migrated_count} annotations in "{root}".')
@@ -0,0 +1,302 @@
+"""
+A compact binary format for HierarchicalAnnotation trees, saved next to the
+annotation JSON so later runs do not parse the JSON again.
+
+The nodes of the tree are stored in breadth-first order so the children of
+each node are consecutive. The file is a header followed by columns of node
+data: the vertices, vertex count, annotation level, parent index, first child
+index and child count of each node, the offset of each node's text and the
+UTF-8 text of every node. The header records the lowest annotation level
+that was saved. The file is read into memory in one read when loaded, and
+nodes are only created when they are accessed.
+"""
+import os
+import os.path
+import struct
+from collections.abc import Sequence
+from typing import Iterator
+
+import numpy as np
+from util.file_path_util import apply_default_file_ext
+from util.image_space import Region, as_region
+
+from .annotation_types import AnnotationLevel, HierarchicalAnnotation
+
+ANNOTATION_BINARY_EXTENSION = '.bin'
+ANNOTATION_BINARY_MAGIC = b'FLYRANNO'
+ANNOTATION_BINARY_VERSION = 2
+
+# Magic, version, node count, root count, text byte count, max annotation level
+HEADER_FORMAT = '<8sIIIQI'
+
+# Vision bounding boxes have 4 vertices
+MAX_VERTICES = 4
+
+
+def get_annotation_binary_path(annotation_json_path: str) -> str:
+    """
+    Gets the path of the binary annotation file saved next to the annotation
+    JSON file.
+    """
+    return apply_default_file_ext(annotation_json_path, ANNOTATION_BINARY_EXTENSION, force=True)
+
+
+def is_annotation_binary_current(annotation_binary_path: str, annotation_json_path: str) -> bool:
+    """
+    Checks if the binary annotation file exists and was saved after the
+    annotation JSON was last modified.
+    """
+    if not os.path.isfile(annotation_binary_path):
+        return False
+
+    return os.path.getmtime(annotation_binary_path) >= os.path.getmtime(annotation_json_path)
+
+
+def save_annotation_binary(
+    file_path: str,
+    page_annotations: list[HierarchicalAnnotation],
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+) -> bool:
+    """
+    Saves the annotation trees to a binary annotation file. max_level is the
+    lowest level of annotations that the trees were created with.
+
+    Returns:
+        bool: False if the annotations could not be stored in the format
+        (a region with more than MAX_VERTICES vertices), True otherwise
+    """
+    nodes: list[HierarchicalAnnotation] = list(page_annotations)
+    parent_indices: list[int] = [-1] * len(nodes)
+    child_starts: list[int] = []
+    child_counts: list[int] = []
+
+    node_idx = 0
+    while node_idx < len(nodes):
+        child_annotations = getattr(nodes[node_idx], 'child_annotations', [])
+
+        child_starts.append(len(nodes))
+        child_counts.append(len(child_annotations))
+        nodes.extend(child_annotations)
+        parent_indices.extend([node_idx] * len(child_annotations))
+
+        node_idx += 1
+
+    if any(len(node.bounds) > MAX_VERTICES for node in nodes):
+        return False
+
+    vertices = np.zeros((len(nodes), MAX_VERTICES, 2), dtype=np.int32)
+    vertex_counts = np.zeros(len(nodes), dtype=np.uint8)
+    levels = np.zeros(len(nodes), dtype=np.uint8)
+
+    for node_idx, node in enumerate(nodes):
+        vertex_count = len(node.bounds)
+        vertex_counts[node_idx] = vertex_count
+        vertices[node_idx, :vertex_count] = np.reshape(as_region(node.bounds).coordinates, (vertex_count, 2))
+
+        annotation_level = getattr(node, 'annotation_level', None)
+        levels[node_idx] = annotation_level.value if annotation_level is not None else 0
+
+    encoded_texts = [node.text.encode('utf-8') for node in nodes]
+    text_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum([len(encoded_text) for encoded_text in encoded_texts], out=text_offsets[1:])
+    text_buffer = b''.join(encoded_texts)
+
+    columns = [
+        vertices,
+        vertex_counts,
+        levels,
+        np.asarray(parent_indices, dtype=np.int32),
+        np.asarray(child_starts, dtype=np.int32),
+        np.asarray(child_counts, dtype=np.int32),
+        text_offsets,
+    ]
+
+    header = struct.pack(HEADER_FORMAT, ANNOTATION_BINARY_MAGIC, ANNOTATION_BINARY_VERSION,
+                         len(nodes), len(page_annotations), len(text_buffer), max_level.value)
+
+    temporary_path = f'{file_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as binary_file:
+        binary_file.write(header)
+
+        for column in columns:
+            binary_file.write(b'\0' * _get_padding(binary_file.tell()))
+            binary_file.write(column.tobytes())
+
+        binary_file.write(text_buffer)
+
+    os.replace(temporary_path, file_path)
+    return True
+
+
+def load_annotation_binary(
+    file_path: str,
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+) -> 'list[HierarchicalAnnotation] | None':
+    """
+    Loads the page annotations from a binary annotation file. The child
+    annotations of each node are created when they are first accessed, and
+    annotations below max_level are left out.
+
+    Returns None if the file is not a binary annotation file of the current
+    version, or if it was saved without the annotations down to max_level.
+    """
+    annotation_binary = AnnotationBinary.open(file_path, max_level)
+    if annotation_binary is None or annotation_binary.saved_max_level.value < max_level.value:
+        return None
+
+    return list(annotation_binary.get_root_annotations())
+
+
+class AnnotationBinary:
+    """
+    The columns of a binary annotation file, viewed in place in the buffer of
+    the file contents. The file is not kept open, so any number of pages can
+    stay loaded.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        buffer: np.ndarray,
+        node_count: int,
+        root_count: int,
+        text_byte_count: int,
+        saved_max_level: AnnotationLevel,
+        max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+    ):
+        self.file_path = file_path
+        self.buffer = buffer
+        self.node_count = node_count
+        self.root_count = root_count
+        self.text_byte_count = text_byte_count
+        self.saved_max_level = saved_max_level
+        self.max_level = max_level
+
+        offset = struct.calcsize(HEADER_FORMAT)
+
+        def read_column(dtype: np.dtype, shape: tuple[int, ...]) -> np.ndarray:
+            nonlocal offset
+            offset += _get_padding(offset)
+
+            column_byte_count = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            column = buffer[offset:offset + column_byte_count].view(dtype).reshape(shape)
+            offset += column_byte_count
+
+            return column
+
+        self.vertices = read_column(np.int32, (node_count, MAX_VERTICES, 2))
+        self.vertex_counts = read_column(np.uint8, (node_count,))
+        self.levels = read_column(np.uint8, (node_count,))
+        self.parent_indices = read_column(np.int32, (node_count,))
+        self.child_starts = read_column(np.int32, (node_count,))
+        self.child_counts = read_column(np.int32, (node_count,))
+        self.text_offsets = read_column(np.int64, (node_count + 1,))
+        self.text_buffer = buffer[offset:offset + text_byte_count]
+
+    @staticmethod
+    def open(file_path: str, max_level: AnnotationLevel = AnnotationLevel.SYMBOL) -> 'AnnotationBinary | None':
+        """
+        Reads the binary annotation file, returning None if it is not a
+        binary annotation file of the current version. Annotations below
+        max_level are left out when nodes are created.
+        """
+        header_size = struct.calcsize(HEADER_FORMAT)
+        if os.path.getsize(file_path) < header_size:
+            return None
+
+        # Read rather than memory-map, since a mapping keeps the file open for as long as the page is loaded
+        buffer = np.fromfile(file_path, dtype=np.uint8)
+        magic, version, node_count, root_count, text_byte_count, saved_max_level = struct.unpack(
+            HEADER_FORMAT, buffer[:header_size].tobytes())
+
+        if magic != ANNOTATION_BINARY_MAGIC or version != ANNOTATION_BINARY_VERSION:
+            return None
+
+        return AnnotationBinary(file_path, buffer, node_count, root_count, text_byte_count,
+                                AnnotationLevel(saved_max_level), max_level)
+
+    def __reduce__(self):
+        # The buffer is pickled once per pickle, however many sequences of the file are in it
+        return AnnotationBinary, (self.file_path, self.buffer, self.node_count, self.root_count, self.text_byte_count,
+                                  self.saved_max_level, self.max_level)
+
+    def get_root_annotations(self) -> 'LazyAnnotationSequence':
+        return LazyAnnotationSequence(self, 0, self.root_count)
+
+    def get_annotation(self, node_idx: int) -> HierarchicalAnnotation:
+        """
+        Creates the annotation of a node. Its child annotations are a lazy
+        sequence that creates each child when it is accessed.
+        """
+        vertex_count = self.vertex_counts[node_idx]
+        bounds = Region.from_coordinates(self.vertices[node_idx, :vertex_count].ravel().tolist())
+
+        text_start, text_end = self.text_offsets[node_idx], self.text_offsets[node_idx + 1]
+        text = self.text_buffer[text_start:text_end].tobytes().decode('utf-8')
+
+        level = int(self.levels[node_idx])
+        annotation_level = AnnotationLevel(level) if level else None
+
+        child_count = int(self.child_counts[node_idx])
+        if annotation_level is not None and annotation_level.value >= self.max_level.value:
+            child_count = 0
+
+        child_annotations = LazyAnnotationSequence(self, int(self.child_starts[node_idx]), child_count)
+
+        return HierarchicalAnnotation(bounds=bounds, text=text, annotation_level=annotation_level,
+                                      child_annotations=child_annotations)
+
+
+class LazyAnnotationSequence(Sequence):
+    """
+    A sequence of consecutive nodes of a binary annotation file. Each node's
+    annotation is created when it is first accessed and then reused.
+
+    Pickling the sequence stores the file contents and node range rather than
+    the created annotations, so the annotations can be returned from other
+    processes cheaply without reopening the file.
+    """
+
+    def __init__(self, annotation_binary: AnnotationBinary, start: int, count: int):
+        self.annotation_binary = annotation_binary
+        self.start = start
+        self.count = count
+        self._annotations: list['HierarchicalAnnotation | None'] = [None] * count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[idx] for idx in range(*index.indices(self.count))]
+
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('annotation index out of range')
+
+        if self._annotations[index] is None:
+            self._annotations[index] = self.annotation_binary.get_annotation(self.start + index)
+
+        return self._annotations[index]
+
+    def __iter__(self) -> Iterator[HierarchicalAnnotation]:
+        for index in range(self.count):
+            yield self[index]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(annotation == other_annotation for annotation, other_annotation in zip(self, other))
+
+    def __repr__(self) -> str:
+        # Matches the list of annotations, since component reprs are saved in the flyer output
+        return repr(list(self))
+
+    def __reduce__(self):
+        return LazyAnnotationSequence, (self.annotation_binary, self.start, self.count)
+
+
+def _get_padding(offset: int) -> int:
+    # Columns are aligned to 8 bytes so they can be viewed in place
+    return -offset % 8
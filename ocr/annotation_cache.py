@@ -0,0 +1,56 @@
+from util.content_cache import ContentAddressedCache
+
+from .get_annotations import (read_text_annotation_json,
+                              write_text_annotation_json)
+
+
+class AnnotationCache(ContentAddressedCache):
+    """
+    Content-addressed cache of annotation JSON files. Annotations are keyed by
+    the bytes of the image sent for OCR and the preprocessing applied to it,
+    so renamed or duplicated pages reuse the same annotation.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int = None):
+        super().__init__(directory, max_size_bytes=max_size_bytes, file_extension='.json')
+
+    def get_annotation_key(self, image_path: str, preprocess_name: str) -> str:
+        """
+        Gets the cache key for the annotation of the image at image_path, which
+        was preprocessed with the preprocessing named preprocess_name.
+        """
+        return self.hash_file(image_path, preprocess_name.encode())
+
+    def get_content_annotation_key(self, image_content: bytes, preprocess_name: str) -> str:
+        """
+        Gets the cache key for the annotation of an encoded image, equal to
+        the key of the image file with the same content.
+        """
+        return self.hash_content(image_content, preprocess_name.encode())
+
+    def restore_annotation(self, key: str, annotation_json_path: str) -> bool:
+        """
+        Copies the cached annotation with the given key to annotation_json_path,
+        or to the annotation archive if the archive store is configured.
+
+        Returns:
+            bool: Whether the annotation was found in the cache
+        """
+        cached_annotation_path = self.get_path(key)
+        if cached_annotation_path is None:
+            return False
+
+        with open(cached_annotation_path, 'r') as cached_annotation_file:
+            write_text_annotation_json(annotation_json_path, cached_annotation_file.read())
+
+        return True
+
+    def store_annotation(self, key: str, annotation_json_path: str) -> str:
+        """
+        Adds the saved annotation JSON of annotation_json_path to the cache
+        under the given key.
+
+        Returns:
+            str: The path of the cached file
+        """
+        return self.put_bytes(key, read_text_annotation_json(annotation_json_path).encode('utf-8'))
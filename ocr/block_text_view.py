@@ -0,0 +1,39 @@
+from functools import cached_property, lru_cache
+
+# Number of distinct block texts to keep views of during a run
+BLOCK_TEXT_VIEW_CACHE_SIZE = 8192
+
+
+class BlockTextView:
+    """
+    The forms of a block's text used by the component extractors. Each form
+    is computed the first time it is used, and views are shared between
+    blocks with identical text through get_block_text_view.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+    @cached_property
+    def normalized_text(self) -> str:
+        """The text with each run of whitespace replaced by a single space."""
+        return ' '.join(self.tokens)
+
+    @cached_property
+    def lower_text(self) -> str:
+        """The normalized text in lowercase."""
+        return self.normalized_text.lower()
+
+    @cached_property
+    def tokens(self) -> tuple[str, ...]:
+        """The whitespace separated words of the text."""
+        return tuple(self.text.split())
+
+
+@lru_cache(maxsize=BLOCK_TEXT_VIEW_CACHE_SIZE)
+def get_block_text_view(text: str) -> BlockTextView:
+    """
+    Gets the text view of a block's text, reusing the view of an identical
+    text seen earlier in the run.
+    """
+    return BlockTextView(text)
@@ -1,12 +1,29 @@
 import os.path
 
-from util.file_path_util import get_file_name_without_ext
+import ujson
+from config import Config
+from config.env_keys import ANNOTATION_STORE
+from google.cloud.vision import AnnotateImageResponse
+from util.file_path_util import (create_directories_to_file,
+                                 get_file_name_without_ext)
 from util.image_space import Region, does_region_intersect
+from util.spatial_index import RegionIndex
 
-from .annotation_types import Annotation
+from .annotation_archive import (ANNOTATION_STORE_ARCHIVE,
+                                 get_annotation_archive,
+                                 has_annotation_archive)
+from .annotation_binary import (get_annotation_binary_path,
+                                is_annotation_binary_current,
+                                load_annotation_binary, save_annotation_binary)
+from .annotation_types import (Annotation, AnnotationLevel,
+                               HierarchicalAnnotation)
 from .google_cloud import google_cloud_client
+from .google_cloud.annotation_json import (
+    load_json_as_flat_annotations, load_json_as_hierarchical_annotations,
+    response_json_to_flat_annotations,
+    response_json_to_hierarchical_annotations)
 from .google_cloud.annotation_response import (
-    load_response_from_json, response_to_flat_annotations,
+    get_response_json_path, response_to_flat_annotations,
     response_to_hierarchical_annotations, save_response_as_json)
 
 
@@ -17,10 +34,14 @@ def get_text_annotations(
     save_file_path: str = None,
     hierarchical: bool = True,
     use_default_directory: bool = True,
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+    image_content: bytes = None,
 ) -> list[Annotation]:
     """
     Gets OCR annotation from the annotation JSON file given, or requests
-    annotations for the image specified if request_as_fallback is True.
+    annotations for the image specified if request_as_fallback is True. The
+    annotation JSON is read from the annotation archive of its folder if the
+    file does not exist.
 
     Requests annotation from the image if an image path is provided. If an
     annotation is requested, the annotation data will be saved to the path
@@ -33,6 +54,9 @@ def get_text_annotations(
         rqeuest_as_fallback (bool, optional): Whether to request annotations if failed to load from JSON. Defaults to False.
         save_file_path (str, optional): The name to save the annotated file as if an annotation was requested. Defaults to the image file name.
         hierarchical (bool, optional): Whether to load the annotations using the hierarchical model. If False, will load flat annotations. Defaults to True.
+        max_level (AnnotationLevel, optional): Lowest level of hierarchical annotations to create. Parent text still includes the text of lower levels.
+            Defaults to AnnotationLevel.SYMBOL.
+        image_content (bytes, optional): The encoded image to request annotations for instead of reading file_image_path. Defaults to None.
 
     Raises:
         ValueError: If no path is given for the annotation JSON or the image
@@ -41,16 +65,24 @@ def get_text_annotations(
         list[Annotation]: The list of annotations
     """
     if annotation_json_path and os.path.isfile(annotation_json_path):
-        response = load_response_from_json(annotation_json_path)
+        # Load the saved JSON directly, without creating the response proto messages
+        if hierarchical:
+            annotations = load_hierarchical_annotations(annotation_json_path, max_level)
+        else:
+            annotations = load_json_as_flat_annotations(annotation_json_path)
+
+    elif annotation_json_path and has_text_annotations(annotation_json_path):
+        response = ujson.loads(read_text_annotation_json(annotation_json_path))
 
         if hierarchical:
-            annotations = response_to_hierarchical_annotations(response)
+            annotations = response_json_to_hierarchical_annotations(response, max_level)
         else:
-            annotations = response_to_flat_annotations(response)
+            annotations = response_json_to_flat_annotations(response)
 
     elif request_as_fallback and file_image_path is not None:
         annotations = request_text_annotations(file_image_path, save_file_path=save_file_path,
-                                               hierarchical=hierarchical, use_default_directory=use_default_directory)
+                                               hierarchical=hierarchical, use_default_directory=use_default_directory,
+                                               max_level=max_level, image_content=image_content)
 
     else:
         raise ValueError(f'Invalid path given for annotation JSON or image.')
@@ -58,42 +90,229 @@ def get_text_annotations(
     return annotations
 
 
+def is_annotation_archive_store() -> bool:
+    """
+    Checks if annotations are configured to be saved to the annotation
+    archive of each folder instead of one JSON file per page.
+    """
+    return ANNOTATION_STORE in Config.env and Config.env.ANNOTATION_STORE == ANNOTATION_STORE_ARCHIVE
+
+
+def has_text_annotations(annotation_json_path: str) -> bool:
+    """
+    Checks if the annotation JSON is saved, either as a file or in the
+    annotation archive of its folder.
+    """
+    if os.path.isfile(annotation_json_path):
+        return True
+
+    if not has_annotation_archive(annotation_json_path):
+        return False
+
+    return get_annotation_archive(annotation_json_path).contains(os.path.basename(annotation_json_path))
+
+
+def read_text_annotation_json(annotation_json_path: str) -> str:
+    """
+    Reads the saved annotation JSON, from the file if it exists or otherwise
+    from the annotation archive of its folder.
+
+    Raises:
+        FileNotFoundError: If the annotation JSON is not saved
+    """
+    if os.path.isfile(annotation_json_path):
+        with open(annotation_json_path, 'r') as annotation_json_file:
+            return annotation_json_file.read()
+
+    annotation_json = None
+    if has_annotation_archive(annotation_json_path):
+        annotation_json = get_annotation_archive(annotation_json_path).read(os.path.basename(annotation_json_path))
+
+    if annotation_json is None:
+        raise FileNotFoundError(f'No annotation saved for {annotation_json_path}')
+
+    return annotation_json
+
+
+def write_text_annotation_json(annotation_json_path: str, annotation_json: str) -> None:
+    """
+    Saves the annotation JSON to the annotation archive of its folder if the
+    archive store is configured, otherwise to the file.
+    """
+    if is_annotation_archive_store():
+        get_annotation_archive(annotation_json_path).write(os.path.basename(annotation_json_path), annotation_json)
+        return
+
+    create_directories_to_file(annotation_json_path)
+
+    with open(annotation_json_path, 'w') as annotation_json_file:
+        annotation_json_file.write(annotation_json)
+
+
+def delete_text_annotations(annotation_json_path: str) -> None:
+    """
+    Deletes the saved annotation JSON, from the file and its binary
+    annotation file and from the annotation archive of its folder.
+    """
+    for annotation_file_path in (annotation_json_path, get_annotation_binary_path(annotation_json_path)):
+        if os.path.isfile(annotation_file_path):
+            os.remove(annotation_file_path)
+
+    if has_annotation_archive(annotation_json_path):
+        get_annotation_archive(annotation_json_path).delete(os.path.basename(annotation_json_path))
+
+
+def save_text_annotation_response(
+    annotation_response: AnnotateImageResponse,
+    save_file_path: str,
+    use_default_directory: bool = True,
+) -> None:
+    """
+    Saves the response as annotation JSON, to the annotation archive if the
+    archive store is configured, otherwise with save_response_as_json.
+    """
+    if not is_annotation_archive_store():
+        save_response_as_json(annotation_response, save_file_path, use_default_directory=use_default_directory)
+        return
+
+    annotation_json_path = get_response_json_path(save_file_path, use_default_directory)
+
+    if Config.args.verbose:
+        print(f'Writing JSON response to archive of {annotation_json_path}.')
+
+    write_text_annotation_json(annotation_json_path, AnnotateImageResponse.to_json(annotation_response))
+
+
+def load_hierarchical_annotations(
+    annotation_json_path: str,
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+) -> list[HierarchicalAnnotation]:
+    """
+    Loads the hierarchical annotations of an annotation JSON file. The
+    annotations are loaded from the binary annotation file next to the JSON
+    if it is up to date, otherwise the JSON is loaded and the binary
+    annotation file is saved for the next load.
+
+    Args:
+        annotation_json_path (str): The annotation data file to load
+        max_level (AnnotationLevel, optional): Lowest level of annotations to create. Defaults to AnnotationLevel.SYMBOL.
+
+    Returns:
+        list[HierarchicalAnnotation]: Annotations of the pages in the file
+    """
+    annotation_binary_path = get_annotation_binary_path(annotation_json_path)
+
+    if is_annotation_binary_current(annotation_binary_path, annotation_json_path):
+        annotations = load_annotation_binary(annotation_binary_path, max_level)
+        if annotations is not None:
+            return annotations
+
+    annotations = load_json_as_hierarchical_annotations(annotation_json_path, max_level)
+    save_annotation_binary(annotation_binary_path, annotations, max_level)
+
+    return annotations
+
+
 def request_text_annotations(
     file_image_path: str,
     save_file_path: str = None,
     hierarchical: bool = True,
-    use_default_directory: bool = True
+    use_default_directory: bool = True,
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+    image_content: bytes = None,
 ) -> list[Annotation]:
     """
     Requests text annotations from Google Cloud and saves the data as a JSON
     file. If no save_file_path is given, the file_image_path is used instead.
+    If image_content is given, it is sent instead of reading the image file.
 
     Args:
         file_image_path (str): The path to the image to annotate
         save_file_path (str, optional): The file name to save the annotation data as. Defaults to the image file name.
         hierarchical (bool, optional): Whether to get the hierarchical annotations. Will get flat annotations if False. Defaults to True.
+        max_level (AnnotationLevel, optional): Lowest level of hierarchical annotations to create. Defaults to AnnotationLevel.SYMBOL.
+        image_content (bytes, optional): The encoded image to annotate. Defaults to the contents of file_image_path.
 
     Returns:
         list[Annotation]: The list of annotations
     """
-    annotation_response = google_cloud_client.request_text_detection(file_image_path)
+    annotation_response = google_cloud_client.request_text_detection(
+        image_content if image_content is not None else file_image_path)
 
     if save_file_path is None:
         save_file_path = file_image_path
 
-    save_response_as_json(annotation_response, save_file_path, use_default_directory=use_default_directory)
+    save_text_annotation_response(annotation_response, save_file_path, use_default_directory=use_default_directory)
 
     if hierarchical:
-        annotations = response_to_hierarchical_annotations(annotation_response)
+        annotations = response_to_hierarchical_annotations(annotation_response, max_level)
     else:
         annotations = response_to_flat_annotations(annotation_response)
 
     return annotations
 
 
+def request_text_annotation_files(
+    file_image_paths: list[str],
+    save_file_paths: list[str],
+    use_default_directory: bool = True,
+    max_in_flight: int = 1,
+    batch_size: int = 1,
+    image_contents: list[bytes] = None,
+) -> dict[int, Exception]:
+    """
+    Requests text annotations from Google Cloud for each of the images,
+    making up to max_in_flight requests concurrently, and saves each
+    response as a JSON file at the corresponding save file path as soon as
+    it arrives. If batch_size is greater than 1, images are grouped into
+    batch requests of up to batch_size images.
+
+    A failed request does not stop the others. Each image whose request
+    failed is reported and left without an annotation.
+
+    Args:
+        file_image_paths (list[str]): The paths to the images to annotate
+        save_file_paths (list[str]): The file names to save the annotation data as
+        max_in_flight (int, optional): Maximum number of concurrent requests. Defaults to 1.
+        batch_size (int, optional): Maximum number of images per request. Defaults to 1.
+        image_contents (list[bytes], optional): The encoded images to send instead of reading the image files. Defaults to None.
+
+    Returns:
+        dict[int, Exception]: The error of each image whose request failed, by the index of the image
+    """
+    images = image_contents if image_contents is not None else file_image_paths
+
+    if batch_size > 1:
+        annotation_results = google_cloud_client.iter_batch_text_detections(
+            images, batch_size=batch_size, max_in_flight=max_in_flight)
+    else:
+        annotation_results = google_cloud_client.iter_text_detections(images, max_in_flight=max_in_flight)
+
+    failed_requests: dict[int, Exception] = {}
+    for image_idx, annotation_response, error in annotation_results:
+        if error is not None:
+            print(f'[OCR] Text detection failed for "{file_image_paths[image_idx]}": {error}')
+            failed_requests[image_idx] = error
+            continue
+
+        save_text_annotation_response(annotation_response, save_file_paths[image_idx], use_default_directory=use_default_directory)
+
+    return failed_requests
+
+
+def build_annotation_index(annotations: list[Annotation]) -> RegionIndex:
+    """
+    Builds a spatial index over the bounds of the annotations, to be passed
+    to find_annotations_in_region when querying the same annotations for
+    many regions.
+    """
+    return RegionIndex([annotation.bounds for annotation in annotations])
+
+
 def find_annotations_in_region(
     annotations: list[Annotation],
     region_vertices: Region,
+    annotation_index: RegionIndex = None,
 ) -> list[Annotation]:
     """
     Filters the list of annotations to all of the annotations that
@@ -102,10 +321,14 @@ def find_annotations_in_region(
     Args:
         annotations (list[Annotation]): Annotations to filter
         region_vertices (Region): Region to intersect
+        annotation_index (RegionIndex, optional): Index of the annotations from build_annotation_index. Defaults to testing every annotation.
 
     Returns:
         list[Annotation]: Annotations that intersect with the region
     """
+    if annotation_index is not None:
+        return [annotations[annotation_idx] for annotation_idx in annotation_index.query(region_vertices)]
+
     def does_annotation_intersect(annotation: Annotation) -> bool:
         return does_region_intersect(annotation.bounds, region_vertices)
 
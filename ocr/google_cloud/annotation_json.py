@@ -0,0 +1,286 @@
+"""
+Loads text detection responses saved by save_response_as_json directly from
+the JSON into annotations, without creating the AnnotateImageResponse proto
+messages. The saved JSON uses the camelCase field names of the response.
+"""
+import os
+import os.path
+
+import ujson
+from ocr.annotation_types import (Annotation, AnnotationLevel,
+                                  HierarchicalAnnotation)
+from ocr.google_cloud.hierarchy_annotations import is_level_included
+from unidecode import unidecode
+from util.image_space import Region, Vertex
+
+# Names of the TextAnnotation.DetectedBreak.BreakType enum values, used when
+# a response was saved with enum names instead of integers
+BREAK_TYPE_VALUES = {
+    'UNKNOWN': 0,
+    'SPACE': 1,
+    'SURE_SPACE': 2,
+    'EOL_SURE_SPACE': 3,
+    'HYPHEN': 4,
+    'LINE_BREAK': 5,
+}
+
+
+def load_response_json(file_path: str) -> dict:
+    """
+    Loads a text detection response JSON file as a dictionary.
+    """
+    with open(file_path, 'r') as response_json_file:
+        return ujson.load(response_json_file)
+
+
+def load_json_as_hierarchical_annotations(
+    file_path: str,
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+) -> list[HierarchicalAnnotation]:
+    """
+    Loads a text detection response JSON file into a list of
+    HierarchicalAnnotations. Equivalent to
+    load_response_as_hierarchical_annotations.
+
+    Args:
+        file_path (str): File path to the response JSON file
+        max_level (AnnotationLevel, optional): Lowest level of annotations to create. Defaults to AnnotationLevel.SYMBOL.
+
+    Returns:
+        list[HierarchicalAnnotations]: Annotations for the pages in the flyer
+    """
+    response = load_response_json(file_path)
+    return response_json_to_hierarchical_annotations(response, max_level)
+
+
+def load_json_as_flat_annotations(file_path: str) -> list[Annotation]:
+    """
+    Loads a text detection response JSON file into a list of Annotations.
+    Equivalent to load_response_as_flat_annotations.
+
+    Args:
+        file_path (str): File path to the response JSON file
+
+    Returns:
+        list[Annotation]: The flattened list of annotations
+    """
+    response = load_response_json(file_path)
+    return response_json_to_flat_annotations(response)
+
+
+def response_json_to_hierarchical_annotations(
+    response: dict,
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+) -> list[HierarchicalAnnotation]:
+    """
+    Converts a loaded text detection response JSON into a list of
+    HierarchicalAnnotations.
+    """
+    pages = response.get('fullTextAnnotation', {}).get('pages', [])
+
+    page_annotations = [_page_json_to_annotation(page, max_level) for page in pages]
+    return page_annotations
+
+
+def response_json_to_flat_annotations(response: dict) -> list[Annotation]:
+    """
+    Converts a loaded text detection response JSON into a list of
+    Annotations.
+    """
+    annotations = [
+        Annotation(
+            bounds=_bounding_poly_json_to_region(text_annotation.get('boundingPoly')),
+            text=unidecode(text_annotation.get('description', '')),
+        )
+        for text_annotation in response.get('textAnnotations', [])
+    ]
+
+    return annotations
+
+
+def _page_json_to_annotation(page: dict, max_level: AnnotationLevel) -> HierarchicalAnnotation:
+    block_annotations: list[HierarchicalAnnotation] = []
+
+    if is_level_included(AnnotationLevel.BLOCK, max_level):
+        block_annotations = [_block_json_to_annotation(block, max_level) for block in page.get('blocks', [])]
+        page_text = ''.join(block_annotation.text for block_annotation in block_annotations)
+    else:
+        page_text = ''.join(map(_get_block_json_text, page.get('blocks', [])))
+
+    # Pages don't have bounds, use (0, 0) and (width, height) as corners
+    width = page.get('width', 0)
+    height = page.get('height', 0)
+    vertices = Region([
+        Vertex(0, 0),
+        Vertex(width, 0),
+        Vertex(width, height),
+        Vertex(0, height),
+    ])
+
+    return HierarchicalAnnotation(bounds=vertices, text=page_text,
+                                  annotation_level=AnnotationLevel.PAGE, child_annotations=block_annotations)
+
+
+def _block_json_to_annotation(block: dict, max_level: AnnotationLevel) -> HierarchicalAnnotation:
+    paragraph_annotations: list[HierarchicalAnnotation] = []
+
+    if is_level_included(AnnotationLevel.PARA, max_level):
+        paragraph_annotations = [_paragraph_json_to_annotation(paragraph, max_level)
+                                 for paragraph in block.get('paragraphs', [])]
+        block_text = ''.join(paragraph_annotation.text for paragraph_annotation in paragraph_annotations)
+    else:
+        block_text = _get_block_json_text(block)
+
+    return HierarchicalAnnotation(bounds=_bounding_poly_json_to_region(block.get('boundingBox')), text=block_text,
+                                  annotation_level=AnnotationLevel.BLOCK, child_annotations=paragraph_annotations)
+
+
+def _paragraph_json_to_annotation(paragraph: dict, max_level: AnnotationLevel) -> HierarchicalAnnotation:
+    word_annotations: list[HierarchicalAnnotation] = []
+
+    if is_level_included(AnnotationLevel.WORD, max_level):
+        word_annotations = [_word_json_to_annotation(word, max_level) for word in paragraph.get('words', [])]
+        paragraph_text = ''.join(word_annotation.text for word_annotation in word_annotations)
+    else:
+        paragraph_text = _get_paragraph_json_text(paragraph)
+
+    return HierarchicalAnnotation(bounds=_bounding_poly_json_to_region(paragraph.get('boundingBox')), text=paragraph_text,
+                                  annotation_level=AnnotationLevel.PARA, child_annotations=word_annotations)
+
+
+def _word_json_to_annotation(word: dict, max_level: AnnotationLevel) -> HierarchicalAnnotation:
+    symbol_annotations: list[HierarchicalAnnotation] = []
+
+    if is_level_included(AnnotationLevel.SYMBOL, max_level):
+        symbol_annotations = [_symbol_json_to_annotation(symbol) for symbol in word.get('symbols', [])]
+        word_text = ''.join(symbol_annotation.text for symbol_annotation in symbol_annotations)
+    else:
+        word_text = _get_word_json_text(word)
+
+    return HierarchicalAnnotation(bounds=_bounding_poly_json_to_region(word.get('boundingBox')), text=word_text,
+                                  annotation_level=AnnotationLevel.WORD, child_annotations=symbol_annotations)
+
+
+def _symbol_json_to_annotation(symbol: dict) -> HierarchicalAnnotation:
+    return HierarchicalAnnotation(bounds=_bounding_poly_json_to_region(symbol.get('boundingBox')),
+                                  text=_get_symbol_json_text(symbol), annotation_level=AnnotationLevel.SYMBOL)
+
+
+def _get_block_json_text(block: dict) -> str:
+    return ''.join(map(_get_paragraph_json_text, block.get('paragraphs', [])))
+
+
+def _get_paragraph_json_text(paragraph: dict) -> str:
+    return ''.join(map(_get_word_json_text, paragraph.get('words', [])))
+
+
+def _get_word_json_text(word: dict) -> str:
+    return ''.join(map(_get_symbol_json_text, word.get('symbols', [])))
+
+
+def _get_symbol_json_text(symbol: dict) -> str:
+    symbol_text = unidecode(symbol.get('text', ''))
+    break_character = _get_break_character(symbol)
+
+    if break_character:
+        if symbol['property']['detectedBreak'].get('isPrefix', False):
+            symbol_text = break_character + symbol_text
+        else:
+            symbol_text = symbol_text + break_character
+
+    return symbol_text
+
+
+def _get_break_character(symbol: dict) -> str:
+    """
+    Gets the character that the detected break of the symbol adds to its
+    text, following get_symbol_text.
+    """
+    detected_break = (symbol.get('property') or {}).get('detectedBreak')
+    if not detected_break:
+        return ''
+
+    break_type = detected_break.get('type', 0)
+    if isinstance(break_type, str):
+        break_type = BREAK_TYPE_VALUES.get(break_type, 0)
+
+    if break_type == 4:
+        return '-'
+    elif break_type == 5:
+        return '\n'
+    elif break_type > 0:
+        return ' '
+
+    return ''
+
+
+def _bounding_poly_json_to_region(bounding_poly: 'dict | None') -> Region:
+    # Coordinates equal to 0 are left out of the saved JSON
+    if not bounding_poly:
+        return Region()
+
+    return Region.from_coordinates(
+        coordinate for vertex in bounding_poly.get('vertices', []) for coordinate in (vertex.get('x', 0), vertex.get('y', 0))
+    )
+
+
+if __name__ == '__main__':
+    """
+    Checks that the JSON loaders give the same annotations as loading the
+    responses through AnnotateImageResponse, at every max_level, for every
+    response JSON file in the given directory (data/ocr_outputs by default).
+
+    python -m ocr.google_cloud.annotation_json [directory]
+    """
+    import sys
+    import time
+
+    from ocr.google_cloud.annotation_response import (
+        load_response_as_flat_annotations,
+        load_response_as_hierarchical_annotations)
+
+    def to_comparable(annotation: Annotation):
+        bounds = [(vertex.x, vertex.y) for vertex in annotation.bounds]
+        child_annotations = getattr(annotation, 'child_annotations', [])
+        level = getattr(annotation, 'annotation_level', None)
+        return (bounds, annotation.text, level, [to_comparable(child) for child in child_annotations])
+
+    response_directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join('data', 'ocr_outputs')
+    response_files = sorted(
+        os.path.join(response_directory, file_name)
+        for file_name in os.listdir(response_directory) if file_name.endswith('.json')
+    )
+
+    proto_time = json_time = 0.0
+    mismatched_files: list[str] = []
+
+    for response_file in response_files:
+        start_time = time.perf_counter()
+        proto_flat_annotations = load_response_as_flat_annotations(response_file)
+        proto_time += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        json_flat_annotations = load_json_as_flat_annotations(response_file)
+        json_time += time.perf_counter() - start_time
+
+        is_equal = list(map(to_comparable, proto_flat_annotations)) == list(map(to_comparable, json_flat_annotations))
+
+        for max_level in AnnotationLevel:
+            start_time = time.perf_counter()
+            proto_annotations = load_response_as_hierarchical_annotations(response_file, max_level)
+            proto_time += time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            json_annotations = load_json_as_hierarchical_annotations(response_file, max_level)
+            json_time += time.perf_counter() - start_time
+
+            is_equal &= list(map(to_comparable, proto_annotations)) == list(map(to_comparable, json_annotations))
+
+        print(f'{"OK" if is_equal else "MISMATCH"}: {response_file}')
+        if not is_equal:
+            mismatched_files.append(response_file)
+
+    print(f'Loaded {len(response_files)} files: proto {proto_time:.3f}s, JSON {json_time:.3f}s')
+
+    if mismatched_files:
+        sys.exit(1)
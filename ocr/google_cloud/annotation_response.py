@@ -3,8 +3,10 @@ import os.path
 from config import Config
 from config.env_keys import OCR_OUTPUT_PATH
 from google.cloud.vision import AnnotateImageResponse
-from ocr.annotation_types import Annotation, HierarchicalAnnotation
-from ocr.google_cloud.hierarchy_annotations import process_page_hierarchy
+from ocr.annotation_types import (Annotation, AnnotationLevel,
+                                  HierarchicalAnnotation)
+from ocr.google_cloud.hierarchy_annotations import (
+    bounding_poly_to_vertex_list, process_page_hierarchy)
 from unidecode import unidecode
 from util.file_path_util import (apply_default_file_ext,
                                  create_directories_to_file)
@@ -23,10 +25,7 @@ def save_response_as_json(response: AnnotateImageResponse, file_path: str, use_d
         str: The response object represented as a JSON string
     """
     response_json = AnnotateImageResponse.to_json(response)
-    file_path = apply_default_file_ext(file_path, '.json')
-
-    if use_default_directory and OCR_OUTPUT_PATH in Config.env:
-        file_path = os.path.join(Config.env.OCR_OUTPUT_PATH, file_path)
+    file_path = get_response_json_path(file_path, use_default_directory)
 
     # Create the directories if not already made
     create_directories_to_file(file_path)
@@ -40,6 +39,26 @@ def save_response_as_json(response: AnnotateImageResponse, file_path: str, use_d
     return response_json
 
 
+def get_response_json_path(file_path: str, use_default_directory: bool = True) -> str:
+    """
+    Gets the path that save_response_as_json saves the response of the given
+    file path to.
+
+    Args:
+        file_path (str): The file path to save the JSON to
+        default_directory (bool): Whether to prepend the default OCR output directory to the file path
+
+    Returns:
+        str: The JSON file path
+    """
+    file_path = apply_default_file_ext(file_path, '.json')
+
+    if use_default_directory and OCR_OUTPUT_PATH in Config.env:
+        file_path = os.path.join(Config.env.OCR_OUTPUT_PATH, file_path)
+
+    return file_path
+
+
 def load_response_from_json(file_path: str) -> AnnotateImageResponse:
     """
     Loads a text detection response JSON file into an AnnotateImageResponse
@@ -74,29 +93,39 @@ def load_response_as_flat_annotations(file_path: str) -> list[Annotation]:
     return annotations
 
 
-def load_response_as_hierarchical_annotations(file_path: str) -> list[HierarchicalAnnotation]:
+def load_response_as_hierarchical_annotations(
+    file_path: str,
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+) -> list[HierarchicalAnnotation]:
     """
     Loads a text detection response JSON file into a list of
     HierarchicalAnnotations.
 
     Args:
         file_path (str): File path to the response JSON file
+        max_level (AnnotationLevel, optional): Lowest level of annotations to create. Defaults to AnnotationLevel.SYMBOL.
 
     Returns:
         list[HierarchicalAnnotations]: Annotations for the pages in the flyer
     """
     annotation_response = load_response_from_json(file_path)
-    hierarchical_annotations = response_to_hierarchical_annotations(annotation_response)
+    hierarchical_annotations = response_to_hierarchical_annotations(annotation_response, max_level)
 
     return hierarchical_annotations
 
 
-def response_to_hierarchical_annotations(response: AnnotateImageResponse) -> list[HierarchicalAnnotation]:
+def response_to_hierarchical_annotations(
+    response: AnnotateImageResponse,
+    max_level: AnnotationLevel = AnnotationLevel.SYMBOL,
+) -> list[HierarchicalAnnotation]:
     """
-    Converts the response into a list of HierarchicalAnnotations.
+    Converts the response into a list of HierarchicalAnnotations. Annotations
+    below max_level are not created, but their text is still included in the
+    text of their parent annotations.
 
     Args:
         response (AnnotateImageResponse): The response to convert from
+        max_level (AnnotationLevel, optional): Lowest level of annotations to create. Defaults to AnnotationLevel.SYMBOL.
 
     Returns:
         list[HierarchicalAnnotation]: Annotations of the pages in the response
@@ -104,7 +133,7 @@ def response_to_hierarchical_annotations(response: AnnotateImageResponse) -> lis
     page_annotations: list[HierarchicalAnnotation] = []
 
     for page in response.full_text_annotation.pages:
-        page_annotation = process_page_hierarchy(page)
+        page_annotation = process_page_hierarchy(page, max_level)
         page_annotations.append(page_annotation)
 
     return page_annotations
@@ -125,7 +154,7 @@ def response_to_flat_annotations(response: AnnotateImageResponse) -> list[Annota
     for text_annotation in response.text_annotations:
 
         annotation = Annotation(
-            bounds=text_annotation.bounding_poly.vertices,
+            bounds=bounding_poly_to_vertex_list(text_annotation.bounding_poly),
             text=unidecode(text_annotation.description)
         )
         annotations.append(annotation)
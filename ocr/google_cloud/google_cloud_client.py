@@ -1,13 +1,58 @@
+import os.path
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, TypeVar
 
 from config import Config
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
 from google.auth._default import load_credentials_from_file
 from google.auth.credentials import Credentials
-from google.cloud.vision import (AnnotateImageResponse, Image,
-                                 ImageAnnotatorClient)
+from google.cloud.vision import (AnnotateImageRequest, AnnotateImageResponse,
+                                 Feature, Image, ImageAnnotatorClient)
+from util.metrics import pipeline_metrics
+
+from .rate_limiter import TokenBucketRateLimiter
+
+T = TypeVar('T')
+
+# Default Cloud Vision quota for requests per minute
+DEFAULT_REQUESTS_PER_MINUTE = 1800
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# Cloud Vision limits for a single batch_annotate_images request
+MAX_IMAGES_PER_BATCH = 16
+MAX_BATCH_REQUEST_BYTES = 10 * 1024 * 1024
+
+RETRYABLE_EXCEPTIONS = (ResourceExhausted, ServiceUnavailable)
+
+
+class TextDetectionError(RuntimeError):
+    """Text detection failed for an image, as reported by the error of its response."""
 
 
 class GoogleCloudClient:
     _image_annotator_client = None
+    _rate_limiter = None
+
+    def __init__(
+        self,
+        image_annotator_client: ImageAnnotatorClient = None,
+        requests_per_minute: float = None,
+        max_retries: int = 5,
+        initial_backoff: float = 1.0,
+    ):
+        """
+        Args:
+            image_annotator_client (ImageAnnotatorClient, optional): Client to send requests with. Defaults to a client using the configured credentials.
+            requests_per_minute (float, optional): Maximum request rate. Defaults to the `--ocr-requests-per-minute` argument.
+            max_retries (int, optional): Number of retries on RESOURCE_EXHAUSTED/UNAVAILABLE errors. Defaults to 5.
+            initial_backoff (float, optional): Seconds to wait before the first retry, doubled on each retry. Defaults to 1.0.
+        """
+        self._image_annotator_client = image_annotator_client
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
 
     @property
     def image_annotator_client(self):
@@ -15,6 +60,13 @@ class GoogleCloudClient:
             self._image_annotator_client = ImageAnnotatorClient(credentials=load_google_cloud_credentials())
         return self._image_annotator_client
 
+    @property
+    def rate_limiter(self):
+        if self._rate_limiter is None:
+            requests_per_minute = self.requests_per_minute or Config.args.ocr_requests_per_minute or DEFAULT_REQUESTS_PER_MINUTE
+            self._rate_limiter = TokenBucketRateLimiter(requests_per_minute)
+        return self._rate_limiter
+
     def request_text_detection(self, path):
         """
         Requests text detection from Google Cloud on the given image.
@@ -23,22 +75,228 @@ class GoogleCloudClient:
         result in billing charges. Be careful when using this.
 
         Args:
-            path (PathLike): The file path to image to perform text detection on
+            path (PathLike | bytes): The file path to image to perform text detection on, or the encoded image itself
+
+        Raises:
+            TextDetectionError: If the response reports that text detection failed
 
         Returns:
             AnnotateImageResponse: The resulting annotation response.
         """
         client = self.image_annotator_client
 
-        with open(path, 'rb') as image_file:
-            content = image_file.read()
-
-        image = Image(content=content)
+        image = Image(content=_read_image_content(path))
 
-        response: AnnotateImageResponse = client.text_detection(image=image)
+        response: AnnotateImageResponse = self._request_with_backoff(lambda: client.text_detection(image=image))
+        _raise_for_response_error(response)
 
         return response
 
+    def iter_text_detections(
+        self,
+        paths: list,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    ) -> Iterator[tuple[int, 'AnnotateImageResponse | None', 'Exception | None']]:
+        """
+        Requests text detection from Google Cloud on each of the given images
+        using a pool of threads. At most max_in_flight requests are made at
+        once, and requests are rate limited by the client's rate limiter.
+
+        Responses are yielded as they complete, so they can be saved before
+        the other requests finish. A failed request yields its error instead
+        of stopping the other requests.
+
+        WARNING: This function will make requests to Google Cloud and could
+        result in billing charges. Be careful when using this.
+
+        Args:
+            paths (list[PathLike | bytes]): The file paths to the images to perform text detection on, or the encoded images
+            max_in_flight (int, optional): Maximum number of concurrent requests. Defaults to DEFAULT_MAX_IN_FLIGHT.
+
+        Yields:
+            tuple[int, AnnotateImageResponse | None, Exception | None]: The index of the image in paths, and its response or the error of its request
+        """
+        if max_in_flight < 1:
+            raise ValueError(f'max_in_flight must be at least 1, got {max_in_flight}.')
+
+        # Create the shared client and rate limiter before the threads use them
+        self.image_annotator_client
+        self.rate_limiter
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            path_indices = {executor.submit(self.request_text_detection, path): path_idx for path_idx, path in enumerate(paths)}
+
+            for future in as_completed(path_indices):
+                try:
+                    yield path_indices[future], future.result(), None
+                except Exception as error:
+                    yield path_indices[future], None, error
+
+    def iter_batch_text_detections(
+        self,
+        paths: list,
+        batch_size: int = MAX_IMAGES_PER_BATCH,
+        max_in_flight: int = 1,
+    ) -> Iterator[tuple[int, 'AnnotateImageResponse | None', 'Exception | None']]:
+        """
+        Requests text detection from Google Cloud on the given images, sending
+        up to batch_size images in each batch_annotate_images request. A batch
+        is also split early if its image content would exceed
+        MAX_BATCH_REQUEST_BYTES. Up to max_in_flight batches are requested
+        concurrently.
+
+        The responses of each batch are yielded as the batch completes. Every
+        image of a failed batch yields the error of the batch request, and an
+        image whose response reports an error yields a TextDetectionError.
+
+        WARNING: This function will make requests to Google Cloud and could
+        result in billing charges. Be careful when using this.
+
+        Args:
+            paths (list[PathLike | bytes]): The file paths to the images to perform text detection on, or the encoded images
+            batch_size (int, optional): Maximum number of images per request. Defaults to MAX_IMAGES_PER_BATCH.
+            max_in_flight (int, optional): Maximum number of concurrent requests. Defaults to 1.
+
+        Raises:
+            ValueError: If batch_size is not between 1 and MAX_IMAGES_PER_BATCH
+
+        Yields:
+            tuple[int, AnnotateImageResponse | None, Exception | None]: The index of the image in paths, and its response or the error of its request
+        """
+        if not 1 <= batch_size <= MAX_IMAGES_PER_BATCH:
+            raise ValueError(f'batch_size must be between 1 and {MAX_IMAGES_PER_BATCH}, got {batch_size}.')
+
+        if max_in_flight < 1:
+            raise ValueError(f'max_in_flight must be at least 1, got {max_in_flight}.')
+
+        batches = _group_paths_into_batches(paths, batch_size)
+
+        # Create the shared client and rate limiter before the threads use them
+        self.image_annotator_client
+        self.rate_limiter
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            # The range of path indices of each batch, by its request
+            batch_path_indices = {}
+            batch_start = 0
+            for batch in batches:
+                batch_path_indices[executor.submit(self._request_text_detection_batch, batch)] = range(batch_start, batch_start + len(batch))
+                batch_start += len(batch)
+
+            for future in as_completed(batch_path_indices):
+                try:
+                    batch_responses = future.result()
+                except Exception as error:
+                    for path_idx in batch_path_indices[future]:
+                        yield path_idx, None, error
+                    continue
+
+                for path_idx, response in zip(batch_path_indices[future], batch_responses):
+                    try:
+                        _raise_for_response_error(response)
+                    except TextDetectionError as error:
+                        yield path_idx, None, error
+                        continue
+
+                    yield path_idx, response, None
+
+    def _request_text_detection_batch(self, paths: list) -> list[AnnotateImageResponse]:
+        """
+        Requests text detection for all of the given images in a single
+        batch_annotate_images request and splits the response per image.
+        """
+        client = self.image_annotator_client
+        text_detection_feature = Feature(type_=Feature.Type.TEXT_DETECTION)
+
+        requests: list[AnnotateImageRequest] = []
+        for path in paths:
+            request = AnnotateImageRequest(image=Image(content=_read_image_content(path)), features=[text_detection_feature])
+            requests.append(request)
+
+        batch_response = self._request_with_backoff(lambda: client.batch_annotate_images(requests=requests))
+        responses: list[AnnotateImageResponse] = list(batch_response.responses)
+
+        if len(responses) != len(paths):
+            raise RuntimeError(f'Expected {len(paths)} responses from batch request, got {len(responses)}.')
+
+        return responses
+
+    def _request_with_backoff(self, request: Callable[[], T]) -> T:
+        """
+        Makes the request once a rate limit token is available. Retries with
+        exponential backoff and jitter when the request fails with
+        RESOURCE_EXHAUSTED or UNAVAILABLE.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+
+            try:
+                pipeline_metrics.increment('ocr_requests')
+                with pipeline_metrics.stage('ocr_request'):
+                    return request()
+            except RETRYABLE_EXCEPTIONS as error:
+                if attempt == self.max_retries:
+                    raise
+
+                pipeline_metrics.increment('ocr_retries')
+
+                backoff = self.initial_backoff * (2 ** attempt)
+                backoff += random.uniform(0, backoff / 2)
+
+                if Config.args.verbose:
+                    print(f'[OCR] Request failed with "{error}", retrying in {backoff:.2f}s.')
+
+                time.sleep(backoff)
+
+
+def _raise_for_response_error(response: AnnotateImageResponse) -> None:
+    """
+    Raises a TextDetectionError if the response reports that text detection
+    failed, so the failed response is never saved as an annotation.
+    """
+    if response.error.code:
+        raise TextDetectionError(f'Text detection failed with code {response.error.code}: {response.error.message}')
+
+
+def _group_paths_into_batches(paths: list, batch_size: int) -> list[list]:
+    """
+    Splits the paths into consecutive batches of at most batch_size paths
+    whose files total at most MAX_BATCH_REQUEST_BYTES. A single file larger
+    than the byte limit is put into its own batch. Encoded images can be
+    given in place of paths.
+    """
+    batches: list[list] = []
+    current_batch: list = []
+    current_batch_bytes = 0
+
+    for path in paths:
+        file_size = len(path) if isinstance(path, bytes) else os.path.getsize(path)
+
+        is_batch_full = len(current_batch) >= batch_size or current_batch_bytes + file_size > MAX_BATCH_REQUEST_BYTES
+        if current_batch and is_batch_full:
+            batches.append(current_batch)
+            current_batch = []
+            current_batch_bytes = 0
+
+        current_batch.append(path)
+        current_batch_bytes += file_size
+
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+
+def _read_image_content(path) -> bytes:
+    """
+    Reads the image file at the path, returning encoded images as is.
+    """
+    if isinstance(path, bytes):
+        return path
+
+    with open(path, 'rb') as image_file:
+        return image_file.read()
+
 
 def load_google_cloud_credentials() -> Credentials:
     """
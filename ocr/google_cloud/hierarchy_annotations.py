@@ -5,12 +5,15 @@ from unidecode import unidecode
 from util.image_space import Region, Vertex
 
 
-def process_page_hierarchy(page: Page) -> HierarchicalAnnotation:
+def process_page_hierarchy(page: Page, max_level: AnnotationLevel = AnnotationLevel.SYMBOL) -> HierarchicalAnnotation:
     """
-    Processes a page as a HierarchicalAnnotation.
+    Processes a page as a HierarchicalAnnotation. Annotations below max_level
+    are not created, but their text is still included in the text of their
+    parent annotations.
 
     Args:
         page (Page): Page to process
+        max_level (AnnotationLevel, optional): Lowest level of annotations to create. Defaults to AnnotationLevel.SYMBOL.
 
     Returns:
         HierarchicalAnnotation: Resulting annotation
@@ -18,30 +21,34 @@ def process_page_hierarchy(page: Page) -> HierarchicalAnnotation:
     block_annotations: list[HierarchicalAnnotation] = []
     page_text = ''
 
-    for block in page.blocks:
-        block_annotation = process_block_hierarchy(block)
-        page_text += block_annotation.text
-        block_annotations.append(block_annotation)
+    if is_level_included(AnnotationLevel.BLOCK, max_level):
+        for block in page.blocks:
+            block_annotation = process_block_hierarchy(block, max_level)
+            page_text += block_annotation.text
+            block_annotations.append(block_annotation)
+    else:
+        page_text = ''.join(map(get_block_text, page.blocks))
 
     # Pages don't have bounds, use (0, 0) and (width, height) as corners
-    vertices = [
+    vertices = Region([
         Vertex(0, 0),
         Vertex(page.width, 0),
         Vertex(page.width, page.height),
         Vertex(0, page.height),
-    ]
+    ])
     page_annotation = HierarchicalAnnotation(bounds=vertices, text=page_text,
                                              annotation_level=AnnotationLevel.PAGE, child_annotations=block_annotations)
 
     return page_annotation
 
 
-def process_block_hierarchy(block: Block) -> HierarchicalAnnotation:
+def process_block_hierarchy(block: Block, max_level: AnnotationLevel = AnnotationLevel.SYMBOL) -> HierarchicalAnnotation:
     """
     Processes a block as a HierarchicalAnnotation.
 
     Args:
         block (Block): Block to process
+        max_level (AnnotationLevel, optional): Lowest level of annotations to create. Defaults to AnnotationLevel.SYMBOL.
 
     Returns:
         HierarchicalAnnotation: Resulting annotation
@@ -49,10 +56,13 @@ def process_block_hierarchy(block: Block) -> HierarchicalAnnotation:
     paragraph_annotations: list[HierarchicalAnnotation] = []
     block_text = ''
 
-    for paragraph in block.paragraphs:
-        paragraph_annotation = process_paragraph_hierarchy(paragraph)
-        block_text += paragraph_annotation.text
-        paragraph_annotations.append(paragraph_annotation)
+    if is_level_included(AnnotationLevel.PARA, max_level):
+        for paragraph in block.paragraphs:
+            paragraph_annotation = process_paragraph_hierarchy(paragraph, max_level)
+            block_text += paragraph_annotation.text
+            paragraph_annotations.append(paragraph_annotation)
+    else:
+        block_text = get_block_text(block)
 
     vertices = bounding_poly_to_vertex_list(block.bounding_box)
     block_annotation = HierarchicalAnnotation(bounds=vertices, text=block_text,
@@ -61,12 +71,13 @@ def process_block_hierarchy(block: Block) -> HierarchicalAnnotation:
     return block_annotation
 
 
-def process_paragraph_hierarchy(paragraph: Paragraph) -> HierarchicalAnnotation:
+def process_paragraph_hierarchy(paragraph: Paragraph, max_level: AnnotationLevel = AnnotationLevel.SYMBOL) -> HierarchicalAnnotation:
     """
     Processes a paragraph as a HierarchicalAnnotation.
 
     Args:
         paragraph (Paragraph): Paragraph to process
+        max_level (AnnotationLevel, optional): Lowest level of annotations to create. Defaults to AnnotationLevel.SYMBOL.
 
     Returns:
         HierarchicalAnnotation: Resulting annotation
@@ -74,10 +85,13 @@ def process_paragraph_hierarchy(paragraph: Paragraph) -> HierarchicalAnnotation:
     word_annotations: list[HierarchicalAnnotation] = []
     paragraph_text = ''
 
-    for word in paragraph.words:
-        word_annotation = process_word_hierarchy(word)
-        paragraph_text += word_annotation.text
-        word_annotations.append(word_annotation)
+    if is_level_included(AnnotationLevel.WORD, max_level):
+        for word in paragraph.words:
+            word_annotation = process_word_hierarchy(word, max_level)
+            paragraph_text += word_annotation.text
+            word_annotations.append(word_annotation)
+    else:
+        paragraph_text = get_paragraph_text(paragraph)
 
     vertices = bounding_poly_to_vertex_list(paragraph.bounding_box)
     paragraph_annotation = HierarchicalAnnotation(bounds=vertices, text=paragraph_text,
@@ -86,12 +100,13 @@ def process_paragraph_hierarchy(paragraph: Paragraph) -> HierarchicalAnnotation:
     return paragraph_annotation
 
 
-def process_word_hierarchy(word: Word) -> list[HierarchicalAnnotation]:
+def process_word_hierarchy(word: Word, max_level: AnnotationLevel = AnnotationLevel.SYMBOL) -> list[HierarchicalAnnotation]:
     """
     Processes a word as a HierarchicalAnnotation.
 
     Args:
         word (Word): Word to process
+        max_level (AnnotationLevel, optional): Lowest level of annotations to create. Defaults to AnnotationLevel.SYMBOL.
 
     Returns:
         HierarchicalAnnotation: Resulting annotation
@@ -99,10 +114,13 @@ def process_word_hierarchy(word: Word) -> list[HierarchicalAnnotation]:
     symbol_annotations: list[HierarchicalAnnotation] = []
     word_text = ''
 
-    for symbol in word.symbols:
-        symbol_annotation = process_symbol_hierarchy(symbol)
-        word_text += symbol_annotation.text
-        symbol_annotations.append(symbol_annotation)
+    if is_level_included(AnnotationLevel.SYMBOL, max_level):
+        for symbol in word.symbols:
+            symbol_annotation = process_symbol_hierarchy(symbol)
+            word_text += symbol_annotation.text
+            symbol_annotations.append(symbol_annotation)
+    else:
+        word_text = get_word_text(word)
 
     vertices = bounding_poly_to_vertex_list(word.bounding_box)
     word_annotation = HierarchicalAnnotation(bounds=vertices, text=word_text,
@@ -121,6 +139,38 @@ def process_symbol_hierarchy(symbol: Symbol) -> HierarchicalAnnotation:
     Returns:
         HierarchicalAnnotation: Resulting annotation
     """
+    symbol_text = get_symbol_text(symbol)
+
+    vertices = bounding_poly_to_vertex_list(symbol.bounding_box)
+    symbol_annotation = HierarchicalAnnotation(
+        bounds=vertices, text=symbol_text, annotation_level=AnnotationLevel.SYMBOL)
+
+    return symbol_annotation
+
+
+def get_block_text(block: Block) -> str:
+    return ''.join(map(get_paragraph_text, block.paragraphs))
+
+
+def get_paragraph_text(paragraph: Paragraph) -> str:
+    return ''.join(map(get_word_text, paragraph.words))
+
+
+def get_word_text(word: Word) -> str:
+    return ''.join(map(get_symbol_text, word.symbols))
+
+
+def get_symbol_text(symbol: Symbol) -> str:
+    """
+    Gets the text of a symbol, including the character of the break detected
+    before or after the symbol.
+
+    Args:
+        symbol (Symbol): Symbol to get the text of
+
+    Returns:
+        str: The text of the symbol
+    """
     symbol_text = unidecode(symbol.text)
     detected_break = symbol.property.detected_break
     break_type = detected_break.type_
@@ -141,22 +191,26 @@ def process_symbol_hierarchy(symbol: Symbol) -> HierarchicalAnnotation:
         else:
             symbol_text = symbol_text + break_character
 
-    vertices = bounding_poly_to_vertex_list(symbol.bounding_box)
-    symbol_annotation = HierarchicalAnnotation(
-        bounds=vertices, text=symbol_text, annotation_level=AnnotationLevel.SYMBOL)
+    return symbol_text
 
-    return symbol_annotation
+
+def is_level_included(annotation_level: AnnotationLevel, max_level: AnnotationLevel) -> bool:
+    """
+    Checks if annotations of the given level are created when annotations
+    below max_level are left out.
+    """
+    return annotation_level.value <= max_level.value
 
 
 def bounding_poly_to_vertex_list(bounding_poly: BoundingPoly) -> Region:
     """
-    Converts a BoundingPoly object to a list of vertices
+    Converts a BoundingPoly object to a Region
 
     Args:
         bounding_poly (BoundingPoly): The object to convert
 
     Returns:
-        Region: The list of vertices
+        Region: The region of the vertices
     """
-    vertices = [Vertex.from_dict(vertex) for vertex in bounding_poly.vertices]
+    vertices = Region(map(Vertex.from_dict, bounding_poly.vertices))
     return vertices
@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class TokenBucketRateLimiter:
+    """
+    Thread-safe token bucket used to keep requests under a per-minute quota.
+
+    The bucket holds at most `capacity` tokens and is refilled continuously at
+    `requests_per_minute / 60` tokens per second. Each request consumes one
+    token, blocking until a token is available.
+    """
+
+    def __init__(self, requests_per_minute: float, capacity: float = None):
+        if requests_per_minute <= 0:
+            raise ValueError(f'requests_per_minute must be positive, got {requests_per_minute}.')
+
+        self.refill_rate = requests_per_minute / 60
+        self.capacity = capacity if capacity is not None else max(1.0, self.refill_rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_rate)
+        self._last_refill = now
+
+    def try_acquire(self) -> bool:
+        """
+        Consumes a token if one is available.
+
+        Returns:
+            bool: Whether a token was consumed
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        """
+        Blocks until a token is available, then consumes it.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_time = (1 - self._tokens) / self.refill_rate
+
+            time.sleep(wait_time)
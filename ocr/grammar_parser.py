@@ -7,6 +7,7 @@ from nltk.stem import PorterStemmer, WordNetLemmatizer
 from nltk.tag import PerceptronTagger
 from nltk.tree import Tree
 from util.constants import STOP_WORDS
+from util.metrics import pipeline_metrics
 
 if Config.args.download:
     nltk.download("averaged_perceptron_tagger")
@@ -102,6 +103,7 @@ class PhraseExtractor:
         return accepted
 
     @staticmethod
+    @pipeline_metrics.timed('phrase_chunking')
     def extract_phrases(text: str, grammar: str) -> list[str]:
         if not text:
             return []
@@ -11,17 +11,22 @@ from util.string_parse import (string_to_any_safe, string_to_float_safe,
 from ocr.grammar_parser import Grammar, PhraseExtractor
 
 from .annotation_types import HierarchicalAnnotation
+from .block_text_view import BlockTextView, get_block_text_view
 
 
 def extract_components_from_block(block_annotation: HierarchicalAnnotation) -> list[AdBlockComponent]:
     """
-    Extracts all of the ad block components from a given block.
+    Extracts all of the ad block components from a given block. The text
+    view of the block is created once and shared by all of the extractors.
 
     TODO: Improve analysis further by adding additional rules or
     features.
     """
     components: AdBlockComponent = []
     component_types_found: set[AdBlockComponentType] = set()
+    text_view = get_block_text_view(block_annotation.text)
+    product_description_component = None
+    is_product_description_extracted = False
 
     component_extractors = [
         (AdBlockComponentType.PRODUCT_NAME, extract_product_name_component),
@@ -41,13 +46,19 @@ def extract_components_from_block(block_annotation: HierarchicalAnnotation) -> l
         )):
             continue
 
-        component = component_extractor(block_annotation)
+        component = component_extractor(block_annotation, text_view)
         if component is not None:
             components.append(component)
 
+        if component_type == AdBlockComponentType.PRODUCT_DESCRIPTION:
+            product_description_component = component
+            is_product_description_extracted = True
+
     if not components:
         # Check if product description if no other components found
-        product_description_component = extract_product_description_component(block_annotation)
+        if not is_product_description_extracted:
+            product_description_component = extract_product_description_component(block_annotation, text_view)
+
         if product_description_component:
             components.append(product_description_component)
         else:
@@ -61,12 +72,16 @@ def extract_components_from_block(block_annotation: HierarchicalAnnotation) -> l
     return components
 
 
-def extract_product_code_component(block: HierarchicalAnnotation) -> 'AdBlockComponent | None':
+def extract_product_code_component(
+    block: HierarchicalAnnotation,
+    text_view: BlockTextView = None,
+) -> 'AdBlockComponent | None':
     """
     Extracts the product code from the text. The product code is set in the
     environment configuration.
     """
-    text = ' '.join(block.text.split())
+    text_view = text_view or get_block_text_view(block.text)
+    text = text_view.normalized_text
 
     product_code_regex = Config.env.PRODUCT_CODE_REGEX
     multi_product_code_regex = product_code_regex + r'([-\/ ]' + product_code_regex + r')?'
@@ -86,11 +101,15 @@ def extract_product_code_component(block: HierarchicalAnnotation) -> 'AdBlockCom
     return product_code_component
 
 
-def extract_quantity_component(block: HierarchicalAnnotation) -> 'AdBlockComponent | None':
+def extract_quantity_component(
+    block: HierarchicalAnnotation,
+    text_view: BlockTextView = None,
+) -> 'AdBlockComponent | None':
     """
     Extracts the quantity/measurement of the block (e.g. "4 lb" or "2.1kg")
     """
-    text = ' '.join(block.text.split())
+    text_view = text_view or get_block_text_view(block.text)
+    text = text_view.normalized_text
 
     # Check if the measurement is "PKG OF N"
     package_unit_pattern = '|'.join(PACKAGE_MEASURE_WORD_LIST)
@@ -151,12 +170,16 @@ def extract_quantity_component(block: HierarchicalAnnotation) -> 'AdBlockCompone
     return quantity_component
 
 
-def extract_price_component(block: HierarchicalAnnotation) -> 'AdBlockComponent | None':
+def extract_price_component(
+    block: HierarchicalAnnotation,
+    text_view: BlockTextView = None,
+) -> 'AdBlockComponent | None':
     """
     Extracts the price in cents from the given text. If no price is found, None
     will be returned instead.
     """
-    text = ' '.join(block.text.lower().split())
+    text_view = text_view or get_block_text_view(block.text)
+    text = text_view.lower_text
 
     # Is price a X/$Y format? (e.g. 2/$3 or 3 for $4)
     x_for_y_regex_pattern = r'(\d+) ?(\/|for) ?([\$s] ?)?(\d+(\.\d+)?)'
@@ -215,12 +238,16 @@ def extract_price_component(block: HierarchicalAnnotation) -> 'AdBlockComponent
     return price_component
 
 
-def extract_promotion_component(block: HierarchicalAnnotation) -> 'AdBlockComponent | None':
+def extract_promotion_component(
+    block: HierarchicalAnnotation,
+    text_view: BlockTextView = None,
+) -> 'AdBlockComponent | None':
     """
     Extracts the promotion component from a block. Promotions are
     determined by a percentage value or by promotional keywords.
     """
-    text = ' '.join(block.text.split())
+    text_view = text_view or get_block_text_view(block.text)
+    text = text_view.normalized_text
 
     # Check if has BOGO or BNGO (Buy N Get One) promotion
     bogo_pattern = r'(buy (\d|one) (and ?)?get (1|one)( free)?)|\bbogo\b'
@@ -267,7 +294,7 @@ def extract_promotion_component(block: HierarchicalAnnotation) -> 'AdBlockCompon
     # Only consider to be promotion if have value AND promotion text
     promotion = None
     for promotion_word in PROMOTION_WORDS:
-        if promotion_word in text.lower():
+        if promotion_word in text_view.lower_text:
             promotion = Promotion(
                 promotion_type=promotion_type,
                 amount=full_amount_string,
@@ -287,11 +314,15 @@ def extract_promotion_component(block: HierarchicalAnnotation) -> 'AdBlockCompon
     return promotion_component
 
 
-def extract_price_unit_component(block: HierarchicalAnnotation) -> 'AdBlockComponent | None':
+def extract_price_unit_component(
+    block: HierarchicalAnnotation,
+    text_view: BlockTextView = None,
+) -> 'AdBlockComponent | None':
     """
     Extract the unit of the price from a block.
     """
-    text = ' '.join(block.text.lower().split())
+    text_view = text_view or get_block_text_view(block.text)
+    text = text_view.lower_text
 
     price_unit = None
 
@@ -359,11 +390,15 @@ def extract_price_unit_component(block: HierarchicalAnnotation) -> 'AdBlockCompo
     return price_unit_component
 
 
-def extract_product_name_component(block: HierarchicalAnnotation) -> 'AdBlockComponent | None':
+def extract_product_name_component(
+    block: HierarchicalAnnotation,
+    text_view: BlockTextView = None,
+) -> 'AdBlockComponent | None':
     """
     Extracts the product name by using noun phrases.
     """
-    text = block.text
+    text_view = text_view or get_block_text_view(block.text)
+    text = text_view.text
 
     # Filter out company-specific product names
     ignore_in_product_name_string = Config.env.IGNORE_IN_PRODUCT_NAME
@@ -412,15 +447,19 @@ def extract_product_name_component(block: HierarchicalAnnotation) -> 'AdBlockCom
     return product_name_component
 
 
-def extract_product_description_component(block: HierarchicalAnnotation) -> 'AdBlockComponent | None':
+def extract_product_description_component(
+    block: HierarchicalAnnotation,
+    text_view: BlockTextView = None,
+) -> 'AdBlockComponent | None':
     """
     Extracts the product description using basic rules.
     """
-    text = ' '.join(block.text.split())
+    text_view = text_view or get_block_text_view(block.text)
+    text = text_view.normalized_text
     if text.isnumeric():
         return None
 
-    num_words = len(text.split())
+    num_words = len(text_view.tokens)
     if num_words < 5:
         return None
 
@@ -2,19 +2,25 @@ import re
 from collections import defaultdict
 from typing import Any
 
+import numpy as np
 from flyer.flyer_components import (AdBlock, AdBlockComponent,
                                     AdBlockComponentType, CategoryPrediction,
                                     Flyer, FlyerType, Page, PageType, Product)
 from product_classification_data import product_classifier
+from util.box_kernels import get_region_areas, get_region_distance_matrix
 from util.constants import HOLIDAY_WORD_LIST
-from util.image_space import (Region, Vertex, distance_between_regions,
-                              get_region_area)
+from util.image_space import Region, as_region, distance_between_regions
+from util.metrics import pipeline_metrics
 
-from ocr.get_annotations import find_annotations_in_region
+from ocr.get_annotations import (build_annotation_index,
+                                 find_annotations_in_region)
 
 from .annotation_types import HierarchicalAnnotation
 from .ocr_flyer_analysis import extract_components_from_block
 
+# Distances within this many pixels of the nearest distance are compared again with shapely
+NEAREST_DISTANCE_TOLERANCE = 1e-6
+
 
 def construct_flyer_from_pages(pages: list[Page], flyer_name: str) -> Flyer:
     """
@@ -102,13 +108,16 @@ def process_segmented_page_annotation(page_number: int, page_file_name: str, pag
     """
     ad_blocks: list[AdBlock] = []
 
+    # Index the blocks once so each segment only tests the blocks near it
+    block_index = build_annotation_index(page_annotation.child_annotations)
+
     # Create an ad block for each segment
     for segment_bounds in page_segmentation:
 
         all_ad_block_components: defaultdict[AdBlockComponentType, list[AdBlockComponent]] = defaultdict(list)
 
         # Get all block annotations in the segmented block
-        block_annotations = find_annotations_in_region(page_annotation.child_annotations, segment_bounds)
+        block_annotations = find_annotations_in_region(page_annotation.child_annotations, segment_bounds, block_index)
 
         for block_annotation in block_annotations:
             ad_block_components = extract_components_from_block(block_annotation)
@@ -213,7 +222,8 @@ def construct_segmented_block_from_components(components: defaultdict[AdBlockCom
     # Get the category from the product classifier
     product_category, confidence = None, None
     if product_name:
-        product_category, confidence = product_classifier.classify(product_name)
+        with pipeline_metrics.stage('classification'):
+            product_category, confidence = product_classifier.classify(product_name)
 
     product = Product(
         name=product_name,
@@ -249,17 +259,23 @@ def construct_ad_blocks_from_components(components: defaultdict[AdBlockComponent
         list[AdBlock]: The resulting ad blocks
     """
     ad_blocks: list[AdBlock] = []
+    price_components = components[AdBlockComponentType.PRODUCT_PRICE]
 
-    for price_component in components[AdBlockComponentType.PRODUCT_PRICE]:
-        nearest_components: dict[AdBlockComponentType, AdBlockComponent] = {}
-        # Take closest components and group them into an ad block
-        for component_type in AdBlockComponentType:
-            # Skip UNKNOWN and PRODUCT_PRICE components
-            if component_type == AdBlockComponentType.UNKNOWN or component_type == AdBlockComponentType.PRODUCT_PRICE:
-                continue
+    # Find the closest component of each type to every price at once
+    nearest_components_by_type: dict[AdBlockComponentType, list[AdBlockComponent]] = {}
+    for component_type in AdBlockComponentType:
+        # Skip UNKNOWN and PRODUCT_PRICE components
+        if component_type == AdBlockComponentType.UNKNOWN or component_type == AdBlockComponentType.PRODUCT_PRICE:
+            continue
 
-            nearest_component = get_nearest_component(price_component, components[component_type])
-            nearest_components[component_type] = nearest_component
+        nearest_components_by_type[component_type] = get_nearest_components(price_components, components[component_type])
+
+    for price_idx, price_component in enumerate(price_components):
+        # Take closest components and group them into an ad block
+        nearest_components: dict[AdBlockComponentType, AdBlockComponent] = {
+            component_type: nearest_components_of_type[price_idx]
+            for component_type, nearest_components_of_type in nearest_components_by_type.items()
+        }
 
         product_name = _get_component_value(nearest_components[AdBlockComponentType.PRODUCT_NAME])
         product_description = _get_component_value(nearest_components[AdBlockComponentType.PRODUCT_DESCRIPTION])
@@ -308,23 +324,62 @@ def get_nearest_component(from_component: AdBlockComponent, component_list: list
     return nearest_component
 
 
+def get_nearest_components(
+    from_components: list[AdBlockComponent],
+    component_list: list[AdBlockComponent],
+) -> list[AdBlockComponent]:
+    """
+    Gets the nearest component out of a list of components for each of the
+    from components. Equivalent to calling get_nearest_component for each
+    from component, using one distance matrix.
+
+    Components within NEAREST_DISTANCE_TOLERANCE of the nearest distance are
+    compared again with get_nearest_component, since the matrix distances of
+    boxes can differ from shapely's by a rounding error.
+
+    Args:
+        from_components (list[AdBlockComponent]): The components to measure from
+        component_list (list[AdBlockComponent]): Components to measure
+
+    Returns:
+        list[AdBlockComponent]: The nearest component to each from component
+    """
+    if not component_list:
+        return [None] * len(from_components)
+
+    distance_matrix = get_region_distance_matrix([component.bounds for component in from_components],
+                                                 [component.bounds for component in component_list])
+
+    nearest_components: list[AdBlockComponent] = []
+    for from_component, distances in zip(from_components, distance_matrix):
+        finite_distances = distances[np.isfinite(distances)]
+        if len(finite_distances) == 0:
+            nearest_components.append(None)
+            continue
+
+        candidate_indices = np.flatnonzero(distances <= finite_distances.min() + NEAREST_DISTANCE_TOLERANCE)
+
+        if len(candidate_indices) == 1:
+            nearest_components.append(component_list[candidate_indices[0]])
+        else:
+            candidate_components = [component_list[component_idx] for component_idx in candidate_indices]
+            nearest_components.append(get_nearest_component(from_component, candidate_components))
+
+    return nearest_components
+
+
 def get_component_group_bounds(components: list[AdBlockComponent]) -> Region:
     """
     Gets the minimum bounds that contains all of the components.
     """
-    all_vertices = [vertex for component in components for vertex in component.bounds]
-    x_values = [vertex.x for vertex in all_vertices]
-    y_values = [vertex.y for vertex in all_vertices]
-
-    min_x, max_x = min(x_values), max(x_values)
-    min_y, max_y = min(y_values), max(y_values)
-
-    group_bounds = [
-        Vertex(min_x, min_y),
-        Vertex(min_x, max_y),
-        Vertex(max_x, max_y),
-        Vertex(max_x, min_y),
-    ]
+    component_extents = [as_region(component.bounds).extent for component in components if len(component.bounds) > 0]
+
+    min_x = min(extent[0] for extent in component_extents)
+    min_y = min(extent[1] for extent in component_extents)
+    max_x = max(extent[2] for extent in component_extents)
+    max_y = max(extent[3] for extent in component_extents)
+
+    group_bounds = Region.from_bounds(min_x, min_y, max_x, max_y)
 
     return group_bounds
 
@@ -335,12 +390,16 @@ def get_biggest_component(components: list[AdBlockComponent]) -> tuple[AdBlockCo
     """
     biggest_component_idx = None
     biggest_component_size = 0
+
+    component_areas = get_region_areas([component.bounds if component is not None else Region()
+                                        for component in components])
+
     for component_idx in range(len(components)):
         component = components[component_idx]
         if component is None or component.value is None:
             continue
 
-        component_area = get_region_area(component.bounds)
+        component_area = component_areas[component_idx]
         if component_area > biggest_component_size:
             biggest_component_size = component_area
             biggest_component_idx = component_idx
@@ -1,12 +1,367 @@
+import json
+import math
+import os
+import os.path
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Iterable, Iterator
+
+import cv2
 import fitz
+import numpy as np
+from pipeline.flyer_preprocess import encode_image
 from util.file_path_util import (apply_default_file_ext,
+                                 create_directories_to_file,
                                  get_file_name_without_ext)
+from util.image_space import Region
+from util.metrics import pipeline_metrics
+
+# Decrease file size
+DEFAULT_PDF_ZOOM = 0.5
+
+# Largest number of pixels in a page rendered with an adaptive zoom by default
+DEFAULT_PAGE_PIXEL_BUDGET = 4_000_000
+
+# Height in pixels that the small text of a page is rendered at with an adaptive zoom by default
+DEFAULT_MIN_TEXT_HEIGHT = 16
+
+# Percentile of the text sizes of a page that is taken as its small text size
+SMALL_TEXT_PERCENTILE = 10
+
+
+@dataclass(frozen=True)
+class AdaptiveZoom:
+    """
+    Picks the zoom of each PDF page so that the small text of the page is
+    rendered min_text_height pixels tall, without the page going over
+    pixel_budget pixels. Pages without text are zoomed to the pixel budget.
+    The zoom is kept between min_zoom and max_zoom.
+    """
+    pixel_budget: int = DEFAULT_PAGE_PIXEL_BUDGET
+    min_text_height: float = DEFAULT_MIN_TEXT_HEIGHT
+    min_zoom: float = 0.25
+    max_zoom: float = 4.0
+
+    def get_page_zoom(self, page: fitz.Page) -> float:
+        page_area = page.rect.width * page.rect.height
+        if page_area <= 0:
+            return self.min_zoom
+
+        zoom = math.sqrt(self.pixel_budget / page_area)
+
+        small_text_size = get_small_text_size(page)
+        if small_text_size is not None:
+            zoom = min(zoom, self.min_text_height / small_text_size)
+
+        return min(max(zoom, self.min_zoom), self.max_zoom)
+
+
+def get_small_text_size(page: fitz.Page) -> 'float | None':
+    """
+    Estimates the size in points of the small text of a PDF page, as the
+    SMALL_TEXT_PERCENTILE percentile of the font sizes of its text spans.
+    Returns None if the page has no text, such as a scanned page.
+    """
+    text_sizes = [
+        span['size']
+        for block in page.get_text('dict')['blocks'] if block['type'] == 0
+        for line in block['lines']
+        for span in line['spans'] if span['text'].strip() and span['size'] > 0
+    ]
+
+    if not text_sizes:
+        return None
+
+    return float(np.percentile(text_sizes, SMALL_TEXT_PERCENTILE))
+
+
+def get_page_zoom(page: fitz.Page, zoom: 'float | AdaptiveZoom') -> float:
+    """
+    Gets the zoom that the page is rendered with, which is picked for the
+    page if zoom is an AdaptiveZoom.
+    """
+    if isinstance(zoom, AdaptiveZoom):
+        return zoom.get_page_zoom(page)
+
+    return zoom
+
+
+def parse_pdf_zoom(
+    zoom_string: 'str | None',
+    pixel_budget: int = DEFAULT_PAGE_PIXEL_BUDGET,
+    min_text_height: float = DEFAULT_MIN_TEXT_HEIGHT,
+) -> 'float | AdaptiveZoom':
+    """
+    Parses a PDF zoom string, which is either a zoom factor (e.g. "0.5") or
+    "auto" for an AdaptiveZoom with the given pixel budget and minimum text
+    height. Defaults to DEFAULT_PDF_ZOOM.
+
+    Raises:
+        ValueError: The zoom string is not a positive number or "auto".
+    """
+    if zoom_string is None:
+        return DEFAULT_PDF_ZOOM
+
+    if zoom_string.strip().lower() == 'auto':
+        return AdaptiveZoom(pixel_budget=pixel_budget, min_text_height=min_text_height)
+
+    try:
+        zoom = float(zoom_string)
+    except ValueError:
+        zoom = 0
+
+    if zoom <= 0:
+        raise ValueError(f'Invalid PDF zoom "{zoom_string}", expected a positive number or "auto".')
+
+    return zoom
 
 
-def convert_pdf_to_image(pdf_path: str, extension: str = '.png'):
+def pixmap_to_image_array(pixmap: fitz.Pixmap) -> np.ndarray:
+    """
+    Converts a PyMuPDF pixmap into an OpenCV image array without encoding it.
+    Color pixmaps are converted to BGR and the alpha channel is dropped.
+
+    Args:
+        pixmap (fitz.Pixmap): The pixmap to convert
+
+    Returns:
+        np.ndarray: The image as a (height, width) or (height, width, 3) array
+    """
+    samples = np.frombuffer(pixmap.samples, dtype=np.uint8)
+    image = samples.reshape(pixmap.height, pixmap.stride)[:, :pixmap.width * pixmap.n]
+    image = image.reshape(pixmap.height, pixmap.width, pixmap.n)
+
+    if pixmap.n == 1:
+        return image[:, :, 0].copy()
+
+    if pixmap.n == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
+
+    return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+
+def get_pdf_page_count(pdf_path: str) -> int:
+    """
+    Gets the number of pages in a PDF file without rendering any pages.
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        return pdf_document.page_count
+
+
+def render_pdf_pages(
+    pdf_path: str,
+    zoom: 'float | AdaptiveZoom' = DEFAULT_PDF_ZOOM,
+    page_numbers: Iterable[int] = None,
+) -> Iterator[tuple[int, np.ndarray, float]]:
+    """
+    Renders the pages of a PDF file as image arrays in memory.
+
+    Args:
+        pdf_path (str): The PDF file to render
+        zoom (float | AdaptiveZoom, optional): Zoom factor applied to each page, or an AdaptiveZoom to pick the zoom of each page. Defaults to DEFAULT_PDF_ZOOM.
+        page_numbers (Iterable[int], optional): The pages to render. Defaults to every page.
+
+    Yields:
+        tuple[int, np.ndarray, float]: The page number, the rendered page image and the zoom it was rendered with
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        if page_numbers is None:
+            page_numbers = range(pdf_document.page_count)
+
+        for page_number in page_numbers:
+            with pipeline_metrics.stage('rasterize'):
+                page = pdf_document[page_number]
+                page_zoom = get_page_zoom(page, zoom)
+
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(page_zoom, page_zoom))
+                page_image = pixmap_to_image_array(pixmap)
+
+            yield page_number, page_image, page_zoom
+
+
+def get_page_numbers(page_count: int, page_range: 'tuple[int, int] | None' = None) -> list[int]:
+    """
+    Gets the page numbers of a PDF with page_count pages that are within the
+    page range. The page range is a (start, stop) pair of 0-indexed page
+    numbers where stop is excluded, and either value can be None.
+    """
+    if page_range is None:
+        return list(range(page_count))
+
+    start, stop = page_range
+    return list(range(page_count))[start:stop]
+
+
+def parse_page_range(page_range_string: 'str | None') -> 'tuple[int, int] | None':
+    """
+    Parses a "START:STOP" page range string into a (start, stop) pair. Either
+    side can be left empty (e.g. "10:" for every page from page 10).
+
+    Raises:
+        ValueError: The page range string is not in the "START:STOP" format.
+    """
+    if page_range_string is None:
+        return None
+
+    page_range_match = re.fullmatch(r'(\d*):(\d*)', page_range_string.strip())
+    if page_range_match is None:
+        raise ValueError(f'Invalid page range "{page_range_string}", expected "START:STOP".')
+
+    start_string, stop_string = page_range_match.groups()
+    start = int(start_string) if start_string else None
+    stop = int(stop_string) if stop_string else None
+
+    return start, stop
+
+
+def split_into_chunks(items: list, num_chunks: int) -> list[list]:
+    """
+    Splits the items into at most num_chunks consecutive chunks of nearly
+    equal size.
+    """
+    if not items:
+        return []
+
+    num_chunks = max(1, min(num_chunks, len(items)))
+    chunk_size, remainder = divmod(len(items), num_chunks)
+
+    chunks: list[list] = []
+    start = 0
+    for chunk_idx in range(num_chunks):
+        end = start + chunk_size + (1 if chunk_idx < remainder else 0)
+        chunks.append(items[start:end])
+        start = end
+
+    return chunks
+
+
+def get_pdf_page_image_path(pdf_path: str, page_number: int, extension: str = '.png') -> str:
+    """
+    Gets the path of the image of a PDF page, which is stored next to the PDF.
+    """
+    file_name_without_ext = get_file_name_without_ext(pdf_path)
+    output_image_file_name = f'{file_name_without_ext}_page{page_number}'
+    output_image_path = os.path.join(os.path.dirname(pdf_path), output_image_file_name)
+
+    return apply_default_file_ext(output_image_path, extension, force=True)
+
+
+def get_pdf_page_scales_path(pdf_path: str) -> str:
+    """
+    Gets the path of the file recording the zoom that each page image of the
+    PDF was rendered with, which is stored next to the PDF.
+    """
+    file_name_without_ext = get_file_name_without_ext(pdf_path)
+    return os.path.join(os.path.dirname(pdf_path), f'{file_name_without_ext}_page_scales.json')
+
+
+def get_pdf_zoom_key(zoom: 'float | AdaptiveZoom') -> str:
+    """
+    Gets the string recorded for the zoom that pages were requested to be
+    rendered with, which differs between zoom factors and adaptive zooms
+    with different settings.
+    """
+    if isinstance(zoom, AdaptiveZoom):
+        zoom_settings = (zoom.pixel_budget, zoom.min_text_height, zoom.min_zoom, zoom.max_zoom)
+        return 'auto:' + ':'.join(repr(float(zoom_setting)) for zoom_setting in zoom_settings)
+
+    return repr(float(zoom))
+
+
+def load_pdf_page_scales(pdf_path: str) -> dict[str, dict]:
+    """
+    Loads the recorded zoom of each page image rendered from the PDF, by the
+    path of the image relative to the folder of the PDF. Each record has the
+    zoom the page was rendered with (scale) and the key of the zoom that was
+    requested (zoom, see get_pdf_zoom_key).
+    """
+    page_scales_path = get_pdf_page_scales_path(pdf_path)
+    if not os.path.isfile(page_scales_path):
+        return {}
+
+    with open(page_scales_path, 'r') as page_scales_file:
+        try:
+            page_scales = json.load(page_scales_file)
+        except json.JSONDecodeError:
+            return {}
+
+    # Scales recorded by page number do not say which image they are for
+    return {image_name: page_scale for image_name, page_scale in page_scales.items() if isinstance(page_scale, dict)}
+
+
+def save_pdf_page_scales(pdf_path: str, page_scales: dict[str, float], zoom: 'float | AdaptiveZoom') -> None:
+    """
+    Records the zoom that the given page images of the PDF were rendered
+    with, by image path, along with the zoom that was requested. The records
+    of other page images are kept, so page images of the PDF written to
+    different locations do not overwrite each other's records.
+    """
+    if not page_scales:
+        return
+
+    pdf_directory = os.path.dirname(pdf_path)
+    all_page_scales = load_pdf_page_scales(pdf_path)
+    for page_image_path, scale in page_scales.items():
+        all_page_scales[os.path.relpath(page_image_path, pdf_directory)] = {'scale': scale, 'zoom': get_pdf_zoom_key(zoom)}
+
+    page_scales_path = get_pdf_page_scales_path(pdf_path)
+    create_directories_to_file(page_scales_path)
+
+    temporary_path = f'{page_scales_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as page_scales_file:
+        json.dump(dict(sorted(all_page_scales.items())), page_scales_file)
+    os.replace(temporary_path, page_scales_path)
+
+
+def get_pdf_page_scale(pdf_path: str, page_image_path: str) -> float:
+    """
+    Gets the zoom that the page image of the PDF was rendered with. Pages
+    rendered before zooms were recorded used DEFAULT_PDF_ZOOM.
+    """
+    page_scale = load_pdf_page_scales(pdf_path).get(os.path.relpath(page_image_path, os.path.dirname(pdf_path)))
+    return page_scale['scale'] if page_scale is not None else DEFAULT_PDF_ZOOM
+
+
+def is_pdf_page_scale_current(pdf_path: str, page_image_path: str, zoom: 'float | AdaptiveZoom') -> bool:
+    """
+    Checks if the page image of the PDF was rendered with the requested zoom,
+    so it does not need to be rendered again.
+    """
+    page_scale = load_pdf_page_scales(pdf_path).get(os.path.relpath(page_image_path, os.path.dirname(pdf_path)))
+    if page_scale is None:
+        return zoom == DEFAULT_PDF_ZOOM
+
+    return page_scale['zoom'] == get_pdf_zoom_key(zoom)
+
+
+def image_region_to_pdf_rect(region: Region, scale: float) -> fitz.Rect:
+    """
+    Maps the bounds of a region of a page image rendered with the given zoom
+    (see get_pdf_page_scale) back to a rectangle in PDF page coordinates.
+    """
+    min_x, min_y, max_x, max_y = region.extent
+    return fitz.Rect(min_x / scale, min_y / scale, max_x / scale, max_y / scale)
+
+
+def convert_pdf_to_image(
+    pdf_path: str,
+    extension: str = '.png',
+    workers: int = 1,
+    page_range: 'tuple[int, int] | None' = None,
+    zoom: 'float | AdaptiveZoom' = DEFAULT_PDF_ZOOM,
+):
     """
     Converts a PDF file to an image. Valid image file extensions are `.png`,
-    `.jpg` and `.jpeg`.
+    `.jpg` and `.jpeg`. The images are written next to the PDF file, and the
+    zoom of each page is recorded (see get_pdf_page_scale). Use
+    convert_pdf_to_encoded_images to render the pages without writing them.
+
+    If workers is greater than 1, the pages are split into chunks that are
+    rendered in a pool of processes. Each process opens the PDF itself, since
+    PyMuPDF documents cannot be shared between processes. Only the pages in
+    page_range are converted if it is given (see get_page_numbers).
 
     Raises:
         ValueError: The extension given is not a valid file extension.
@@ -18,25 +373,67 @@ def convert_pdf_to_image(pdf_path: str, extension: str = '.png'):
     if extension not in {'.png', '.jpg', '.jpeg'}:
         raise ValueError(f'"{extension}" is not a valid image extension.')
 
-    # Decrease file size
-    zoom_x = 0.5  # horizontal zoom
-    zoom_y = 0.5  # vertical zoom
+    page_numbers = get_page_numbers(get_pdf_page_count(pdf_path), page_range)
 
-    mat = fitz.Matrix(zoom_x, zoom_y)  # zoom factor 2 in each dimension
+    if workers > 1:
+        page_number_chunks = split_into_chunks(page_numbers, workers)
+        render_chunk = partial(_render_pdf_pages_to_files, pdf_path, extension=extension, zoom=zoom)
 
-    pdf_document = fitz.open(pdf_path)
+        output_file_paths: list[str] = []
+        page_scales: dict[str, float] = {}
+        with ProcessPoolExecutor(max_workers=len(page_number_chunks)) as executor:
+            for chunk_output_paths, chunk_page_scales in executor.map(render_chunk, page_number_chunks):
+                output_file_paths.extend(chunk_output_paths)
+                page_scales.update(chunk_page_scales)
 
-    output_file_paths: list[str] = []
+        save_pdf_page_scales(pdf_path, page_scales, zoom)
+        return output_file_paths
+
+    output_file_paths, page_scales = _render_pdf_pages_to_files(pdf_path, page_numbers, extension, zoom)
+    save_pdf_page_scales(pdf_path, page_scales, zoom)
+
+    return output_file_paths
 
-    for pdf_page in pdf_document:
-        pixmap = pdf_page.get_pixmap(matrix=mat)
 
-        file_name_without_ext = get_file_name_without_ext(pdf_path)
-        output_image_file_name = f'{file_name_without_ext}_page{pdf_page}'
-        output_image_path = apply_default_file_ext(output_image_file_name, extension, force=True)
+def _render_pdf_pages_to_files(
+    pdf_path: str,
+    page_numbers: list[int],
+    extension: str = '.png',
+    zoom: 'float | AdaptiveZoom' = DEFAULT_PDF_ZOOM,
+) -> tuple[list[str], dict[str, float]]:
+    """
+    Renders the given pages of a PDF file and writes them next to the PDF.
+
+    Returns:
+        tuple[list[str], dict[str, float]]: The output file path of each page and the zoom of each page by output file path
+    """
+    output_file_paths: list[str] = []
+    page_scales: dict[str, float] = {}
 
-        pixmap.save(output_image_path)
+    for page_number, page_image, page_zoom in render_pdf_pages(pdf_path, zoom=zoom, page_numbers=page_numbers):
+        output_image_path = get_pdf_page_image_path(pdf_path, page_number, extension)
+        cv2.imwrite(output_image_path, page_image)
 
         output_file_paths.append(output_image_path)
+        page_scales[output_image_path] = page_zoom
 
-    return output_file_paths
+    return output_file_paths, page_scales
+
+
+def convert_pdf_to_encoded_images(
+    pdf_path: str,
+    extension: str = '.png',
+    zoom: 'float | AdaptiveZoom' = DEFAULT_PDF_ZOOM,
+) -> list[tuple[bytes, float]]:
+    """
+    Converts a PDF file to encoded images in memory, without writing them to
+    disk.
+
+    Returns:
+        list[tuple[bytes, float]]: The encoded image of each page and the zoom it was rendered with
+    """
+    encoded_images = [
+        (encode_image(page_image, extension), page_zoom)
+        for _, page_image, page_zoom in render_pdf_pages(pdf_path, zoom=zoom)
+    ]
+    return encoded_images
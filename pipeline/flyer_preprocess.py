@@ -1,7 +1,12 @@
 import argparse
+import math
 import os
 import os.path
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from enum import Enum
+from typing import Iterable
 
 import cv2
 import numpy as np
@@ -17,105 +22,360 @@ class PreprocessType(Enum):
     THRESHOLD = 'threshold'
 
 
-def preprocess_image_file(image_file_path: str, output_path: str, preprocess_type: PreprocessType):
+# Preprocess type names accepted by the command line besides the PreprocessType values
+PREPROCESS_TYPE_ALIASES = {'thresh': PreprocessType.THRESHOLD}
+
+# Number of chunks of images each worker process is given by default
+CHUNKS_PER_WORKER = 4
+
+# Filter parameters used by the preprocess types
+DEFAULT_PREPROCESS_PARAMETERS = {
+    'black_white_threshold': 127,
+    'blur_kernel_size': 3,
+    'bilateral_diameter': 9,
+    'bilateral_sigma_color': 75,
+    'bilateral_sigma_space': 75,
+    'adaptive_block_size': 11,
+    'adaptive_constant': 2,
+}
+
+# Filter parameters that affect the result of each preprocess type
+PREPROCESS_TYPE_PARAMETER_NAMES = {
+    PreprocessType.BLACK_WHITE: ('black_white_threshold',),
+    PreprocessType.SHARPEN: ('black_white_threshold',),
+    PreprocessType.BLUR: ('black_white_threshold', 'blur_kernel_size'),
+    PreprocessType.BILATERAL: ('black_white_threshold', 'bilateral_diameter', 'bilateral_sigma_color',
+                               'bilateral_sigma_space'),
+    PreprocessType.THRESHOLD: ('black_white_threshold', 'blur_kernel_size', 'adaptive_block_size',
+                               'adaptive_constant'),
+}
+
+
+@dataclass(frozen=True)
+class PreprocessTiming:
+    """The time taken to preprocess an image file into its outputs, in seconds."""
+    image_path: str
+    output_paths: tuple[str, ...]
+    duration: float
+
+
+def get_preprocess_type(preprocess_type_name: str) -> PreprocessType:
+    """
+    Gets the preprocess type with the given value or alias (e.g. `bilateral`
+    or `thresh`).
+
+    Will raise a ValueError if there is no preprocess type with the name.
+    """
+    if preprocess_type_name in PREPROCESS_TYPE_ALIASES:
+        return PREPROCESS_TYPE_ALIASES[preprocess_type_name]
+
+    return PreprocessType(preprocess_type_name)
+
+
+def get_preprocess_parameters(preprocess_type: PreprocessType, parameters: dict = None) -> dict:
+    """
+    Gets the filter parameters that affect the result of the preprocess type,
+    taken from parameters or DEFAULT_PREPROCESS_PARAMETERS.
+    """
+    parameters = {**DEFAULT_PREPROCESS_PARAMETERS, **(parameters or {})}
+    return {parameter_name: parameters[parameter_name] for parameter_name in PREPROCESS_TYPE_PARAMETER_NAMES[preprocess_type]}
+
+
+def preprocess_image(image: np.ndarray, preprocess_type: PreprocessType, parameters: dict = None) -> np.ndarray:
+    """
+    Preprocesses an image array using the given preprocess_type and returns
+    the preprocessed image array. Both color (BGR) and grayscale images are
+    accepted. Filter parameters not given in parameters are taken from
+    DEFAULT_PREPROCESS_PARAMETERS.
+    """
+    return preprocess_image_variants(image, [preprocess_type], parameters)[preprocess_type]
+
+
+def preprocess_image_variants(
+    image: np.ndarray,
+    preprocess_types: Iterable[PreprocessType],
+    parameters: dict = None,
+) -> dict[PreprocessType, np.ndarray]:
+    """
+    Preprocesses an image array into each of the given preprocess types. The
+    grayscale, black-white and blurred images that the preprocess types share
+    are only computed once. See preprocess_image.
+
+    Will raise a ValueError if a preprocess type is unknown.
+
+    Returns:
+        dict[PreprocessType, np.ndarray]: The preprocessed image of each preprocess type
+    """
+    parameters = {**DEFAULT_PREPROCESS_PARAMETERS, **(parameters or {})}
+    preprocess_types = list(dict.fromkeys(preprocess_types))
+
+    # Gray scale the image
+    gray_image = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # Apply black-white filter
+    _, black_white_image = cv2.threshold(gray_image, parameters['black_white_threshold'], 255, cv2.THRESH_BINARY)
+
+    blurred_image = None
+    if PreprocessType.BLUR in preprocess_types or PreprocessType.THRESHOLD in preprocess_types:
+        blur_kernel_size = parameters['blur_kernel_size']
+        blurred_image = cv2.blur(src=black_white_image, ksize=(blur_kernel_size, blur_kernel_size))
+
+    preprocessed_images: dict[PreprocessType, np.ndarray] = {}
+    for preprocess_type in preprocess_types:
+        if preprocess_type == PreprocessType.BLACK_WHITE:
+            preprocessed_images[preprocess_type] = black_white_image
+
+        elif preprocess_type == PreprocessType.SHARPEN:
+            kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+            preprocessed_images[preprocess_type] = cv2.filter2D(src=black_white_image, ddepth=-1, kernel=kernel)
+
+        elif preprocess_type == PreprocessType.BLUR:
+            preprocessed_images[preprocess_type] = blurred_image
+
+        elif preprocess_type == PreprocessType.BILATERAL:
+            preprocessed_images[preprocess_type] = cv2.bilateralFilter(
+                src=black_white_image, d=parameters['bilateral_diameter'],
+                sigmaColor=parameters['bilateral_sigma_color'], sigmaSpace=parameters['bilateral_sigma_space']
+            )
+
+        elif preprocess_type == PreprocessType.THRESHOLD:
+            preprocessed_images[preprocess_type] = cv2.adaptiveThreshold(
+                blurred_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                parameters['adaptive_block_size'], parameters['adaptive_constant']
+            )
+
+        else:
+            raise ValueError(f'Unknown preprocess type "{preprocess_type}".')
+
+    return preprocessed_images
+
+
+def encode_image(image: np.ndarray, file_extension: str) -> bytes:
+    """
+    Encodes an image array into the contents of an image file of the given
+    type (e.g. `.png`), the same as cv2.imwrite would write.
+
+    Will raise a ValueError if the image could not be encoded.
+    """
+    is_encoded, encoded_image = cv2.imencode(file_extension, image)
+    if not is_encoded:
+        raise ValueError(f'Could not encode image as "{file_extension}".')
+
+    return encoded_image.tobytes()
+
+
+def decode_image(image_content: bytes) -> np.ndarray:
+    """
+    Decodes the contents of an image file into a color (BGR) image array, the
+    same as cv2.imread would read.
+
+    Will raise a ValueError if the image could not be decoded.
+    """
+    image = cv2.imdecode(np.frombuffer(image_content, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('Could not decode image.')
+
+    return image
+
+
+def preprocess_image_content(
+    image_file_path: str,
+    preprocess_type: PreprocessType,
+    image: np.ndarray = None,
+    parameters: dict = None,
+) -> bytes:
+    """
+    Preprocesses the image using the given preprocess_type and filter
+    parameters and returns the preprocessed image encoded in memory, in the
+    file type of the image file. Valid image files are `.png`, `.jpg` and
+    `.jpeg`.
+
+    If the image has already been decoded, it can be passed in as image to
+    avoid reading the image file again.
+
+    Will raise a ValueError if the given image file is not a valid file type.
+    """
+    return preprocess_image_variant_contents(image_file_path, [preprocess_type], image, parameters)[preprocess_type]
+
+
+def preprocess_image_variant_contents(
+    image_file_path: str,
+    preprocess_types: Iterable[PreprocessType],
+    image: np.ndarray = None,
+    parameters: dict = None,
+) -> dict[PreprocessType, bytes]:
+    """
+    Decodes the image once and preprocesses it into each of the given
+    preprocess types (see preprocess_image_variants). Each variant is encoded
+    in memory in the file type of the image file, ready to be sent for OCR.
+
+    Will raise a ValueError if the given image file is not a valid file type
+    or could not be read.
+
+    Returns:
+        dict[PreprocessType, bytes]: The encoded preprocessed image of each preprocess type
+    """
+    file_extension = os.path.splitext(image_file_path)[1].lower()
+    if file_extension not in VALID_IMAGE_FILE_TYPES:
+        raise ValueError(f'Input file "{image_file_path} is not a valid image file type.')
+
+    if image is None:
+        image = cv2.imread(image_file_path)
+        if image is None:
+            raise ValueError(f'Could not read image "{image_file_path}" to preprocess.')
+
+    preprocessed_images = preprocess_image_variants(image, preprocess_types, parameters)
+
+    return {
+        preprocess_type: encode_image(preprocessed_image, file_extension)
+        for preprocess_type, preprocessed_image in preprocessed_images.items()
+    }
+
+
+def preprocess_image_file(image_file_path: str, output_path: str, preprocess_type: PreprocessType, image: np.ndarray = None):
     """
     Preprocesses the image using the given preprocess_type. Valid image files
     are `.png`, `.jpg` and `.jpeg`. Creates directories to the output path if
     not yet created.
 
+    If the image has already been decoded, it can be passed in as image to
+    avoid reading the image file again.
+
     Will raise a ValueError if the given image file is not a valid file type.
     """
-    file_extension = os.path.splitext(image_file_path)[1]
-    if file_extension not in VALID_IMAGE_FILE_TYPES:
-        raise ValueError(f'Input file "{image_file_path} is not a valid image file type.')
+    preprocess_image_file_variants(image_file_path, {preprocess_type: output_path}, image=image)
 
-    create_directories_to_file(output_path)
 
-    image = cv2.imread(image_file_path)
+def preprocess_image_file_variants(
+    image_file_path: str,
+    output_paths: dict[PreprocessType, str],
+    image: np.ndarray = None,
+) -> None:
+    """
+    Decodes the image once and saves each of its preprocess type variants to
+    the output path of the preprocess type. Creates directories to the output
+    paths if not yet created.
 
-    # Gray scale the image
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    Will raise a ValueError if the given image file is not a valid file type
+    or could not be read.
+    """
+    preprocessed_image_contents = preprocess_image_variant_contents(image_file_path, output_paths.keys(), image=image)
 
-    # Apply black-white filter
-    _, black_white_image = cv2.threshold(gray_image, 127, 255, cv2.THRESH_BINARY)
+    for preprocess_type, output_path in output_paths.items():
+        create_directories_to_file(output_path)
 
-    if preprocess_type == PreprocessType.BLACK_WHITE:
-        cv2.imwrite(output_path, black_white_image)
-        return
+        with open(output_path, 'wb') as output_file:
+            output_file.write(preprocessed_image_contents[preprocess_type])
 
-    if preprocess_type == PreprocessType.SHARPEN:
-        kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-        sharpened_image = cv2.filter2D(src=black_white_image, ddepth=-1, kernel=kernel)
-        cv2.imwrite(output_path, sharpened_image)
-        return
 
-    blurred_image = cv2.blur(src=black_white_image, ksize=(3, 3))
-    if preprocess_type == PreprocessType.BLUR:
-        cv2.imwrite(output_path, blurred_image)
-        return
+def get_preprocess_chunk_size(image_count: int, workers: int) -> int:
+    """
+    Gets the number of images sent to a worker process at a time, so that
+    each worker is given about CHUNKS_PER_WORKER chunks.
+    """
+    return max(1, math.ceil(image_count / (workers * CHUNKS_PER_WORKER)))
 
-    if preprocess_type == PreprocessType.BILATERAL:
-        bilateral_filter_image = cv2.bilateralFilter(
-            src=black_white_image, d=9, sigmaColor=75, sigmaSpace=75
-        )
-        cv2.imwrite(output_path, bilateral_filter_image)
-        return
 
-    if preprocess_type == PreprocessType.THRESHOLD:
-        threshold_filter_image = cv2.adaptiveThreshold(
-            blurred_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-        )
-        cv2.imwrite(output_path, threshold_filter_image)
+def preprocess_image_files(
+    image_paths: list[str],
+    output_paths: list[str],
+    preprocess_type: PreprocessType,
+    workers: int = 1,
+    chunk_size: int = None,
+    opencv_threads: int = 1,
+) -> list[PreprocessTiming]:
+    """
+    Preprocesses each of the image files using the given preprocess_type and
+    saves it to the output path at the same index. See preprocess_image_file.
 
+    If workers is greater than 1, the images are preprocessed in a pool of
+    processes. Images are sent to the workers in chunks of chunk_size images
+    (see get_preprocess_chunk_size), so a worker that finishes early takes
+    the next chunk. Each worker limits OpenCV to opencv_threads threads, since
+    OpenCV threads in every worker would oversubscribe the cores.
 
-def preprocess_img(input_dir, o, p_type):
-    filename = os.path.basename(input_dir)
-    if filename == ".DS_Store":
-        return
+    Will raise a ValueError if the number of image and output paths differ.
 
-    img = cv2.imread(input_dir)
+    Returns:
+        list[PreprocessTiming]: The time taken to preprocess each image, in the order of the images
+    """
+    variant_output_paths = [{preprocess_type: output_path} for output_path in output_paths]
 
-    # Grey scale
-    grey_image = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return preprocess_image_variant_files(image_paths, variant_output_paths, workers=workers, chunk_size=chunk_size,
+                                          opencv_threads=opencv_threads)
 
-    # Black & white
-    _, bw = cv2.threshold(grey_image, 127, 255, cv2.THRESH_BINARY)
 
-    if p_type == "bw":
-        cv2.imwrite(f"{o}/preprocessed_{filename}", bw)
-        return
+def preprocess_image_variant_files(
+    image_paths: list[str],
+    output_paths: list[dict[PreprocessType, str]],
+    workers: int = 1,
+    chunk_size: int = None,
+    opencv_threads: int = 1,
+) -> list[PreprocessTiming]:
+    """
+    Preprocesses each of the image files into the preprocess types of the
+    output paths at the same index, decoding each image once. See
+    preprocess_image_file_variants, and preprocess_image_files for how the
+    images are scheduled across workers.
 
-    # Filtering
+    Will raise a ValueError if the number of image and output paths differ.
 
-    # Sharpen img
-    if p_type == "sharp":
-        kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-        img_sharp = cv2.filter2D(src=bw, ddepth=-1, kernel=kernel)
-        cv2.imwrite(f"{o}/preprocessed_{filename}", img_sharp)
-        return
+    Returns:
+        list[PreprocessTiming]: The time taken to preprocess each image, in the order of the images
+    """
+    if len(image_paths) != len(output_paths):
+        raise ValueError(f'Got {len(image_paths)} images to preprocess but {len(output_paths)} output paths.')
 
-    # Blur img
-    img_blur = cv2.blur(src=bw, ksize=(3, 3))
-    if p_type == "blur":
-        cv2.imwrite(f"{o}/preprocessed_{filename}", img_blur)
-        return
+    image_and_output_paths = list(zip(image_paths, output_paths))
+    preprocess_file = _preprocess_image_file_variants_timed
 
-    # Bilateral filter
-    if p_type == "bilateral":
-        bilateral_filter = cv2.bilateralFilter(
-            src=bw, d=9, sigmaColor=75, sigmaSpace=75
-        )
-        cv2.imwrite(f"{o}/preprocessed_{filename}", bilateral_filter)
-        return
+    if workers > 1 and len(image_and_output_paths) > 1:
+        workers = min(workers, len(image_and_output_paths))
+        if chunk_size is None:
+            chunk_size = get_preprocess_chunk_size(len(image_and_output_paths), workers)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=cv2.setNumThreads,
+                                 initargs=(opencv_threads,)) as executor:
+            return list(executor.map(preprocess_file, image_and_output_paths, chunksize=chunk_size))
+
+    return [preprocess_file(image_and_output_path) for image_and_output_path in image_and_output_paths]
 
-    if p_type == "thresh":
-        th = cv2.adaptiveThreshold(
-            img_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-        )
-        cv2.imwrite(f"{o}/preprocessed_{filename}", th)
+
+def print_preprocess_timings(preprocess_timings: list[PreprocessTiming]) -> None:
+    """
+    Prints the time taken to preprocess each image, followed by the total and
+    mean time.
+    """
+    for preprocess_timing in preprocess_timings:
+        print(f'[PREPROCESS] {preprocess_timing.image_path}: {preprocess_timing.duration:.3f}s')
+
+    if not preprocess_timings:
         return
 
-    return
+    total_duration = sum(preprocess_timing.duration for preprocess_timing in preprocess_timings)
+    print(f'[PREPROCESS] {len(preprocess_timings)} images in {total_duration:.3f}s of processing '
+          f'({total_duration / len(preprocess_timings):.3f}s per image)')
+
+
+def _preprocess_image_file_variants_timed(image_and_output_paths: tuple[str, dict[PreprocessType, str]]) -> PreprocessTiming:
+    image_path, output_paths = image_and_output_paths
+
+    start_time = time.perf_counter()
+    preprocess_image_file_variants(image_path, output_paths)
+
+    return PreprocessTiming(image_path, tuple(output_paths.values()), time.perf_counter() - start_time)
+
+
+def get_preprocessed_output_path(image_path: str, output_directory: str, preprocess_type: PreprocessType = None) -> str:
+    """
+    Gets the path that the command line saves the preprocessed image to. The
+    preprocess type is added to the file name if given, to tell the variants
+    of an image apart.
+    """
+    if preprocess_type is not None:
+        return os.path.join(output_directory, f'preprocessed_{preprocess_type.value}_{os.path.basename(image_path)}')
+
+    return os.path.join(output_directory, f'preprocessed_{os.path.basename(image_path)}')
 
 
 if __name__ == "__main__":
@@ -125,13 +385,34 @@ if __name__ == "__main__":
     parser.add_argument(
         "--p_type",
         type=str,
-        help="Preprocess type: bilateral (default), bw (black and white), sharp (sharpen), blur, thresh (thresholding)",
+        help="Preprocess type: bilateral (default), bw (black and white), sharp (sharpen), blur, thresh (thresholding). "
+             "Separate several types with commas (e.g. bw,bilateral) to save each variant from one decode of each image",
         default="bilateral",
     )
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes preprocessing images")
+    parser.add_argument("--chunk_size", type=int, help="Number of images sent to a process at a time")
+    parser.add_argument("--opencv_threads", type=int, default=1, help="Number of OpenCV threads in each process")
     args = parser.parse_args()
 
+    image_paths = []
     if os.path.isfile(args.input_dir):
-        preprocess_img(args.input_dir, args.o, args.p_type)
+        image_paths = [args.input_dir]
     elif os.path.isdir(args.input_dir):
-        for filename in os.listdir(args.input_dir):
-            preprocess_img(os.path.join(args.input_dir, filename), args.o, args.p_type)
+        image_paths = [
+            os.path.join(args.input_dir, filename) for filename in sorted(os.listdir(args.input_dir))
+            if os.path.splitext(filename)[1].lower() in VALID_IMAGE_FILE_TYPES
+        ]
+
+    preprocess_types = [get_preprocess_type(preprocess_type_name.strip()) for preprocess_type_name in args.p_type.split(',')]
+
+    if len(preprocess_types) == 1:
+        output_paths = [{preprocess_types[0]: get_preprocessed_output_path(image_path, args.o)} for image_path in image_paths]
+    else:
+        output_paths = [
+            {preprocess_type: get_preprocessed_output_path(image_path, args.o, preprocess_type) for preprocess_type in preprocess_types}
+            for image_path in image_paths
+        ]
+
+    preprocess_timings = preprocess_image_variant_files(image_paths, output_paths, workers=args.workers,
+                                                        chunk_size=args.chunk_size, opencv_threads=args.opencv_threads)
+    print_preprocess_timings(preprocess_timings)
@@ -5,14 +5,14 @@ from typing import Tuple
 import os
 import glob, sys
 
-from flyer_preprocess import preprocess_img
+from convert_pdf import (DEFAULT_PDF_ZOOM, get_page_zoom, parse_pdf_zoom,
+                         save_pdf_page_scales)
+from flyer_preprocess import (PreprocessType, get_preprocessed_output_path,
+                              preprocess_image_files, print_preprocess_timings)
 
 
-def preprocess_flyer(flyer_path, override_existing=True):
-    # Decrease file size
-    zoom_x = 0.5  # horizontal zoom
-    zoom_y = 0.5  # vertical zoom
-    mat = fitz.Matrix(zoom_x, zoom_y)  # zoom factor 2 in each dimension
+def preprocess_flyer(flyer_path, override_existing=True, workers=1, zoom=DEFAULT_PDF_ZOOM):
+    # zoom is a zoom factor, or an AdaptiveZoom that picks the zoom of each page
 
     # path = "../input_data/metro"
     all_pdfs = glob.glob(flyer_path + "/*.pdf")
@@ -30,19 +30,27 @@ def preprocess_flyer(flyer_path, override_existing=True):
         if not override_existing:
             return
 
+    # Render every page first, then preprocess all of the images in one batch
+    images_to_preprocess = []
     if all_pdfs:
         for filename in all_pdfs:
             doc = fitz.open(filename)  # open document
+            page_scales = {}  # by output path, since other runs write pages of the same PDF elsewhere
             for page in doc:  # iterate through the pages
-                pix = page.get_pixmap(matrix=mat)  # render page to an image
+                page_zoom = get_page_zoom(page, zoom)
+                pix = page.get_pixmap(matrix=fitz.Matrix(page_zoom, page_zoom))  # render page to an image
                 output_path = f"{flyer_path}/out/page-{page.number}.png"
                 pix.save(output_path)  # store image as a PNG
-                preprocess_img(output_path, f"{flyer_path}/out", "bilateral")
-    if all_imgs:
-        for img_path in all_imgs:
-            filename = os.path.basename(img_path)
-            output_path = f"{flyer_path}/out/"
-            preprocess_img(img_path, output_path, "bilateral")
+                images_to_preprocess.append(output_path)
+                page_scales[output_path] = page_zoom
+            # Record the zoom of each page so bounds can be mapped back to PDF coordinates
+            save_pdf_page_scales(filename, page_scales, zoom)
+    images_to_preprocess.extend(all_imgs)
+
+    output_paths = [get_preprocessed_output_path(img_path, f"{flyer_path}/out") for img_path in images_to_preprocess]
+    preprocess_timings = preprocess_image_files(images_to_preprocess, output_paths, PreprocessType.BILATERAL,
+                                                workers=workers)
+    print_preprocess_timings(preprocess_timings)
 
 
 if __name__ == "__main__":
@@ -54,12 +62,20 @@ if __name__ == "__main__":
         help="If false, it will not preprocess an image if the out/ folder exists in the folder directory already",
         default=True,
     )
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes preprocessing images")
+    parser.add_argument(
+        "--zoom",
+        type=str,
+        help="Zoom of PDF pages (default 0.5), or auto to pick the zoom of each page from its size and text size",
+    )
     args = parser.parse_args()
 
+    zoom = parse_pdf_zoom(args.zoom)
+
     if os.path.isfile(args.input_dir):
-        preprocess_flyer(args.input_dir, args.override_existing)
+        preprocess_flyer(args.input_dir, args.override_existing, args.workers, zoom)
     elif os.path.isdir(args.input_dir):
         for folder in os.listdir(args.input_dir):
             preprocess_flyer(
-                os.path.join(args.input_dir, folder), args.override_existing
+                os.path.join(args.input_dir, folder), args.override_existing, args.workers, zoom
             )
@@ -0,0 +1,408 @@
+"""
+Finds pages that are near-identical to pages seen before, such as the shared
+pages of regional editions of a flyer, so their annotations and segmentation
+boxes can be reused instead of being requested and predicted again.
+
+Candidate pages are found by the Hamming distance between their difference
+hashes (dHash). A 16x16 dHash hardly changes when a small region such as a
+price is edited, so a candidate is only a duplicate if its pixels are the
+same as the page's, or differ in at most max_pixel_difference pixels.
+Raising max_pixel_difference above 0 lets pages that differ only in a small
+patch, like a changed price, reuse each other's annotations.
+
+Only pages of the same pixel size are duplicates, since annotations and
+segmentation boxes are in pixel coordinates and a page rasterized at another
+zoom has the same hash. The hashes, sizes, annotation paths and segmentation
+boxes of indexed pages are saved in an index file, and every reuse is
+appended to an audit log.
+"""
+import hashlib
+import json
+import os
+import os.path
+import threading
+import time
+
+import cv2
+import numpy as np
+from util.file_path_util import create_directories_to_file
+from util.image_space import Region
+
+# Width and height of the grid of brightness differences in a page hash
+PAGE_HASH_SIZE = 16
+
+# Pages with hashes this many bits apart or closer are duplicates by default
+DEFAULT_MAX_HASH_DISTANCE = 2
+
+# Candidate pages must have identical pixels to be duplicates by default
+DEFAULT_MAX_PIXEL_DIFFERENCE = 0
+
+
+def compute_page_hash(image_path: str, hash_size: int = PAGE_HASH_SIZE) -> int:
+    """
+    Computes the difference hash of an image. The grayscale image is shrunk to
+    (hash_size + 1) x hash_size and each bit records whether a pixel is
+    brighter than the pixel to its left.
+    """
+    page_hash, _, _ = compute_page_fingerprint(image_path, hash_size)
+    return page_hash
+
+
+def compute_page_fingerprint(image_path: str, hash_size: int = PAGE_HASH_SIZE) -> tuple[int, str, tuple[int, int]]:
+    """
+    Computes the difference hash of an image along with a SHA-256 hash of
+    its grayscale pixels and its width and height. The pixel hash does not
+    depend on how the image file is encoded.
+    """
+    image = read_grayscale_image(image_path)
+
+    pixel_hash = hashlib.sha256(image.tobytes()).hexdigest()
+
+    shrunk_image = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    differences = shrunk_image[:, 1:] > shrunk_image[:, :-1]
+
+    page_hash = int.from_bytes(np.packbits(differences).tobytes(), 'big')
+    height, width = image.shape[:2]
+
+    return page_hash, pixel_hash, (width, height)
+
+
+def read_grayscale_image(image_path: str) -> np.ndarray:
+    """
+    Reads an image in grayscale, raising a ValueError if it cannot be read.
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f'Could not read image "{image_path}" to hash.')
+
+    return image
+
+
+def count_different_pixels(image_path: str, other_image_path: str) -> int:
+    """
+    Counts the pixels whose grayscale values differ between two images of the
+    same size.
+    """
+    return int(np.count_nonzero(read_grayscale_image(image_path) != read_grayscale_image(other_image_path)))
+
+
+def get_hash_distance(page_hash: int, other_page_hash: int) -> int:
+    """
+    Gets the number of bits that differ between two page hashes.
+    """
+    return bin(page_hash ^ other_page_hash).count('1')
+
+
+class PageHashIndex:
+    """
+    The hashes of the pages seen in previous and current runs, along with
+    the annotation file and the segmentation boxes of each model for each
+    page. Hashes are recomputed when a page file is modified.
+
+    Pages are bucketed by their size and by each of max_distance + 1 slices
+    of their hash. Two hashes within max_distance bits of each other have at
+    least one slice in common, so only the pages sharing a bucket with the
+    page need to be compared. Candidates are then confirmed by comparing
+    their pixels.
+
+    The index is shared by the OCR and segmentation threads of the streaming
+    pipeline, so access is locked.
+    """
+    INDEX_FILE_NAME = 'page_hashes.json'
+    LOG_FILE_NAME = 'dedupe_log.jsonl'
+
+    def __init__(self, directory: str, max_distance: int = DEFAULT_MAX_HASH_DISTANCE, max_pixel_difference: int = DEFAULT_MAX_PIXEL_DIFFERENCE):
+        """
+        Args:
+            directory (str): Directory to store the index and audit log in
+            max_distance (int, optional): Largest hash distance between candidate duplicate pages. Defaults to DEFAULT_MAX_HASH_DISTANCE.
+            max_pixel_difference (int, optional): Largest number of different pixels between duplicate pages. Defaults to DEFAULT_MAX_PIXEL_DIFFERENCE.
+        """
+        self.directory = directory
+        self.max_distance = max_distance
+        self.max_pixel_difference = max_pixel_difference
+        self._pages: dict[str, dict] = None
+        self._buckets: dict[tuple, set[str]] = None
+        self._lock = threading.RLock()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE_NAME)
+
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.directory, self.LOG_FILE_NAME)
+
+    @property
+    def pages(self) -> dict[str, dict]:
+        if self._pages is None:
+            self._pages = self._read_index()
+        return self._pages
+
+    @property
+    def buckets(self) -> dict[tuple, set[str]]:
+        if self._buckets is None:
+            self._buckets = {}
+            for page_key, page_entry in self.pages.items():
+                self._add_to_buckets(page_key, page_entry)
+        return self._buckets
+
+    def get_page_hash(self, image_path: str) -> int:
+        """
+        Gets the hash of the page image, computing it if the page is not in
+        the index or was modified since it was hashed.
+        """
+        return int(self._get_page_entry(image_path)['hash'], 16)
+
+    def get_page_size(self, image_path: str) -> tuple[int, int]:
+        """
+        Gets the width and height of the page image, reading it if the page
+        is not in the index or was modified since it was hashed.
+        """
+        page_entry = self._get_page_entry(image_path)
+        return page_entry['width'], page_entry['height']
+
+    def add_annotated_page(self, image_path: str, annotation_path: str) -> None:
+        """
+        Records the annotation file of the page, so pages like it can reuse
+        the annotation.
+        """
+        self.get_page_hash(image_path)
+
+        with self._lock:
+            self.pages[os.path.abspath(image_path)]['annotation_path'] = os.path.abspath(annotation_path)
+
+    def add_segmentation(self, image_path: str, model_key: str, segmentation_bounds: list[Region]) -> None:
+        """
+        Records the segmentation boxes that the model with the given key
+        predicted for the page.
+        """
+        self.get_page_hash(image_path)
+
+        with self._lock:
+            self.pages[os.path.abspath(image_path)]['segmentations'][model_key] = [
+                list(bounds.extent) for bounds in segmentation_bounds
+            ]
+
+    def invalidate_page(self, image_path: str) -> None:
+        """
+        Forgets the annotation file and segmentation boxes recorded for the
+        page, such as when the page image is rendered again. The page is
+        hashed again when it is next looked up.
+        """
+        with self._lock:
+            page_entry = self.pages.get(os.path.abspath(image_path))
+            if page_entry is None:
+                return
+
+            page_entry['mtime_ns'] = None
+            page_entry['annotation_path'] = None
+            page_entry['segmentations'] = {}
+
+    def find_annotated_duplicate(self, image_path: str) -> 'tuple[str, str, int] | None':
+        """
+        Finds the closest other indexed page within max_distance of the page
+        that has an annotation file.
+
+        Returns:
+            tuple[str, str, int] | None: The image path and annotation path of the duplicate page and its hash distance, or None
+        """
+        duplicate = self._find_duplicate(image_path, lambda page_entry: page_entry['annotation_path'] is not None)
+        if duplicate is None:
+            return None
+
+        duplicate_path, page_entry, distance = duplicate
+        return duplicate_path, page_entry['annotation_path'], distance
+
+    def find_segmented_duplicate(self, image_path: str, model_key: str) -> 'tuple[str, list[Region], int] | None':
+        """
+        Finds the closest other indexed page within max_distance of the page
+        that has segmentation boxes from the model with the given key.
+
+        Returns:
+            tuple[str, list[Region], int] | None: The image path and segmentation boxes of the duplicate page and its hash distance, or None
+        """
+        duplicate = self._find_duplicate(image_path, lambda page_entry: model_key in page_entry['segmentations'])
+        if duplicate is None:
+            return None
+
+        duplicate_path, page_entry, distance = duplicate
+        segmentation_bounds = [Region.from_bounds(*extent) for extent in page_entry['segmentations'][model_key]]
+
+        return duplicate_path, segmentation_bounds, distance
+
+    def find_duplicate_page(self, image_path: str, candidate_image_paths: list[str]) -> 'tuple[int, int] | None':
+        """
+        Finds the closest of the candidate pages of the same size as the page
+        whose hash is within max_distance of the page's hash and whose pixels
+        match the page's.
+
+        Returns:
+            tuple[int, int] | None: The index of the duplicate page in candidate_image_paths and its distance, or None
+        """
+        page_entry = self._get_page_entry(image_path)
+        page_hash = int(page_entry['hash'], 16)
+
+        duplicates = []
+        for candidate_idx, candidate_image_path in enumerate(candidate_image_paths):
+            candidate_page_entry = self._get_page_entry(candidate_image_path)
+            if (candidate_page_entry['width'], candidate_page_entry['height']) != (page_entry['width'], page_entry['height']):
+                continue
+
+            distance = get_hash_distance(page_hash, int(candidate_page_entry['hash'], 16))
+            if distance <= self.max_distance:
+                duplicates.append((distance, candidate_idx, candidate_image_path, candidate_page_entry))
+
+        for distance, candidate_idx, candidate_image_path, candidate_page_entry in sorted(duplicates, key=lambda duplicate: duplicate[:2]):
+            if self._has_matching_pixels(image_path, page_entry, candidate_image_path, candidate_page_entry):
+                return candidate_idx, distance
+
+        return None
+
+    def log_reuse(self, reused_data: str, image_path: str, duplicate_image_path: str, distance: int) -> None:
+        """
+        Appends a record of the page reusing the data of its duplicate to the
+        audit log.
+        """
+        log_entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'reused': reused_data,
+            'page': os.path.abspath(image_path),
+            'duplicate_of': os.path.abspath(duplicate_image_path),
+            'distance': distance,
+        }
+
+        with self._lock:
+            create_directories_to_file(self.log_path)
+
+            with open(self.log_path, 'a') as log_file:
+                log_file.write(json.dumps(log_entry) + '\n')
+
+    def save(self) -> None:
+        """
+        Writes the index, keeping pages added by other processes sharing the
+        index directory.
+        """
+        with self._lock:
+            for page_key, page_entry in self._read_index().items():
+                if page_key not in self.pages:
+                    self._set_page_entry(page_key, page_entry)
+
+            create_directories_to_file(self.index_path)
+
+            temporary_path = f'{self.index_path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'w') as index_file:
+                json.dump(self.pages, index_file)
+            os.replace(temporary_path, self.index_path)
+
+    def _get_page_entry(self, image_path: str) -> dict:
+        page_key = os.path.abspath(image_path)
+        file_stat = os.stat(image_path)
+
+        with self._lock:
+            page_entry = self.pages.get(page_key)
+            # Entries indexed before pixel hashes were recorded are hashed again
+            if (page_entry is not None and 'pixel_hash' in page_entry
+                    and (page_entry['mtime_ns'], page_entry['size']) == (file_stat.st_mtime_ns, file_stat.st_size)):
+                return page_entry
+
+        page_hash, pixel_hash, (width, height) = compute_page_fingerprint(image_path)
+        page_entry = {
+            'mtime_ns': file_stat.st_mtime_ns,
+            'size': file_stat.st_size,
+            'hash': format(page_hash, 'x'),
+            'pixel_hash': pixel_hash,
+            'width': width,
+            'height': height,
+            'annotation_path': None,
+            'segmentations': {},
+        }
+
+        with self._lock:
+            self._set_page_entry(page_key, page_entry)
+
+        return page_entry
+
+    def _set_page_entry(self, page_key: str, page_entry: dict) -> None:
+        previous_page_entry = self.pages.get(page_key)
+        if previous_page_entry is not None:
+            for bucket_key in self._get_bucket_keys(previous_page_entry):
+                self.buckets.get(bucket_key, set()).discard(page_key)
+
+        self.pages[page_key] = page_entry
+        self._add_to_buckets(page_key, page_entry)
+
+    def _add_to_buckets(self, page_key: str, page_entry: dict) -> None:
+        for bucket_key in self._get_bucket_keys(page_entry):
+            self.buckets.setdefault(bucket_key, set()).add(page_key)
+
+    def _get_bucket_keys(self, page_entry: dict) -> list[tuple]:
+        if 'width' not in page_entry:
+            return []
+
+        page_hash = int(page_entry['hash'], 16)
+        hash_bit_count = PAGE_HASH_SIZE * PAGE_HASH_SIZE
+        slice_count = min(self.max_distance + 1, hash_bit_count)
+
+        bucket_keys = []
+        for slice_idx in range(slice_count):
+            slice_start = hash_bit_count * slice_idx // slice_count
+            slice_end = hash_bit_count * (slice_idx + 1) // slice_count
+            hash_slice = (page_hash >> slice_start) & ((1 << (slice_end - slice_start)) - 1)
+
+            bucket_keys.append((page_entry['width'], page_entry['height'], slice_idx, hash_slice))
+
+        return bucket_keys
+
+    def _find_duplicate(self, image_path: str, is_candidate) -> 'tuple[str, dict, int] | None':
+        page_key = os.path.abspath(image_path)
+        page_entry = self._get_page_entry(image_path)
+        page_hash = int(page_entry['hash'], 16)
+
+        duplicates = []
+        with self._lock:
+            candidate_page_keys = set()
+            for bucket_key in self._get_bucket_keys(page_entry):
+                candidate_page_keys.update(self.buckets.get(bucket_key, ()))
+
+            for other_page_key in candidate_page_keys:
+                other_page_entry = self.pages[other_page_key]
+                # Pages indexed before pixel hashes were recorded cannot be confirmed
+                if other_page_key == page_key or 'pixel_hash' not in other_page_entry or not is_candidate(other_page_entry):
+                    continue
+
+                distance = get_hash_distance(page_hash, int(other_page_entry['hash'], 16))
+                if distance <= self.max_distance:
+                    duplicates.append((distance, other_page_key, other_page_entry))
+
+        for distance, other_page_key, other_page_entry in sorted(duplicates, key=lambda duplicate: duplicate[:2]):
+            if self._has_matching_pixels(image_path, page_entry, other_page_key, other_page_entry):
+                return other_page_key, other_page_entry, distance
+
+        return None
+
+    def _has_matching_pixels(self, image_path: str, page_entry: dict, other_image_path: str, other_page_entry: dict) -> bool:
+        if page_entry['pixel_hash'] == other_page_entry['pixel_hash']:
+            return True
+
+        if self.max_pixel_difference <= 0:
+            return False
+
+        # The other page may have been modified or removed since it was indexed
+        try:
+            if self._get_page_entry(other_image_path)['pixel_hash'] != other_page_entry['pixel_hash']:
+                return False
+
+            return count_different_pixels(image_path, other_image_path) <= self.max_pixel_difference
+        except (OSError, ValueError):
+            return False
+
+    def _read_index(self) -> dict[str, dict]:
+        if not os.path.isfile(self.index_path):
+            return {}
+
+        with open(self.index_path, 'r') as index_file:
+            try:
+                return json.load(index_file)
+            except json.JSONDecodeError:
+                return {}
@@ -0,0 +1,76 @@
+import json
+import os.path
+
+from util.content_cache import ContentAddressedCache
+
+from .flyer_preprocess import PreprocessType
+
+# Increase to invalidate the cached images when the preprocessing itself changes
+PREPROCESS_CACHE_VERSION = 1
+
+
+class PreprocessCache(ContentAddressedCache):
+    """
+    Content-addressed cache of preprocessed images. Images are keyed by the
+    bytes of the source image, the preprocess type, its filter parameters and
+    the file type the image is encoded as, so each variant of a page is
+    cached separately and a changed source image or parameter never reuses a
+    stale image. The index records the source image, type and parameters of
+    each cached image.
+    """
+
+    def get_preprocess_key(
+        self,
+        image_content: bytes,
+        file_extension: str,
+        preprocess_type: PreprocessType,
+        parameters: dict,
+    ) -> str:
+        """
+        Gets the cache key for the source image content preprocessed with the
+        given preprocess type and filter parameters (see
+        get_preprocess_parameters) and encoded as file_extension.
+        """
+        preprocess_description = json.dumps({
+            'version': PREPROCESS_CACHE_VERSION,
+            'file_extension': file_extension.lower(),
+            'preprocess_type': preprocess_type.value,
+            'parameters': parameters,
+        }, sort_keys=True)
+
+        return self.hash_content(image_content, preprocess_description.encode())
+
+    def get_preprocessed_content(self, key: str) -> 'bytes | None':
+        """
+        Gets the cached preprocessed image with the given key, or None if the
+        key is not in the cache.
+        """
+        cached_image_path = self.get_path(key)
+        if cached_image_path is None:
+            return None
+
+        with open(cached_image_path, 'rb') as cached_image_file:
+            return cached_image_file.read()
+
+    def store_preprocessed_content(
+        self,
+        key: str,
+        preprocessed_image_content: bytes,
+        image_path: str,
+        preprocess_type: PreprocessType,
+        parameters: dict,
+    ) -> str:
+        """
+        Adds the preprocessed image to the cache under the given key, recording
+        the source image path, preprocess type and parameters in the index.
+
+        Returns:
+            str: The path of the cached file
+        """
+        metadata = {
+            'image_path': os.path.abspath(image_path),
+            'preprocess_type': preprocess_type.value,
+            'parameters': parameters,
+        }
+
+        return self.put_bytes(key, preprocessed_image_content, metadata=metadata)
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import os.path
+from functools import lru_cache
+
+RUN_MANIFEST_FILE_NAME = 'run_manifest.json'
+
+# Environment configuration that changes the extracted flyer data
+MANIFEST_ENV_KEYS = ('PRODUCT_CODE_REGEX', 'IGNORE_IN_PRODUCT_NAME')
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Gets the SHA-256 hash of the contents of a file.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _hash_file_with_stat(file_path: str, mtime_ns: int, size: int) -> str:
+    # The stat values are part of the cache key so modified files are rehashed
+    return hash_file(file_path)
+
+
+def hash_model_file(file_path: 'str | None') -> 'str | None':
+    """
+    Gets the hash of a model file. Hashes are cached for the rest of the run
+    since model files are large and shared by every flyer.
+    """
+    if file_path is None or not os.path.isfile(file_path):
+        return None
+
+    file_stat = os.stat(file_path)
+    return _hash_file_with_stat(os.path.abspath(file_path), file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def build_run_manifest(
+    input_files: list[str],
+    model_files: dict[str, 'str | None'],
+    env_config: dict[str, 'str | None'],
+    previous_manifest: dict = None,
+) -> dict:
+    """
+    Builds a manifest recording the hash, modification time and size of each
+    input file, the hash of each model file and the given configuration.
+
+    Input files whose modification time and size match the previous manifest
+    reuse the recorded hash instead of being read again.
+    """
+    previous_inputs = previous_manifest.get('inputs', {}) if previous_manifest else {}
+
+    inputs: dict[str, dict] = {}
+    for input_file in input_files:
+        file_name = os.path.basename(input_file)
+        file_stat = os.stat(input_file)
+
+        previous_input = previous_inputs.get(file_name)
+        is_unmodified = (
+            previous_input is not None and
+            previous_input.get('mtime_ns') == file_stat.st_mtime_ns and
+            previous_input.get('size') == file_stat.st_size
+        )
+        file_hash = previous_input['sha256'] if is_unmodified else hash_file(input_file)
+
+        inputs[file_name] = {
+            'sha256': file_hash,
+            'mtime_ns': file_stat.st_mtime_ns,
+            'size': file_stat.st_size,
+        }
+
+    models = {model_name: hash_model_file(model_file) for model_name, model_file in model_files.items()}
+
+    run_manifest = {
+        'inputs': inputs,
+        'models': models,
+        'config': dict(env_config),
+    }
+
+    return run_manifest
+
+
+def is_run_manifest_unchanged(run_manifest: dict, previous_manifest: 'dict | None') -> bool:
+    """
+    Checks if the input hashes, model hashes and configuration of the two
+    manifests are the same.
+    """
+    if previous_manifest is None:
+        return False
+
+    def get_input_hashes(manifest: dict) -> dict[str, str]:
+        return {file_name: input_file['sha256'] for file_name, input_file in manifest.get('inputs', {}).items()}
+
+    return (
+        get_input_hashes(run_manifest) == get_input_hashes(previous_manifest) and
+        run_manifest['models'] == previous_manifest.get('models') and
+        run_manifest['config'] == previous_manifest.get('config')
+    )
+
+
+def load_run_manifest(directory: str) -> 'dict | None':
+    """
+    Loads the run manifest in the given directory, returning None if there is
+    no valid manifest.
+    """
+    manifest_path = os.path.join(directory, RUN_MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path):
+        return None
+
+    with open(manifest_path, 'r') as manifest_file:
+        try:
+            return json.load(manifest_file)
+        except json.JSONDecodeError:
+            return None
+
+
+def save_run_manifest(directory: str, run_manifest: dict) -> None:
+    """
+    Saves the run manifest into the given directory.
+    """
+    manifest_path = os.path.join(directory, RUN_MANIFEST_FILE_NAME)
+    temporary_path = f'{manifest_path}.tmp'
+
+    with open(temporary_path, 'w') as manifest_file:
+        json.dump(run_manifest, manifest_file, indent=2)
+
+    os.replace(temporary_path, manifest_path)
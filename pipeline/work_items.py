@@ -0,0 +1,133 @@
+import os
+import os.path
+import re
+from dataclasses import dataclass
+from typing import Iterator, Union
+
+from util.constants import VALID_IMAGE_FILE_TYPES
+from util.file_path_util import get_file_name_without_ext, has_extension
+
+from .convert_pdf import (get_page_numbers, get_pdf_page_count,
+                          get_pdf_page_image_path)
+
+
+@dataclass(frozen=True)
+class ImagePageWorkItem:
+    """A page that is an image file in the input."""
+    image_path: str
+
+
+@dataclass(frozen=True)
+class PdfPageWorkItem:
+    """A page of a PDF file in the input, which must be rasterized."""
+    pdf_path: str
+    page_number: int
+
+    @property
+    def image_path(self) -> str:
+        return get_pdf_page_image_path(self.pdf_path, self.page_number)
+
+
+WorkItem = Union[ImagePageWorkItem, PdfPageWorkItem]
+
+
+def iter_work_items(
+    input_path: str,
+    ignored_folder_names: set[str] = frozenset(),
+    page_range: 'tuple[int, int] | None' = None,
+) -> Iterator[WorkItem]:
+    """
+    Lazily walks the input path and yields a work item for every page to
+    process. Valid input files are `.pdf`, `.png`, `.jpg`, `.jpeg`.
+
+    The pages of each directory are yielded together, sorted by file name,
+    before the subdirectories are walked. Folders named in
+    ignored_folder_names are skipped, and image files that are rendered pages
+    of a PDF in the same folder are skipped since the PDF yields them. Only
+    the PDF pages in page_range are yielded if it is given.
+    """
+    if os.path.isfile(input_path):
+        yield from _iter_file_work_items(input_path, page_range)
+        return
+
+    if not os.path.isdir(input_path) or os.path.basename(os.path.normpath(input_path)) in ignored_folder_names:
+        return
+
+    entries = sorted(os.scandir(input_path), key=lambda entry: entry.name)
+    file_entries = [entry for entry in entries if entry.is_file()]
+    directory_entries = [entry for entry in entries if entry.is_dir()]
+
+    pdf_names = {
+        get_file_name_without_ext(entry.name) for entry in file_entries
+        if has_extension(entry.name, valid_extensions={'.pdf'})
+    }
+
+    for entry in file_entries:
+        if is_rendered_pdf_page(entry.name, pdf_names):
+            continue
+
+        yield from _iter_file_work_items(entry.path, page_range)
+
+    for entry in directory_entries:
+        yield from iter_work_items(entry.path, ignored_folder_names, page_range)
+
+
+def estimate_work_item_count(
+    input_path: str,
+    ignored_folder_names: set[str] = frozenset(),
+    page_range: 'tuple[int, int] | None' = None,
+) -> int:
+    """
+    Counts the pages that iter_work_items will yield without rendering any
+    PDF pages. PDF page counts are read from the document structure only.
+    """
+    if os.path.isfile(input_path):
+        return sum(1 for _ in _iter_file_work_items(input_path, page_range))
+
+    work_item_count = 0
+
+    for root, directory_names, file_names in os.walk(input_path):
+        directory_names[:] = [name for name in directory_names if name not in ignored_folder_names]
+
+        pdf_names = {get_file_name_without_ext(name) for name in file_names if has_extension(name, {'.pdf'})}
+
+        for file_name in file_names:
+            if has_extension(file_name, {'.pdf'}):
+                page_count = get_pdf_page_count(os.path.join(root, file_name))
+                work_item_count += len(get_page_numbers(page_count, page_range))
+
+            elif has_extension(file_name, VALID_IMAGE_FILE_TYPES) and not is_rendered_pdf_page(file_name, pdf_names):
+                work_item_count += 1
+
+    return work_item_count
+
+
+def is_rendered_pdf_page(file_name: str, pdf_names: set[str]) -> bool:
+    """
+    Checks if the file is a page image rendered from one of the PDFs, given
+    the PDF file names without their extensions.
+    """
+    page_match = re.fullmatch(r'(.*)_page\d+', get_file_name_without_ext(file_name))
+    return page_match is not None and page_match.group(1) in pdf_names
+
+
+def get_source_pdf_path(image_path: str) -> 'str | None':
+    """
+    Gets the path of the PDF in the same folder that the image is a rendered
+    page of, or None if the image is not a rendered PDF page.
+    """
+    page_match = re.fullmatch(r'(.*)_page\d+', get_file_name_without_ext(image_path))
+    if page_match is None:
+        return None
+
+    pdf_path = os.path.join(os.path.dirname(image_path), f'{page_match.group(1)}.pdf')
+    return pdf_path if os.path.isfile(pdf_path) else None
+
+
+def _iter_file_work_items(file_path: str, page_range: 'tuple[int, int] | None' = None) -> Iterator[WorkItem]:
+    if has_extension(file_path, {'.pdf'}):
+        for page_number in get_page_numbers(get_pdf_page_count(file_path), page_range):
+            yield PdfPageWorkItem(file_path, page_number)
+
+    elif has_extension(file_path, VALID_IMAGE_FILE_TYPES):
+        yield ImagePageWorkItem(file_path)
@@ -0,0 +1,191 @@
+"""
+Batch geometry for regions that are axis-aligned boxes, computed with NumPy
+over arrays of boxes instead of one pair of shapely polygons at a time.
+
+Boxes are (N, 4) arrays of (min_x, min_y, max_x, max_y). The region
+functions compute the results of axis-aligned regions with the box kernels
+and fall back to the shapely functions of util.image_space for any other
+region. Box distances are exact, while shapely's can be off by a rounding
+error (e.g. 476.99999999999994 for 477), so distances match the shapely
+functions to within floating point precision.
+"""
+import numpy as np
+
+from util.image_space import (Region, as_region, distance_between_regions,
+                              does_region_intersect, get_region_area)
+
+
+def regions_to_boxes(regions: list[Region]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gets the bounding boxes of the regions and whether each region is an
+    axis-aligned box. Empty regions have a box of zeros.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The (N, 4) boxes and the (N,) axis-aligned mask
+    """
+    regions = [as_region(region) for region in regions]
+
+    boxes = np.zeros((len(regions), 4), dtype=np.float64)
+    is_axis_aligned = np.zeros(len(regions), dtype=bool)
+
+    for region_idx, region in enumerate(regions):
+        if len(region) == 0:
+            continue
+
+        boxes[region_idx] = region.extent
+        is_axis_aligned[region_idx] = region.is_axis_aligned
+
+    return boxes, is_axis_aligned
+
+
+def get_box_areas(boxes: np.ndarray) -> np.ndarray:
+    """
+    Gets the area of each box.
+    """
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def get_box_distance_matrix(boxes: np.ndarray, other_boxes: np.ndarray) -> np.ndarray:
+    """
+    Gets the (N, M) matrix of the shortest distance between each box and each
+    other box. Boxes that touch or overlap have a distance of 0.
+    """
+    gap_x = np.maximum(0, np.maximum(other_boxes[None, :, 0] - boxes[:, None, 2],
+                                     boxes[:, None, 0] - other_boxes[None, :, 2]))
+    gap_y = np.maximum(0, np.maximum(other_boxes[None, :, 1] - boxes[:, None, 3],
+                                     boxes[:, None, 1] - other_boxes[None, :, 3]))
+
+    return np.sqrt(gap_x * gap_x + gap_y * gap_y)
+
+
+def get_box_intersection_matrix(boxes: np.ndarray, other_boxes: np.ndarray) -> np.ndarray:
+    """
+    Gets the (N, M) matrix of whether each box intersects each other box.
+    Boxes that only touch at their edges intersect.
+    """
+    return (
+        (boxes[:, None, 0] <= other_boxes[None, :, 2]) & (other_boxes[None, :, 0] <= boxes[:, None, 2]) &
+        (boxes[:, None, 1] <= other_boxes[None, :, 3]) & (other_boxes[None, :, 1] <= boxes[:, None, 3])
+    )
+
+
+def get_union_bounds(boxes: np.ndarray) -> tuple[float, float, float, float]:
+    """
+    Gets the (min_x, min_y, max_x, max_y) bounds that contain all of the
+    boxes.
+    """
+    return (boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max())
+
+
+def get_region_areas(regions: list[Region]) -> np.ndarray:
+    """
+    Gets the area of each region, equal to get_region_area of each region.
+    """
+    boxes, is_axis_aligned = regions_to_boxes(regions)
+    areas = get_box_areas(boxes)
+
+    for region_idx in np.flatnonzero(~is_axis_aligned):
+        areas[region_idx] = get_region_area(regions[region_idx])
+
+    return areas
+
+
+def get_region_distance_matrix(regions: list[Region], other_regions: list[Region]) -> np.ndarray:
+    """
+    Gets the (N, M) matrix of distance_between_regions for each region and
+    each other region, to within floating point precision.
+    """
+    boxes, is_axis_aligned = regions_to_boxes(regions)
+    other_boxes, is_other_axis_aligned = regions_to_boxes(other_regions)
+
+    distances = get_box_distance_matrix(boxes, other_boxes)
+
+    for region_idx, other_region_idx in zip(*np.nonzero(~(is_axis_aligned[:, None] & is_other_axis_aligned[None, :]))):
+        distances[region_idx, other_region_idx] = distance_between_regions(regions[region_idx],
+                                                                           other_regions[other_region_idx])
+
+    return distances
+
+
+def get_region_intersection_matrix(regions: list[Region], other_regions: list[Region]) -> np.ndarray:
+    """
+    Gets the (N, M) matrix of does_region_intersect for each region and each
+    other region.
+    """
+    boxes, is_axis_aligned = regions_to_boxes(regions)
+    other_boxes, is_other_axis_aligned = regions_to_boxes(other_regions)
+
+    intersections = get_box_intersection_matrix(boxes, other_boxes)
+
+    # Regions whose boxes do not intersect cannot intersect, so only those pairs are checked with shapely
+    fallback_pairs = ~(is_axis_aligned[:, None] & is_other_axis_aligned[None, :]) & intersections
+
+    for region_idx, other_region_idx in zip(*np.nonzero(fallback_pairs)):
+        intersections[region_idx, other_region_idx] = does_region_intersect(regions[region_idx],
+                                                                            other_regions[other_region_idx])
+
+    return intersections
+
+
+if __name__ == '__main__':
+    """
+    Compares the box kernels with the shapely functions (and the Python loop
+    of get_component_group_bounds for union bounds) on random boxes, and
+    checks that both give the same results.
+
+    python -m util.box_kernels [box count]
+    """
+    import sys
+    import time
+
+    from util.image_space import Vertex
+
+    box_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    random_generator = np.random.default_rng(0)
+
+    def get_random_regions(count: int) -> list[Region]:
+        corners = random_generator.integers(0, 2000, size=(count, 2))
+        sizes = random_generator.integers(1, 300, size=(count, 2))
+        return [Region.from_bounds(x, y, x + width, y + height) for (x, y), (width, height) in zip(corners, sizes)]
+
+    regions = get_random_regions(box_count)
+    other_regions = get_random_regions(box_count)
+
+    # A rotated region to check the shapely fallback
+    regions[0] = Region([Vertex(100, 0), Vertex(200, 100), Vertex(100, 200), Vertex(0, 100)])
+
+    def benchmark(name: str, reference_function, kernel_function) -> None:
+        start_time = time.perf_counter()
+        reference_result = np.asarray(reference_function())
+        reference_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        kernel_result = kernel_function()
+        kernel_time = time.perf_counter() - start_time
+
+        if reference_result.dtype == bool:
+            is_equal = np.array_equal(reference_result, kernel_result)
+        else:
+            is_equal = np.allclose(reference_result, kernel_result, rtol=1e-12, atol=1e-9)
+
+        print(f'{name}: reference {reference_time:.4f}s, kernels {kernel_time:.4f}s '
+              f'({reference_time / kernel_time:.0f}x), {"OK" if is_equal else "MISMATCH"}')
+
+        if not is_equal:
+            sys.exit(1)
+
+    print(f'{box_count} x {box_count} regions')
+
+    benchmark('areas',
+              lambda: [get_region_area(region) for region in regions],
+              lambda: get_region_areas(regions))
+    benchmark('distances',
+              lambda: [[distance_between_regions(region, other) for other in other_regions] for region in regions],
+              lambda: get_region_distance_matrix(regions, other_regions))
+    benchmark('intersections',
+              lambda: [[does_region_intersect(region, other) for other in other_regions] for region in regions],
+              lambda: get_region_intersection_matrix(regions, other_regions))
+    benchmark('union bounds',
+              lambda: [min(region.min_x for region in regions), min(region.min_y for region in regions),
+                       max(region.max_x for region in regions), max(region.max_y for region in regions)],
+              lambda: np.asarray(get_union_bounds(regions_to_boxes(regions)[0])))
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import time
+
+from util.file_path_util import create_directories_to_file
+
+
+class ContentAddressedCache:
+    """
+    A directory of files stored by the hash of their content. An index file
+    in the cache directory records the size and last access time of each
+    entry, which is used to evict the least recently used entries once the
+    cache grows past max_size_bytes, along with any metadata describing how
+    the entry was created.
+
+    Hits and misses of get_path are counted for reporting. Hits only update
+    the access time in memory, and the index is written when entries are
+    added or when save_index is called, such as at the end of a run. The
+    activity of a cache in a pool process is returned with get_activity and
+    merged into the cache of the main process with merge_activity.
+    """
+    INDEX_FILE_NAME = 'index.json'
+
+    def __init__(self, directory: str, max_size_bytes: int = None, file_extension: str = ''):
+        """
+        Args:
+            directory (str): Directory to store the cached files and index in
+            max_size_bytes (int, optional): Maximum total size of the cached files. Defaults to no limit.
+            file_extension (str, optional): Extension given to the cached files. Defaults to ''.
+        """
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.file_extension = file_extension
+        self.hits = 0
+        self.misses = 0
+        self._index: dict[str, dict] = None
+        self._accessed: dict[str, float] = {}
+        self._is_index_modified = False
+
+    @staticmethod
+    def hash_content(*parts: bytes) -> str:
+        """
+        Creates a cache key from the given byte strings.
+        """
+        content_hash = hashlib.sha256()
+        for part in parts:
+            content_hash.update(hashlib.sha256(part).digest())
+
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def hash_file(file_path: str, *extra_parts: bytes) -> str:
+        """
+        Creates a cache key from the contents of a file and any extra byte
+        strings, such as the parameters used to create the file.
+        """
+        with open(file_path, 'rb') as hashed_file:
+            content = hashed_file.read()
+
+        return ContentAddressedCache.hash_content(content, *extra_parts)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE_NAME)
+
+    @property
+    def index(self) -> dict[str, dict]:
+        if self._index is None:
+            self._index = self._read_index()
+        return self._index
+
+    def get_entry_path(self, key: str) -> str:
+        """
+        Gets the path that the entry with the given key is stored at.
+        """
+        return os.path.join(self.directory, key[:2], key + self.file_extension)
+
+    def get_path(self, key: str) -> 'str | None':
+        """
+        Gets the path to the cached file with the given key, or None if the
+        key is not in the cache.
+        """
+        entry_path = self.get_entry_path(key)
+
+        if key not in self.index or not os.path.isfile(entry_path):
+            if self.index.pop(key, None) is not None:
+                self._is_index_modified = True
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._set_last_access(key, time.time())
+
+        return entry_path
+
+    def put_file(self, key: str, source_path: str, metadata: dict = None) -> str:
+        """
+        Copies the file at source_path into the cache under the given key,
+        recording the metadata in the index if given.
+
+        Returns:
+            str: The path of the cached file
+        """
+        entry_path = self.get_entry_path(key)
+        create_directories_to_file(entry_path)
+
+        temporary_path = f'{entry_path}.{os.getpid()}.tmp'
+        shutil.copyfile(source_path, temporary_path)
+        os.replace(temporary_path, entry_path)
+
+        self._add_entry(key, os.path.getsize(entry_path), metadata)
+        return entry_path
+
+    def put_bytes(self, key: str, content: bytes, metadata: dict = None) -> str:
+        """
+        Writes the content into the cache under the given key, recording the
+        metadata in the index if given.
+
+        Returns:
+            str: The path of the cached file
+        """
+        entry_path = self.get_entry_path(key)
+        create_directories_to_file(entry_path)
+
+        temporary_path = f'{entry_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as entry_file:
+            entry_file.write(content)
+        os.replace(temporary_path, entry_path)
+
+        self._add_entry(key, len(content), metadata)
+        return entry_path
+
+    def get_size(self) -> int:
+        """
+        Gets the total size of the cached files in bytes.
+        """
+        return sum(entry['size'] for entry in self.index.values())
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Gets the hit and miss counters along with the cache size.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.index),
+            'size_bytes': self.get_size(),
+        }
+
+    def save_index(self) -> None:
+        """
+        Writes the index if entries were accessed or removed since it was
+        last written.
+        """
+        if self._is_index_modified:
+            self._write_index()
+
+    def get_activity(self) -> dict:
+        """
+        Gets a picklable copy of the hit and miss counters and the access
+        time of each entry hit since the last reset_activity.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'accessed': dict(self._accessed)}
+
+    def reset_activity(self) -> None:
+        """
+        Resets the hit and miss counters and the recorded access times.
+        """
+        self.hits = 0
+        self.misses = 0
+        self._accessed.clear()
+
+    def merge_activity(self, activity: dict) -> None:
+        """
+        Adds the counters and access times of the activity of a cache in
+        another process to this cache.
+        """
+        self.hits += activity['hits']
+        self.misses += activity['misses']
+
+        for key, last_access in activity['accessed'].items():
+            self._set_last_access(key, last_access)
+
+    def _set_last_access(self, key: str, last_access: float) -> None:
+        self._accessed[key] = max(last_access, self._accessed.get(key, 0))
+
+        if key in self.index:
+            self.index[key]['last_access'] = max(last_access, self.index[key]['last_access'])
+            self._is_index_modified = True
+
+    def _add_entry(self, key: str, size: int, metadata: dict = None) -> None:
+        self.index[key] = {'size': size, 'last_access': time.time()}
+        if metadata is not None:
+            self.index[key]['metadata'] = metadata
+
+        self._evict()
+        self._write_index()
+
+    def _evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache is within
+        max_size_bytes.
+        """
+        if self.max_size_bytes is None:
+            return
+
+        total_size = self.get_size()
+        entries_by_access = sorted(self.index.items(), key=lambda entry: entry[1]['last_access'])
+
+        for key, entry in entries_by_access:
+            if total_size <= self.max_size_bytes:
+                break
+
+            entry_path = self.get_entry_path(key)
+            if os.path.isfile(entry_path):
+                os.remove(entry_path)
+
+            del self.index[key]
+            total_size -= entry['size']
+
+    def _read_index(self) -> dict[str, dict]:
+        if not os.path.isfile(self.index_path):
+            return {}
+
+        with open(self.index_path, 'r') as index_file:
+            try:
+                return json.load(index_file)
+            except json.JSONDecodeError:
+                return {}
+
+    def _write_index(self) -> None:
+        """
+        Writes the index, keeping entries added by other processes sharing the
+        cache directory and the latest access time of each entry.
+        """
+        disk_index = self._read_index()
+        for key, entry in disk_index.items():
+            if key not in self.index and os.path.isfile(self.get_entry_path(key)):
+                self.index[key] = entry
+            elif key in self.index:
+                self.index[key]['last_access'] = max(self.index[key]['last_access'], entry.get('last_access', 0))
+
+        # Entries another process added and this process accessed
+        for key, last_access in self._accessed.items():
+            if key in self.index:
+                self.index[key]['last_access'] = max(last_access, self.index[key]['last_access'])
+
+        create_directories_to_file(self.index_path)
+
+        temporary_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as index_file:
+            json.dump(self.index, index_file)
+        os.replace(temporary_path, self.index_path)
+
+        self._is_index_modified = False
@@ -1,13 +1,19 @@
 
 from __future__ import annotations
 
+from array import array
+from collections.abc import Sequence
 from dataclasses import dataclass
+from typing import Iterable, Iterator
+
 from shapely.geometry import Point
 from shapely.geometry.polygon import Polygon
 
 
 @dataclass
 class Vertex:
+    __slots__ = ('x', 'y')
+
     x: int
     y: int
 
@@ -16,7 +22,133 @@ class Vertex:
         return Vertex(x=vertex_dict.x, y=vertex_dict.y)
 
 
-Region = list[Vertex]
+class Region(Sequence):
+    """
+    An immutable polygon stored as a flat int32 array of its vertex
+    coordinates (x0, y0, x1, y1, ...). Vertices are created when they are
+    accessed, so a region takes a fraction of the memory of a list of
+    Vertex objects. The bounding box of the region is computed once and
+    cached.
+
+    A region is a sequence of Vertex objects, and compares equal to a list
+    of the same vertices.
+    """
+    __slots__ = ('_coordinates', '_extent')
+
+    def __init__(self, vertices: Iterable[Vertex] = ()):
+        self._coordinates = array('i', [coordinate for vertex in vertices for coordinate in (vertex.x, vertex.y)])
+        self._extent: 'tuple[int, int, int, int] | None' = None
+
+    @staticmethod
+    def from_coordinates(coordinates: Iterable[int]) -> Region:
+        """
+        Creates a region from a flat sequence of coordinates
+        (x0, y0, x1, y1, ...).
+        """
+        region = Region()
+        region._coordinates = array('i', coordinates)
+        return region
+
+    @staticmethod
+    def from_bounds(min_x: int, min_y: int, max_x: int, max_y: int) -> Region:
+        """
+        Creates an axis-aligned box region. The vertices start at the top left
+        corner and go down the left side.
+        """
+        return Region.from_coordinates((min_x, min_y, min_x, max_y, max_x, max_y, max_x, min_y))
+
+    @property
+    def coordinates(self) -> array:
+        return self._coordinates
+
+    @property
+    def extent(self) -> tuple[int, int, int, int]:
+        """
+        The (min_x, min_y, max_x, max_y) bounding box of the region.
+        """
+        if self._extent is None:
+            x_values = self._coordinates[0::2]
+            y_values = self._coordinates[1::2]
+            self._extent = (min(x_values), min(y_values), max(x_values), max(y_values))
+
+        return self._extent
+
+    @property
+    def min_x(self) -> int:
+        return self.extent[0]
+
+    @property
+    def min_y(self) -> int:
+        return self.extent[1]
+
+    @property
+    def max_x(self) -> int:
+        return self.extent[2]
+
+    @property
+    def max_y(self) -> int:
+        return self.extent[3]
+
+    @property
+    def is_axis_aligned(self) -> bool:
+        """
+        Whether the region is a box with horizontal and vertical sides.
+        """
+        if len(self) != 4:
+            return False
+
+        min_x, min_y, max_x, max_y = self.extent
+        return all(
+            (vertex.x == min_x or vertex.x == max_x) and (vertex.y == min_y or vertex.y == max_y)
+            for vertex in self
+        ) and len({(vertex.x, vertex.y) for vertex in self}) == 4
+
+    def __len__(self) -> int:
+        return len(self._coordinates) // 2
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[vertex_idx] for vertex_idx in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('region index out of range')
+
+        return Vertex(self._coordinates[2 * index], self._coordinates[2 * index + 1])
+
+    def __iter__(self) -> Iterator[Vertex]:
+        coordinates = self._coordinates
+        for coordinate_idx in range(0, len(coordinates), 2):
+            yield Vertex(coordinates[coordinate_idx], coordinates[coordinate_idx + 1])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Region):
+            return self._coordinates == other._coordinates
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self._coordinates.tobytes())
+
+    def __repr__(self) -> str:
+        # Matches the list of vertices that regions used to be
+        return repr(list(self))
+
+    def __reduce__(self):
+        return Region.from_coordinates, (self._coordinates.tolist(),)
+
+    def __deepcopy__(self, memo) -> Region:
+        # Regions are immutable
+        return self
+
+    def to_json(self) -> list[dict[str, int]]:
+        """
+        Converts the region into the JSON representation of a list of
+        vertices.
+        """
+        return [{'x': vertex.x, 'y': vertex.y} for vertex in self]
 
 
 def distance_between_regions(region: Region, other_region: Region) -> float:
@@ -64,8 +196,18 @@ def does_region_intersect(region: Region, other_region: Region) -> bool:
     return region_polygon.intersects(other_region_polygon)
 
 
+def as_region(vertices: 'Region | Iterable[Vertex]') -> Region:
+    """
+    Converts a list of vertices into a Region, returning regions as is.
+    """
+    if isinstance(vertices, Region):
+        return vertices
+    return Region(vertices)
+
+
 def _region_to_polygon(region: Region) -> Polygon:
-    region_points = [(point.x, point.y) for point in region]
+    coordinates = as_region(region).coordinates
+    region_points = list(zip(coordinates[0::2], coordinates[1::2]))
     polygon = Polygon(region_points)
     return polygon
 
@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterator, TypeVar
+
+from util.file_path_util import create_directories_to_file
+
+T = TypeVar('T')
+
+# Counter used as the number of pages for throughput
+PAGES_COUNTER = 'pages'
+
+
+class PipelineMetrics:
+    """
+    Collects the duration of each run of a pipeline stage and named counters
+    (e.g. pages, flyers, OCR requests) for a run, and summarizes them into a
+    report with p50/p95/max durations and page throughput.
+
+    Stages can be timed with the stage context manager or the timed
+    decorator. Recording is thread safe. Metrics recorded in other processes
+    are collected with call_with_metrics and merged back with merge.
+    """
+
+    def __init__(self):
+        self.stage_durations: defaultdict[str, list[float]] = defaultdict(list)
+        self.counters: defaultdict[str, int] = defaultdict(int)
+        self.start_time = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage_name: str) -> Iterator[None]:
+        """
+        Times the body of the with statement as a run of the given stage.
+        """
+        stage_start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_duration(stage_name, time.perf_counter() - stage_start_time)
+
+    def timed(self, stage_name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """
+        Decorator that times each call of the function as a run of the given
+        stage.
+        """
+        def decorator(function: Callable[..., T]) -> Callable[..., T]:
+            @wraps(function)
+            def timed_function(*args, **kwargs) -> T:
+                with self.stage(stage_name):
+                    return function(*args, **kwargs)
+
+            return timed_function
+
+        return decorator
+
+    def record_duration(self, stage_name: str, duration: float) -> None:
+        with self._lock:
+            self.stage_durations[stage_name].append(duration)
+
+    def increment(self, counter_name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[counter_name] += amount
+
+    def reset(self) -> None:
+        """
+        Removes all recorded durations and counters and restarts the run
+        timer.
+        """
+        with self._lock:
+            self.stage_durations.clear()
+            self.counters.clear()
+            self.start_time = time.perf_counter()
+
+    def get_snapshot(self) -> dict:
+        """
+        Gets a picklable copy of the recorded durations and counters, which
+        can be merged into the metrics of another process.
+        """
+        with self._lock:
+            return {
+                'stage_durations': {stage_name: list(durations) for stage_name, durations in self.stage_durations.items()},
+                'counters': dict(self.counters),
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        """
+        Adds the durations and counters of a snapshot to these metrics.
+        """
+        with self._lock:
+            for stage_name, durations in snapshot['stage_durations'].items():
+                self.stage_durations[stage_name].extend(durations)
+
+            for counter_name, count in snapshot['counters'].items():
+                self.counters[counter_name] += count
+
+    def get_report(self) -> dict:
+        """
+        Summarizes the metrics into a report of the run time, page throughput,
+        counters and the count, total, mean, p50, p95 and max duration of each
+        stage in seconds.
+        """
+        snapshot = self.get_snapshot()
+        wall_time = time.perf_counter() - self.start_time
+        page_count = snapshot['counters'].get(PAGES_COUNTER, 0)
+
+        stages = {
+            stage_name: _summarize_durations(durations)
+            for stage_name, durations in sorted(snapshot['stage_durations'].items())
+        }
+
+        report = {
+            'wall_time': wall_time,
+            'pages_per_second': page_count / wall_time if wall_time > 0 else 0.0,
+            'counters': dict(sorted(snapshot['counters'].items())),
+            'stages': stages,
+        }
+
+        return report
+
+    def save_report(self, file_path: str) -> None:
+        """
+        Saves the report as JSON to the given file path.
+        """
+        create_directories_to_file(file_path)
+
+        with open(file_path, 'w') as report_file:
+            json.dump(self.get_report(), report_file, indent=2)
+
+
+def _summarize_durations(durations: list[float]) -> dict[str, float]:
+    sorted_durations = sorted(durations)
+
+    return {
+        'count': len(sorted_durations),
+        'total': sum(sorted_durations),
+        'mean': sum(sorted_durations) / len(sorted_durations),
+        'p50': _get_percentile(sorted_durations, 50),
+        'p95': _get_percentile(sorted_durations, 95),
+        'max': sorted_durations[-1],
+    }
+
+
+def _get_percentile(sorted_values: list[float], percentile: float) -> float:
+    """
+    Gets the percentile of the sorted values, interpolating linearly between
+    the closest ranks.
+    """
+    rank = (len(sorted_values) - 1) * percentile / 100
+    lower_idx = int(rank)
+    upper_idx = min(lower_idx + 1, len(sorted_values) - 1)
+
+    return sorted_values[lower_idx] + (sorted_values[upper_idx] - sorted_values[lower_idx]) * (rank - lower_idx)
+
+
+# Metrics of the current process
+pipeline_metrics = PipelineMetrics()
+
+
+def call_with_metrics(function: Callable[..., T], *args, **kwargs) -> tuple[T, dict]:
+    """
+    Calls the function and returns its result along with a snapshot of the
+    metrics recorded during the call. Used in pool processes so their metrics
+    can be merged into the metrics of the main process.
+    """
+    pipeline_metrics.reset()
+    result = function(*args, **kwargs)
+
+    return result, pipeline_metrics.get_snapshot()
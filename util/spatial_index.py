@@ -0,0 +1,49 @@
+from rtree import index
+
+from util.image_space import Region, as_region, does_region_intersect
+
+
+class RegionIndex:
+    """
+    An R-tree over the bounding boxes of a list of regions, used to find the
+    regions that intersect a query region without testing every region.
+
+    Regions whose bounding boxes intersect the query are candidates. When
+    both regions are axis-aligned boxes the bounding box test is exact,
+    otherwise the candidate is checked with does_region_intersect.
+    """
+
+    def __init__(self, regions: list[Region]):
+        self.regions = [as_region(region) for region in regions]
+        self._is_axis_aligned = [region.is_axis_aligned for region in self.regions]
+
+        index_entries = [
+            (region_idx, region.extent, None)
+            for region_idx, region in enumerate(self.regions) if len(region) > 0
+        ]
+
+        # Bulk load the tree, which packs it better than inserting one at a time
+        self._index = index.Index(index_entries) if index_entries else index.Index()
+
+    def query(self, query_region: Region) -> list[int]:
+        """
+        Gets the indices of the regions that intersect the query region, in
+        the order of the regions.
+        """
+        query_region = as_region(query_region)
+        if len(query_region) == 0:
+            return []
+
+        candidate_indices = sorted(self._index.intersection(query_region.extent))
+
+        if query_region.is_axis_aligned:
+            return [
+                region_idx for region_idx in candidate_indices
+                if self._is_axis_aligned[region_idx]
+                or does_region_intersect(self.regions[region_idx], query_region)
+            ]
+
+        return [
+            region_idx for region_idx in candidate_indices
+            if does_region_intersect(self.regions[region_idx], query_region)
+        ]